@@ -1,5 +1,38 @@
-# The program works for text without space
-# Need to this resolve problem 
+# Text is normalized before it is split into pairs: characters outside of the
+# matrix (spaces, digits, punctuation) are dropped, "j" is merged into "i", a
+# filler "x" splits a doubled letter and pads an odd text ("q" if the letter
+# is "x" itself)
+
+import os
+import re
+import sys
+import math
+import mmap
+import random
+import argparse
+import tempfile
+import multiprocessing
+from array import array
+from contextlib import nullcontext
+from functools import lru_cache, partial
+from typing import Callable, Iterable, Iterator
+
+try:
+    import numpy as np
+except ImportError:  # Only the key search needs it, the cipher falls back to arrays and regexes
+    np = None
+
+# Characters read at once by the command line interface
+CHUNK_SIZE = 1 << 20
+
+# Inserted between the two letters of a doubled pair, and appended to an odd plain text
+FILLER = "x"
+
+# Used instead of FILLER when the doubled or the last letter is FILLER itself
+ALTERNATE_FILLER = "q"
+
+# Positions of two equal letters in a row, overlapping ones included
+_DOUBLED = re.compile(rb"(?=(.)\1)", re.DOTALL)
 
 
 alphabets = [
@@ -49,9 +82,11 @@ def create_matrix(key: str, lst: list) -> list[list]:
     # lower the key
     key = key.lower()
 
-    # Adding the key to the temp list
+    # Adding the key to the temp list, "j" shares the cell of "i" and other characters are skipped
     for i in key:
-        if i not in temp:
+        if i == "j" and i not in lst:
+            i = "i"
+        if i in lst and i not in temp:
             temp.append(i)
 
     # Adding the alphabets to the temp list to complete the matrix
@@ -75,26 +110,23 @@ def search_matrix(pair: str, matrix: list[list]) -> list[list[int]]:
 
     Returns:
         list[list[int]]: This contains the row and column number of the pair eg. [[3,5],[4,2]].
+
+    Raises:
+        ValueError: If a character is not in the matrix
     """
-    pair = pair.lower()
-    al1 = pair[0]
-    al2 = pair[1]
+    # The matrix has no "j", it shares the cell of "i"
+    pair = pair.lower().replace("j", "i")
+
+    positions = []
+    for char in pair[:2]:
+        for row, chars in enumerate(matrix):
+            if char in chars:
+                positions.append([row, chars.index(char)])
+                break
+        else:
+            raise ValueError(f"{char!r} is not in the matrix")
 
-    for i in matrix:
-        if al1 == "j":
-            row1 = -1
-            col1 = -1
-        elif al2 == "j":
-            row2 = -1
-            col2 = -1
-        if al1 in i:
-            row1 = matrix.index(i)
-            col1 = i.index(al1)
-        if al2 in i:
-            row2 = matrix.index(i)
-            col2 = i.index(al2)
-
-    return [[row1, col1], [row2, col2]]
+    return positions
 
 
 def encrypt_pair(pair: str, matrix: list[list]) -> str:
@@ -112,11 +144,7 @@ def encrypt_pair(pair: str, matrix: list[list]) -> str:
     char1_row, char1_col = al1[0], al1[1]
     char2_row, char2_col = al2[0], al2[1]
 
-    if al1[0] == [-1, -1]:
-        pass
-    elif al2[0] == [-1, -1]:
-        pass
-    elif al1[0] == al2[0]:
+    if al1[0] == al2[0]:
         enc_char1 = matrix[char1_row][(char1_col + 1) % 5]
         enc_char2 = matrix[char2_row][(char2_col + 1) % 5]
     elif al1[1] == al2[1]:
@@ -129,27 +157,21 @@ def encrypt_pair(pair: str, matrix: list[list]) -> str:
     return enc_char1 + enc_char2
 
 
-def create_pairs(text: str) -> list[str]:
+def create_pairs(text: str, decrypt: bool = False) -> list[str]:
     """
-    Splits the input text into pairs of characters. If the text has an odd number of characters,
-    the last character is paired with 'j'.
+    Splits the input text into pairs of characters, after normalizing it with prepare_text:
+    characters outside of the matrix are dropped, "j" becomes "i", a doubled letter is split
+    by FILLER and an odd text is padded with it.
     Args:
         text (str): The input text to be split into pairs.
+        decrypt (bool): The text is a cipher text, it is neither split nor padded.
     Returns:
         list[str]: A list of character pairs from the input text.
+    Raises:
+        ValueError: If a cipher text has an odd number of letters.
     """
-
-    pair_list = []
-    i = 0
-    while i < len(text):
-        if i + 1 < len(text):
-            pair_list.append(text[i] + text[i + 1])
-            i += 2
-        else:
-            pair_list.append(text[i] + "j")
-            i += 1
-
-    return pair_list
+    text = prepare_text(text, decrypt=decrypt)
+    return [text[i : i + 2] for i in range(0, len(text), 2)]
 
 
 def decrypt_pair(pair: str, matrix: list[list]) -> str:
@@ -167,11 +189,7 @@ def decrypt_pair(pair: str, matrix: list[list]) -> str:
     char1_row, char1_col = al1[0], al1[1]
     char2_row, char2_col = al2[0], al2[1]
 
-    if al1[0] == [-1, -1]:
-        pass
-    elif al2[0] == [-1, -1]:
-        pass
-    elif al1[0] == al2[0]:
+    if al1[0] == al2[0]:
         dec_char1 = matrix[char1_row][(char1_col - 1) % 5]
         dec_char2 = matrix[char2_row][(char2_col - 1) % 5]
     elif al1[1] == al2[1]:
@@ -222,33 +240,637 @@ def get_plaintext(cipher_text: str, matrix: list[list[int]]) -> str:
         str: The decrypted string
     """
     # Create pairs from the cipher text
-    pair_list = create_pairs(cipher_text)
+    pair_list = create_pairs(cipher_text, decrypt=True)
 
     decrypted_pair_list = [decrypt_pair(i, matrix) for i in pair_list]
     return "".join(decrypted_pair_list)
 
 
+@lru_cache(maxsize=None)
+def _letter_tables(alphabet: str) -> tuple[bytes, bytes, bytes]:
+    """Tables of `bytes.translate` between ASCII text and indexes of an alphabet
+
+    Returns:
+        tuple[bytes, bytes, bytes]: The table mapping both cases of every letter to its index
+            ("j" to the one of "i" if the alphabet has no "j"), the bytes it deletes, and the
+            table mapping the indexes back to letters.
+    """
+    to_indexes = bytearray(range(256))
+    kept = set()
+    merged = {"i": "ij"} if "j" not in alphabet else {}
+    for index, letter in enumerate(alphabet):
+        for char in merged.get(letter, letter):
+            for code in {ord(char.lower()), ord(char.upper())}:
+                to_indexes[code] = index
+                kept.add(code)
+
+    deleted = bytes(code for code in range(256) if code not in kept)
+    to_letters = bytes.maketrans(bytes(range(len(alphabet))), alphabet.encode("ascii"))
+    return bytes(to_indexes), deleted, to_letters
+
+
+def letter_indexes(text: str, lst: list = alphabets) -> bytes:
+    """Keeps the letters of the alphabet of a text, as their indexes (0-24)
+
+    Both cases are kept and "j" is merged into "i", everything else is
+    dropped by the same `bytes.translate` call that maps the letters.
+    """
+    to_indexes, deleted, _ = _letter_tables("".join(lst))
+    return text.encode("ascii", "ignore").translate(to_indexes, deleted)
+
+
+def digraphs(letters: bytes, lst: list = alphabets, fill: bool = True, pad: bool = True) -> tuple[bytearray, bytes]:
+    """Splits letter indexes into the pairs of the Playfair cipher, into a buffer allocated once
+
+    Doubled letters are found in one pass over the letters (by NumPy, or
+    a regex without it), and only the ones that would fall into the same pair are split by FILLER.
+    The runs between them are copied into the buffer as slices of a
+    memoryview, so no letter is handled by Python on its own.
+
+    Args:
+        letters (bytes): Indexes made by `letter_indexes`
+        lst (list[char]): The alphabet of the matrix
+        fill (bool): Split doubled letters, False for cipher text
+        pad (bool): Pad an odd number of letters with FILLER instead of returning the last one
+
+    Returns:
+        tuple[bytearray, bytes]: The pairs as consecutive indexes, and the unpaired last letter
+            (empty if there is none)
+    """
+    alphabet = "".join(lst)
+    filler, alternate = alphabet.index(FILLER), alphabet.index(ALTERNATE_FILLER)
+    if not fill:
+        doubled = []
+    elif np is not None:
+        indexes = np.frombuffer(letters, dtype=np.uint8)
+        doubled = np.flatnonzero(indexes[:-1] == indexes[1:]).tolist()
+    else:
+        doubled = [match.start() for match in _DOUBLED.finditer(letters)]
+
+    # Every split adds one letter, and padding one more
+    pairs = bytearray(len(letters) + len(doubled) + 1)
+    source, target = memoryview(letters), memoryview(pairs)
+    start = size = 0
+
+    for position in doubled:
+        if position < start or (position - start) % 2:
+            continue  # The two letters fall into different pairs
+        length = position + 1 - start
+        target[size : size + length] = source[start : position + 1]
+        size += length
+        pairs[size] = alternate if letters[position] == filler else filler
+        size += 1
+        start = position + 1
+
+    length = len(letters) - start
+    target[size : size + length] = source[start:]
+    size += length
+    target.release()
+
+    rest = b""
+    if size % 2:
+        size -= 1
+        if pad:
+            pairs[size + 1] = alternate if pairs[size] == filler else filler
+            size += 2
+        else:
+            rest = bytes(pairs[size : size + 1])
+
+    del pairs[size:]
+    return pairs, rest
+
+
+def normalize(text: str, lst: list = alphabets, decrypt: bool = False) -> bytearray:
+    """Turns any text into the pairs of letter indexes the Playfair cipher works on
+
+    Args:
+        text (str): The plain or cipher text, characters outside of the alphabet are dropped
+        lst (list[char]): The alphabet of the matrix
+        decrypt (bool): The text is a cipher text, doubled letters are neither split nor padded
+
+    Returns:
+        bytearray: The pairs as consecutive indexes, its length is even
+
+    Raises:
+        ValueError: If a cipher text has an odd number of letters
+    """
+    pairs, rest = digraphs(letter_indexes(text, lst), lst, fill=not decrypt, pad=not decrypt)
+    if rest:
+        raise ValueError("The cipher text has an odd number of letters")
+    return pairs
+
+
+def prepare_text(text: str, lst: list = alphabets, decrypt: bool = False) -> str:
+    """Normalizes a text with `normalize`, back into lower case letters
+
+    Args:
+        text (str): The plain or cipher text
+        lst (list[char]): The alphabet of the matrix
+        decrypt (bool): The text is a cipher text, doubled letters are neither split nor padded
+
+    Returns:
+        str: Text of an even length that `PlayfairCipher.encrypt` or `decrypt` leave unchanged
+            before transforming it
+
+    Raises:
+        ValueError: If a cipher text has an odd number of letters
+    """
+    return normalize(text, lst, decrypt).translate(_letter_tables("".join(lst))[2]).decode("ascii")
+
+
+class PlayfairCipher:
+    """A Playfair cipher for one key, with every digraph transform precomputed
+
+    The 5x5 matrix is searched once per key to build a letter -> (row, col)
+    map, and the map is used to build the encryption and decryption of all
+    25 x 25 = 625 digraphs. The tables are indexed by the two letter indexes
+    of a pair read as one 16-bit number, so the pairs made by `normalize`
+    are transformed by viewing its buffer as 16-bit numbers, with one
+    NumPy gather (or one array lookup per pair without NumPy).
+
+    Args:
+        key (str): A secret key of user, characters outside of the alphabet are ignored
+        lst (list[char]): list of alphabets to complete the matrix
+    """
+
+    def __init__(self, key: str, lst: list = alphabets):
+        self.alphabet = "".join(lst)
+        self.matrix = create_matrix(key, lst)
+
+        # Letter -> (row, column), built once instead of searched for every pair
+        self.positions = {
+            char: (row, col)
+            for row, chars in enumerate(self.matrix)
+            for col, char in enumerate(chars)
+        }
+
+        # Pair of indexes -> transformed pair of indexes, for all 625 pairs of letters
+        digraph_list = [(al1, al2) for al1 in self.alphabet for al2 in self.alphabet]
+        plain = bytes(self.alphabet.index(char) for pair in digraph_list for char in pair)
+        self.encrypt_table = self._table(plain, [self._transform(al1, al2, 1) for al1, al2 in digraph_list])
+        self.decrypt_table = self._table(plain, [self._transform(al1, al2, -1) for al1, al2 in digraph_list])
+
+    def _table(self, plain: bytes, transformed: list) -> array:
+        table = array("H", bytes(2 << 16))
+        result = bytes(self.alphabet.index(char) for pair in transformed for char in pair)
+        for source, target in zip(memoryview(plain).cast("H"), memoryview(result).cast("H")):
+            table[source] = target
+        return table
+
+    def _transform(self, al1: str, al2: str, shift: int) -> str:
+        """Applies the Playfair rules to a pair, shift is 1 to encrypt and -1 to decrypt"""
+        row1, col1 = self.positions[al1]
+        row2, col2 = self.positions[al2]
+
+        if row1 == row2:
+            return self.matrix[row1][(col1 + shift) % 5] + self.matrix[row2][(col2 + shift) % 5]
+        if col1 == col2:
+            return self.matrix[(row1 + shift) % 5][col1] + self.matrix[(row2 + shift) % 5][col2]
+        # Same corner order as encrypt_pair, so both produce the same cipher text
+        return self.matrix[row2][col1] + self.matrix[row1][col2]
+
+    def _apply(self, pairs: bytearray, table: array) -> str:
+        if np is not None:
+            result = np.take(np.frombuffer(table, dtype=np.uint16), np.frombuffer(pairs, dtype=np.uint16))
+        else:
+            result = array("H", map(table.__getitem__, memoryview(pairs).cast("H")))
+        return result.tobytes().translate(_letter_tables(self.alphabet)[2]).decode("ascii")
+
+    def encrypt(self, text: str) -> str:
+        """Encrypts a plain text
+
+        Args:
+            text (str): The plain text, normalized with `normalize` first
+
+        Returns:
+            str: The encrypted string
+        """
+        return self._apply(normalize(text, self.alphabet), self.encrypt_table)
+
+    def decrypt(self, cipher_text: str) -> str:
+        """Decrypts a cipher text produced by `encrypt`
+
+        Args:
+            cipher_text (str): The string to be decrypted, characters outside of the matrix are ignored
+
+        Returns:
+            str: The decrypted string, with the fillers that `encrypt` added
+
+        Raises:
+            ValueError: If the cipher text has an odd number of letters
+        """
+        return self._apply(normalize(cipher_text, self.alphabet, decrypt=True), self.decrypt_table)
+
+    def _stream(self, chunks: Iterable[str], table: array, decrypt: bool) -> Iterator[str]:
+        rest = b""
+        for chunk in chunks:
+            # A pair split between two chunks is completed by the next one
+            pairs, rest = digraphs(rest + letter_indexes(chunk, self.alphabet), self.alphabet, not decrypt, pad=False)
+            if pairs:
+                yield self._apply(pairs, table)
+
+        if rest:
+            if decrypt:
+                raise ValueError("The cipher text has an odd number of letters")
+            yield self._apply(digraphs(rest, self.alphabet)[0], table)
+
+    def encrypt_stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Encrypts a plain text given in pieces of any size, in constant memory
+
+        The text is normalized like `normalize` does it, across the chunks.
+
+        Args:
+            chunks (Iterable[str]): The plain text, eg. a file read in chunks
+
+        Yields:
+            str: The encrypted text, one piece per chunk
+        """
+        return self._stream(chunks, self.encrypt_table, False)
+
+    def decrypt_stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Decrypts a cipher text given in pieces of any size, in constant memory
+
+        Args:
+            chunks (Iterable[str]): The cipher text, characters outside of the matrix are ignored
+
+        Yields:
+            str: The decrypted text, one piece per chunk
+
+        Raises:
+            ValueError: If the cipher text has an odd number of letters
+        """
+        return self._stream(chunks, self.decrypt_table, True)
+
+
+def read_chunks(file, size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Reads a file in pieces of `size` characters until its end"""
+    return iter(partial(file.read, size), "")
+
+
+# The shared text of a worker process of transform_many, mapped once per process
+_shared_text = b""
+
+
+def _attach_text(path: str) -> None:
+    global _shared_text
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size:  # An empty file cannot be mapped
+            _shared_text = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
 
-key = "kashish"
+def _shared_slices(size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Decodes the shared text one [start, stop) slice at a time, never all of it at once"""
+    for start in range(0, len(_shared_text), size):
+        yield _shared_text[start : start + size].decode("ascii")
 
-matrix = create_matrix(key, alphabets)
-pair = "ab"
-enc_pair = encrypt_pair(pair, matrix)
-print_matrix(matrix)
 
+def _transform_key(task: tuple) -> tuple:
+    key, decrypt, score = task
+    cipher = PlayfairCipher(key)
+    stream = cipher.decrypt_stream if decrypt else cipher.encrypt_stream
+    result = "".join(stream(_shared_slices()))
+    return key, score(key, result) if score else result
 
-text = "arpit"
 
-cipher = get_cipher(text,matrix)
+def transform_many(
+    keys: Iterable[str],
+    text: str,
+    decrypt: bool = False,
+    processes: int = None,
+    ordered: bool = True,
+    score: Callable[[str, str], object] = None,
+) -> Iterator[tuple[str, object]]:
+    """Encrypts or decrypts one text with many keys, spread over a pool of processes
 
-plaintext = get_plaintext(cipher,matrix)
+    The prepared text is written once to a temporary file that every
+    worker maps into memory, so only the keys travel to the workers
+    instead of a pickled copy of the text per task. The pages of the
+    mapping are shared by the workers, and each of them decodes the text
+    one slice at a time as it transforms it. Every key is independent,
+    the work scales with the number of cores.
 
-print(f"{text} -> {cipher}")
-print(f"{cipher} -> {plaintext}")
+    Args:
+        keys (Iterable[str]): The keys to try
+        text (str): The plain or cipher text, prepared with `prepare_text`
+        decrypt (bool): Decrypt instead of encrypt
+        processes (int): Number of worker processes (default: one per core)
+        ordered (bool): Yield the results in the order of `keys`, instead of as they complete
+        score (Callable[[str, str], object]): Module level function called in the workers with the
+            key and its result, its return value is yielded instead of the text (eg. a fitness score)
+
+    Yields:
+        tuple[str, object]: The key and its transformed text, or its score
+
+    Raises:
+        ValueError: If the text is odd or holds characters outside of the matrix
+    """
+    if len(text) % 2 or not text.isascii():
+        raise ValueError("The text must be prepared with prepare_text")
+
+    descriptor, path = tempfile.mkstemp(prefix="playfair-", suffix=".txt")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(text.encode("ascii"))
+
+        with multiprocessing.Pool(processes, initializer=_attach_text, initargs=(path,)) as pool:
+            tasks = ((key, decrypt, score) for key in keys)
+            yield from (pool.imap if ordered else pool.imap_unordered)(_transform_key, tasks)
+    finally:
+        os.remove(path)
+
+
+def ngram_fitness(corpus: str, n: int = 4, lst: list = alphabets):
+    """Builds the log10 probability of every n-gram of the alphabet from a reference text
+
+    Args:
+        corpus (str): A long text in the language of the plain text, eg. a few books
+        n (int): Length of the n-grams, 2 to 4
+        lst (list[char]): The alphabet of the matrix
+
+    Returns:
+        np.ndarray: float32 table of 25 ** n entries, indexed by the n-gram read as a base 25
+            number, unseen n-grams get a probability below the rarest seen one
+
+    Raises:
+        ImportError: If NumPy is not installed
+        ValueError: If the corpus has fewer letters than n
+    """
+    if np is None:
+        raise ImportError("The n-gram fitness table needs NumPy")
+
+    letters = np.frombuffer(letter_indexes(corpus, lst), dtype=np.uint8).astype(np.int64)
+    if len(letters) < n:
+        raise ValueError("The corpus is too short")
 
-# print(get_cipher("hello", matrix))
-# print("ab : ",search_matrix("ab", matrix))
-# print("ab : ", enc_pair)
-# print(f"{enc_pair} : ", decrypt_pair(enc_pair, matrix))
-# print("mr : ",encrypt_pair("mr", matrix))
-# print("mv : ",encrypt_pair("mv", matrix))
+    indexes = np.zeros(len(letters) - n + 1, dtype=np.int64)
+    for offset in range(n):
+        indexes = indexes * len(lst) + letters[offset : len(letters) - n + 1 + offset]
+
+    counts = np.bincount(indexes, minlength=len(lst) ** n).astype(np.float64)
+    total = counts.sum()
+    return np.log10(np.where(counts > 0, counts, 0.01) / total).astype(np.float32)
+
+
+def _decryption_cells():
+    """Cells of the plain letters for every pair of cells of cipher letters, the same for every key
+
+    Returns:
+        np.ndarray: uint8 array of (625, 2) cells, indexed by cell1 * 25 + cell2.
+    """
+    cells = np.empty((625, 2), dtype=np.uint8)
+    for cell1 in range(25):
+        for cell2 in range(25):
+            row1, col1 = divmod(cell1, 5)
+            row2, col2 = divmod(cell2, 5)
+            if row1 == row2:
+                plain = row1 * 5 + (col1 - 1) % 5, row2 * 5 + (col2 - 1) % 5
+            elif col1 == col2:
+                plain = (row1 - 1) % 5 * 5 + col1, (row2 - 1) % 5 * 5 + col2
+            else:
+                plain = row2 * 5 + col1, row1 * 5 + col2
+            cells[cell1 * 25 + cell2] = plain
+    return cells
+
+
+class KeySearch:
+    """Simulated annealing over Playfair keys for a cipher text, scored with an n-gram fitness table
+
+    A key is a flat array of 25 letter indexes (the matrix row by row) with
+    the inverse array of positions next to it. Mutations swap two cells,
+    two rows or two columns of both arrays in place, and are undone by
+    applying them again. Where the plain letters of a pair sit depends only
+    on where its cipher letters sit, not on the key, so decrypting a
+    candidate is a few NumPy gathers into buffers that are allocated once.
+    Every array is intp, so building the n-gram indexes never casts, and
+    the indexes are built from bigrams, two letters per pass.
+
+    Args:
+        cipher_text (str): The cipher text, characters outside of the alphabet are ignored
+        fitness (np.ndarray): A table built by `ngram_fitness`
+        lst (list[char]): The alphabet of the matrix
+
+    Raises:
+        ValueError: If the cipher text has fewer letters than the n-grams of the table
+    """
+
+    def __init__(self, cipher_text: str, fitness, lst: list = alphabets):
+        if np is None:
+            raise ImportError("The key search needs NumPy")
+
+        self.alphabet = "".join(lst)
+        self.fitness = fitness
+        self.n = round(math.log(len(fitness), len(lst)))
+
+        text = np.frombuffer(normalize(cipher_text, lst, decrypt=True), dtype=np.uint8)
+        if len(text) < self.n:
+            raise ValueError(f"The cipher text needs at least {self.n} letters to be scored with {self.n}-grams")
+
+        self.cipher = text.astype(np.intp).reshape(-1, 2)
+        self.plain_cells = _decryption_cells().astype(np.intp)
+
+        self.key = np.arange(25, dtype=np.intp)  # cell -> letter
+        self.positions = np.arange(25, dtype=np.intp)  # letter -> cell
+
+        pairs = len(self.cipher)
+        self._pair_cells = np.empty(pairs, dtype=np.intp)
+        self._cells = np.empty((pairs, 2), dtype=np.intp)
+        self._plain = np.empty((pairs, 2), dtype=np.intp)
+        self._bigrams = np.empty(2 * pairs - 1, dtype=np.intp)
+        self._grams = np.empty(2 * pairs - self.n + 1, dtype=np.intp)
+        self._scores = np.empty(len(self._grams), dtype=np.float32)
+
+    def set_key(self, key: str) -> None:
+        """Starts from the matrix of a key"""
+        matrix = create_matrix(key, list(self.alphabet))
+        self.key[:] = [self.alphabet.index(char) for row in matrix for char in row]
+        self.positions[self.key] = np.arange(25)
+
+    def key_text(self) -> str:
+        """The current key, as 25 letters that PlayfairCipher accepts"""
+        return "".join(self.alphabet[i] for i in self.key.tolist())
+
+    def decrypt(self):
+        """Decrypts the cipher text with the current key into the plain text buffer
+
+        Returns:
+            np.ndarray: The plain text as (pairs, 2) letter indexes, overwritten by the next call
+        """
+        np.take(self.positions, self.cipher, out=self._cells)
+        np.multiply(self._cells[:, 0], 25, out=self._pair_cells, dtype=np.intp)
+        np.add(self._pair_cells, self._cells[:, 1], out=self._pair_cells)
+
+        np.take(self.plain_cells, self._pair_cells, axis=0, out=self._cells)
+        np.take(self.key, self._cells, out=self._plain)
+        return self._plain
+
+    def score(self) -> float:
+        """Mean log10 probability of the n-grams of the plain text under the current key"""
+        plain = self.decrypt().reshape(-1)
+        count = len(self._grams)
+
+        bigrams = self._bigrams
+        np.multiply(plain[:-1], 25, out=bigrams)
+        np.add(bigrams, plain[1:], out=bigrams)
+
+        # An odd n starts from a single letter, then every pass appends a bigram
+        self._grams[:] = plain[:count] if self.n % 2 else bigrams[:count]
+        for offset in range(self.n % 2 or 2, self.n, 2):
+            np.multiply(self._grams, 625, out=self._grams)
+            np.add(self._grams, bigrams[offset : offset + count], out=self._grams)
+
+        np.take(self.fitness, self._grams, out=self._scores)
+        return float(self._scores.sum(dtype=np.float64)) / count
+
+    def swap_cells(self, cell1: int, cell2: int) -> None:
+        """Swaps two letters of the matrix, applying it twice restores the key"""
+        key, positions = self.key, self.positions
+        letter1, letter2 = key[cell1], key[cell2]
+        key[cell1], key[cell2] = letter2, letter1
+        positions[letter1], positions[letter2] = cell2, cell1
+
+    def swap_rows(self, row1: int, row2: int) -> None:
+        """Swaps two rows of the matrix, applying it twice restores the key"""
+        for col in range(5):
+            self.swap_cells(row1 * 5 + col, row2 * 5 + col)
+
+    def swap_columns(self, col1: int, col2: int) -> None:
+        """Swaps two columns of the matrix, applying it twice restores the key"""
+        for row in range(5):
+            self.swap_cells(row * 5 + col1, row * 5 + col2)
+
+    def anneal(self, iterations: int = 500000, temperature: float = 0.1, seed: int = None) -> tuple[str, float]:
+        """Searches for the key with simulated annealing, starting from the current key
+
+        A random mutation is kept if it improves the score, or with a
+        probability that shrinks with the loss and with the temperature,
+        which falls linearly to zero over the iterations.
+
+        Args:
+            iterations (int): Number of candidate keys to score
+            temperature (float): Starting temperature, in mean log10 probability
+            seed (int): Seed of the random mutations, for reproducible searches
+
+        Returns:
+            tuple[str, float]: The best key found and its score
+        """
+        rng = random.Random(seed)
+        current = self.score()
+        best, best_key = current, self.key.copy()
+
+        for iteration in range(iterations):
+            heat = temperature * (1 - iteration / iterations)
+            choice = rng.random()
+            first, second = rng.sample(range(25) if choice < 0.9 else range(5), 2)
+            mutate = self.swap_cells if choice < 0.9 else self.swap_rows if choice < 0.95 else self.swap_columns
+
+            mutate(first, second)
+            candidate = self.score()
+            if candidate >= current or (heat > 0 and rng.random() < math.exp((candidate - current) / heat)):
+                current = candidate
+                if current > best:
+                    best, best_key = current, self.key.copy()
+            else:
+                mutate(first, second)
+
+        self.key[:] = best_key
+        self.positions[best_key] = np.arange(25)
+        return self.key_text(), best
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Encrypt or decrypt files with the Playfair cipher, in constant memory.")
+    parser.add_argument("mode", choices=("encrypt", "decrypt", "crack"))
+    parser.add_argument("-k", "--key", help="The secret key, not needed to crack")
+    parser.add_argument("-i", "--input", help="File to read (default: stdin)")
+    parser.add_argument("-o", "--output", help="File to write (default: stdout)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Characters read at once")
+    parser.add_argument("--corpus", help="Reference text in the language of the plain text, to crack")
+    parser.add_argument("-n", "--ngram", type=int, default=4, choices=(2, 3, 4), help="N-gram length of the fitness (default: 4)")
+    parser.add_argument("--iterations", type=int, default=500000, help="Candidate keys per restart (default: 500000)")
+    parser.add_argument("--restarts", type=int, default=5, help="Searches from random keys (default: 5)")
+    parser.add_argument("--seed", type=int, help="Seed of the search, for reproducible results")
+    args = parser.parse_args(argv)
+
+    if args.mode == "crack":
+        if not args.corpus:
+            parser.error("crack needs --corpus")
+        crack(args)
+        return
+    if not args.key:
+        parser.error(f"{args.mode} needs --key")
+
+    cipher = PlayfairCipher(args.key)
+    stream = cipher.encrypt_stream if args.mode == "encrypt" else cipher.decrypt_stream
+
+    source = open(args.input, "r") if args.input else sys.stdin
+    target = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for piece in stream(read_chunks(source, args.chunk_size)):
+            target.write(piece)
+        target.write("\n")
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        if args.input:
+            source.close()
+        if args.output:
+            target.close()
+
+
+def crack(args: argparse.Namespace) -> None:
+    """Searches for the key of a cipher text and writes the key and the plain text"""
+    # The standard streams are not closed, only the files opened here
+    with open(args.input, "r") if args.input else nullcontext(sys.stdin) as source:
+        cipher_text = source.read()
+
+    try:
+        with open(args.corpus, "r") as file:
+            fitness = ngram_fitness(file.read(), args.ngram)
+        search = KeySearch(cipher_text, fitness)
+    except (ImportError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+
+    rng = random.Random(args.seed)
+    best_key, best = None, -math.inf
+    for restart in range(args.restarts):
+        search.set_key("".join(rng.sample(search.alphabet, 25)))
+        key, score = search.anneal(args.iterations, seed=rng.random())
+        print(f"Restart {restart + 1}: {key} ({score:.3f})", file=sys.stderr)
+        if score > best:
+            best_key, best = key, score
+
+    with open(args.output, "w") if args.output else nullcontext(sys.stdout) as target:
+        target.write(f"{best_key}\n{PlayfairCipher(best_key).decrypt(cipher_text)}\n")
+
+
+def demo() -> None:
+    key = "kashish"
+
+    matrix = create_matrix(key, alphabets)
+    pair = "ab"
+    enc_pair = encrypt_pair(pair, matrix)
+    print_matrix(matrix)
+
+
+    text = "arpit"
+
+    cipher = get_cipher(text,matrix)
+
+    plaintext = get_plaintext(cipher,matrix)
+
+    print(f"{text} -> {cipher}")
+    print(f"{cipher} -> {plaintext}")
+
+    # print(get_cipher("hello", matrix))
+    # print("ab : ",search_matrix("ab", matrix))
+    # print("ab : ", enc_pair)
+    # print(f"{enc_pair} : ", decrypt_pair(enc_pair, matrix))
+    # print("mr : ",encrypt_pair("mr", matrix))
+    # print("mv : ",encrypt_pair("mv", matrix))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main()
+    else:
+        demo()
@@ -0,0 +1,267 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import playfair
+from playfair import (
+    KeySearch,
+    PlayfairCipher,
+    create_matrix,
+    create_pairs,
+    digraphs,
+    get_cipher,
+    get_plaintext,
+    letter_indexes,
+    main,
+    ngram_fitness,
+    normalize,
+    prepare_text,
+    read_chunks,
+    transform_many,
+)
+
+KEYS = ["monarchy", "playfair example", "kashish", "Jazz Quickly", ""]
+TEXTS = ["hide the gold in the tree stump", "balloon", "Meet me at 5pm!", "jumping jacks", "xx", "a"]
+
+CORPUS = (
+    "It was the best of times, it was the worst of times, it was the age of wisdom, it was the age of "
+    "foolishness, it was the epoch of belief, it was the epoch of incredulity, it was the season of light, "
+    "it was the season of darkness, it was the spring of hope, it was the winter of despair. "
+) * 20
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_prepared_texts(self):
+        cases = {
+            "hello world": "helxloworldx",
+            "Meet me at 5pm!": "meetmeatpm",
+            "JAZZ Über-cool": "iazxzbercool",
+            "abbcdd": "abbcdxdx",  # The doubled b falls into two pairs and is kept
+            "xxx": "xqxqxq",
+            "aaa": "axaxax",
+            "": "",
+        }
+        for text, prepared in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(prepare_text(text), prepared)
+
+    def test_cipher_text_is_neither_split_nor_padded(self):
+        self.assertEqual(prepare_text("Aa Bb!", decrypt=True), "aabb")
+        with self.assertRaises(ValueError):
+            normalize("abc", decrypt=True)
+
+    def test_pairs(self):
+        self.assertEqual(create_pairs("hello"), ["he", "lx", "lo"])
+        self.assertEqual(create_pairs("hejj", decrypt=True), ["he", "ii"])
+
+    def test_unpaired_letter_is_returned_without_padding(self):
+        pairs, rest = digraphs(letter_indexes("abb"), pad=False)
+        self.assertEqual((bytes(pairs), rest), (bytes([0, 1]), bytes([1])))
+
+    def test_same_pairs_without_numpy(self):
+        for text in TEXTS + ["abbcdd", "xxxx yyy"]:
+            letters = letter_indexes(text)
+            with mock.patch.object(playfair, "np", None):
+                expected = digraphs(letters)
+            self.assertEqual(digraphs(letters), expected)
+
+
+class PlayfairCipherTest(unittest.TestCase):
+    def test_matches_the_pair_by_pair_functions(self):
+        for key in KEYS:
+            matrix = create_matrix(key, playfair.alphabets)
+            cipher = PlayfairCipher(key)
+            for text in TEXTS:
+                with self.subTest(key=key, text=text):
+                    encrypted = cipher.encrypt(text)
+                    self.assertEqual(encrypted, get_cipher(text, matrix))
+                    self.assertEqual(cipher.decrypt(encrypted), get_plaintext(encrypted, matrix))
+
+    def test_decrypt_restores_the_prepared_text(self):
+        cipher = PlayfairCipher("monarchy")
+        for text in TEXTS:
+            self.assertEqual(cipher.decrypt(cipher.encrypt(text)), prepare_text(text))
+
+    def test_same_result_without_numpy(self):
+        cipher = PlayfairCipher("monarchy")
+        encrypted = cipher.encrypt(TEXTS[0])
+        with mock.patch.object(playfair, "np", None):
+            self.assertEqual(cipher.encrypt(TEXTS[0]), encrypted)
+            self.assertEqual(cipher.decrypt(encrypted), prepare_text(TEXTS[0]))
+
+    def test_odd_cipher_text_is_rejected(self):
+        with self.assertRaises(ValueError):
+            PlayfairCipher("monarchy").decrypt("abc")
+
+
+class StreamTest(unittest.TestCase):
+    def chunks(self, text, size):
+        return [text[i : i + size] for i in range(0, len(text), size)]
+
+    def test_chunked_stream_equals_one_shot(self):
+        cipher = PlayfairCipher("monarchy")
+        # Doubled letters, "j" and odd lengths fall on the chunk boundaries
+        text = "Balloons jazz: the committee meets at noon, xx marks the spot. " * 5
+        encrypted = cipher.encrypt(text)
+        for size in (1, 2, 3, 7, 64, len(text)):
+            with self.subTest(size=size):
+                self.assertEqual("".join(cipher.encrypt_stream(self.chunks(text, size))), encrypted)
+                decrypted = "".join(cipher.decrypt_stream(self.chunks(encrypted, size)))
+                self.assertEqual(decrypted, cipher.decrypt(encrypted))
+
+    def test_empty_stream(self):
+        self.assertEqual(list(PlayfairCipher("monarchy").encrypt_stream([])), [])
+
+    def test_odd_cipher_stream_is_rejected(self):
+        with self.assertRaises(ValueError):
+            list(PlayfairCipher("monarchy").decrypt_stream(["ab", "c"]))
+
+    def test_read_chunks(self):
+        self.assertEqual(list(read_chunks(io.StringIO("abcdefg"), 3)), ["abc", "def", "g"])
+
+
+def count_vowels(key, text):
+    """A score for transform_many, defined at module level so the workers can unpickle it"""
+    return sum(text.count(vowel) for vowel in "aeiou")
+
+
+class TransformManyTest(unittest.TestCase):
+    def test_results_match_one_key_at_a_time(self):
+        text = prepare_text(TEXTS[0] * 3)
+        results = list(transform_many(KEYS, text, processes=2))
+        self.assertEqual(results, [(key, PlayfairCipher(key).encrypt(text)) for key in KEYS])
+
+    def test_decrypt_unordered(self):
+        encrypted = PlayfairCipher("monarchy").encrypt(TEXTS[0])
+        results = dict(transform_many(KEYS, encrypted, decrypt=True, processes=2, ordered=False))
+        self.assertEqual(results, {key: PlayfairCipher(key).decrypt(encrypted) for key in KEYS})
+
+    def test_score_is_yielded_instead_of_the_text(self):
+        encrypted = PlayfairCipher("monarchy").encrypt(TEXTS[0])
+        results = dict(transform_many(["monarchy"], encrypted, decrypt=True, processes=1, score=count_vowels))
+        self.assertEqual(results, {"monarchy": count_vowels("monarchy", prepare_text(TEXTS[0]))})
+
+    def test_empty_text(self):
+        self.assertEqual(list(transform_many(["monarchy"], "", processes=1)), [("monarchy", "")])
+
+    def test_unprepared_text_is_rejected(self):
+        with self.assertRaises(ValueError):
+            list(transform_many(KEYS, "odd", processes=1))
+
+
+@unittest.skipIf(playfair.np is None, "The key search needs NumPy")
+class KeySearchTest(unittest.TestCase):
+    def setUp(self):
+        self.fitness = ngram_fitness(CORPUS, 4)
+        self.cipher_text = PlayfairCipher("monarchy").encrypt(CORPUS[:400])
+
+    def test_fitness_table(self):
+        self.assertEqual(self.fitness.shape, (25**4,))
+        seen, unseen = (sum(i * 25 ** (3 - n) for n, i in enumerate(letter_indexes(gram))) for gram in ("ofti", "qzqz"))
+        self.assertGreater(self.fitness[seen], self.fitness[unseen])
+        with self.assertRaises(ValueError):
+            ngram_fitness("abc", 4)
+
+    def test_decrypt_and_score_match_the_cipher(self):
+        search = KeySearch(self.cipher_text, self.fitness)
+        for key in ("monarchy", "zebras"):
+            search.set_key(key)
+            plain = PlayfairCipher(key).decrypt(self.cipher_text)
+            self.assertEqual(bytes(search.decrypt().reshape(-1).tolist()), letter_indexes(plain))
+
+            letters = letter_indexes(plain)
+            grams = [sum(i * 25 ** (3 - n) for n, i in enumerate(letters[j : j + 4])) for j in range(len(letters) - 3)]
+            self.assertAlmostEqual(search.score(), sum(float(self.fitness[g]) for g in grams) / len(grams), places=5)
+
+    def test_the_key_scores_best(self):
+        search = KeySearch(self.cipher_text, self.fitness)
+        search.set_key("monarchy")
+        right = search.score()
+        search.set_key("zebras")
+        self.assertGreater(right, search.score())
+
+    def test_mutations_are_undone_by_applying_them_again(self):
+        search = KeySearch(self.cipher_text, self.fitness)
+        search.set_key("zebras")
+        key = search.key_text()
+        for mutate in (search.swap_cells, search.swap_rows, search.swap_columns):
+            mutate(1, 3)
+            self.assertNotEqual(search.key_text(), key)
+            self.assertEqual(sorted(search.positions[search.key].tolist()), list(range(25)))
+            mutate(1, 3)
+            self.assertEqual(search.key_text(), key)
+
+    def test_anneal_returns_the_best_key_seen(self):
+        search = KeySearch(self.cipher_text, self.fitness)
+        search.set_key("zebras")
+        start = search.score()
+
+        key, score = search.anneal(2000, seed=1)
+        self.assertGreaterEqual(score, start)
+        self.assertEqual(search.key_text(), key)
+        self.assertAlmostEqual(search.score(), score, places=5)
+
+        search.set_key("zebras")
+        self.assertEqual(search.anneal(2000, seed=1), (key, score))
+
+    def test_text_shorter_than_the_ngrams_is_rejected(self):
+        with self.assertRaises(ValueError):
+            KeySearch("ab", self.fitness)
+        KeySearch("abcd", self.fitness).score()
+
+    def test_crack_command_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus = os.path.join(tmp, "corpus.txt")
+            with open(corpus, "w") as file:
+                file.write(CORPUS)
+
+            stdout = io.StringIO()
+            argv = ["crack", "--corpus", corpus, "--iterations", "200", "--restarts", "1", "--seed", "1"]
+            with mock.patch("sys.stdin", io.StringIO(self.cipher_text)), mock.patch("sys.stdout", stdout):
+                with mock.patch("sys.stderr", io.StringIO()):
+                    main(argv)
+
+        self.assertFalse(stdout.closed)
+        key, plain = stdout.getvalue().splitlines()
+        self.assertEqual(plain, PlayfairCipher(key).decrypt(self.cipher_text))
+
+
+class CommandLineTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_files_round_trip(self):
+        with open(self.path("plain.txt"), "w") as file:
+            file.write(TEXTS[0])
+
+        main(["encrypt", "-k", "monarchy", "-i", self.path("plain.txt"), "-o", self.path("cipher.txt"), "--chunk-size", "5"])
+        main(["decrypt", "-k", "monarchy", "-i", self.path("cipher.txt"), "-o", self.path("out.txt")])
+
+        with open(self.path("cipher.txt")) as file:
+            self.assertEqual(file.read(), PlayfairCipher("monarchy").encrypt(TEXTS[0]) + "\n")
+        with open(self.path("out.txt")) as file:
+            self.assertEqual(file.read(), prepare_text(TEXTS[0]) + "\n")
+
+    def test_standard_streams_stay_open(self):
+        stdin, stdout = io.StringIO("balloon"), io.StringIO()
+        with mock.patch("sys.stdin", stdin), mock.patch("sys.stdout", stdout):
+            main(["encrypt", "-k", "monarchy"])
+
+        self.assertFalse(stdin.closed or stdout.closed)
+        self.assertEqual(stdout.getvalue(), PlayfairCipher("monarchy").encrypt("balloon") + "\n")
+
+    def test_odd_cipher_text_exits_with_an_error(self):
+        with mock.patch("sys.stdin", io.StringIO("abc")), mock.patch("sys.stdout", io.StringIO()):
+            with self.assertRaises(SystemExit) as raised:
+                main(["decrypt", "-k", "monarchy"])
+        self.assertIn("odd number of letters", str(raised.exception.code))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,17 +1,206 @@
 # This program uses shift cyper techique to encrypt a message
 
-a = "hello";
+import os
+import sys
+import mmap
+import string
+import argparse
+from contextlib import nullcontext
+from functools import partial
+from typing import Iterable, Iterator
 
-char_string = [ord(i)-8 for i in a];
+try:
+    import numpy as np
+except ImportError:  # The bytes.translate path is used instead
+    np = None
 
+# Characters or bytes read at once by the command line interface and encrypt_file
+CHUNK_SIZE = 1 << 20
 
-print(char_string)
+SHIFT = 8
 
+# Every alphabet wraps around on its own, other characters are left as they are
+ALPHABETS = (string.ascii_lowercase, string.ascii_uppercase)
 
-cipher_string = "".join([chr(i) for i in char_string]);
 
-print(cipher_string)
+class ShiftCipher:
+    """A shift (Caesar) cipher with translation tables built once per key
 
-org_string = "".join([chr(ord(i) +8) for i in cipher_string]);
+    Every character of an alphabet is replaced by the one `key` places
+    further, wrapping around at the end of its alphabet. The tables serve
+    `str.translate` for text, `bytes.translate` for ASCII alphabets over
+    bytes, and a 256-entry NumPy lookup table for uint8 arrays, so no
+    character is shifted in a Python loop.
 
-print(org_string)
+    Args:
+        key (int): Number of places every character is shifted, may be negative
+        alphabets (tuple[str]): The alphabets, a character may only be in one of them
+
+    Raises:
+        ValueError: If a character is in several alphabets
+    """
+
+    def __init__(self, key: int = SHIFT, alphabets: tuple[str, ...] = ALPHABETS):
+        letters = "".join(alphabets)
+        if len(set(letters)) != len(letters):
+            raise ValueError("A character appears twice in the alphabets")
+
+        self.key = key
+        self.alphabets = tuple(alphabets)
+        shifted = "".join(alphabet[key % len(alphabet) :] + alphabet[: key % len(alphabet)] for alphabet in alphabets if alphabet)
+
+        self.encrypt_table = str.maketrans(letters, shifted)
+        self.decrypt_table = str.maketrans(shifted, letters)
+
+        # Byte tables only exist for ASCII alphabets, other characters span several bytes
+        self.encrypt_bytes_table = None
+        self.decrypt_bytes_table = None
+        if letters.isascii():
+            self.encrypt_bytes_table = bytes.maketrans(letters.encode(), shifted.encode())
+            self.decrypt_bytes_table = bytes.maketrans(shifted.encode(), letters.encode())
+
+    def encrypt(self, text: str) -> str:
+        """Encrypts a string"""
+        return text.translate(self.encrypt_table)
+
+    def decrypt(self, cipher_text: str) -> str:
+        """Decrypts a string produced by `encrypt`"""
+        return cipher_text.translate(self.decrypt_table)
+
+    def _byte_table(self, decrypt: bool) -> bytes:
+        if self.encrypt_bytes_table is None:
+            raise ValueError("Bytes can only be shifted with ASCII alphabets")
+        return self.decrypt_bytes_table if decrypt else self.encrypt_bytes_table
+
+    def encrypt_bytes(self, data: bytes) -> bytes:
+        """Encrypts ASCII or UTF-8 encoded bytes, ASCII alphabets only
+
+        UTF-8 never uses ASCII byte values inside multi-byte characters, so
+        encoded text can be shifted without decoding it.
+        """
+        return data.translate(self._byte_table(False))
+
+    def decrypt_bytes(self, data: bytes) -> bytes:
+        """Decrypts bytes produced by `encrypt_bytes`"""
+        return data.translate(self._byte_table(True))
+
+    def transform_array(self, array, decrypt: bool = False, out=None):
+        """Encrypts or decrypts a NumPy uint8 array with one table lookup per element
+
+        Args:
+            array (np.ndarray): The bytes to transform, eg. `np.frombuffer` over a file mapping
+            decrypt (bool): Decrypt instead of encrypt
+            out (np.ndarray): Array receiving the result, may be `array` itself
+
+        Returns:
+            np.ndarray: The transformed bytes
+        """
+        lookup = np.frombuffer(self._byte_table(decrypt), dtype=np.uint8)
+        return np.take(lookup, array, out=out)
+
+    def stream(self, chunks: Iterable[str], decrypt: bool = False) -> Iterator[str]:
+        """Encrypts or decrypts a text given in pieces of any size, one piece at a time
+
+        Every character is shifted on its own, so the chunks need no state
+        between them and memory stays bounded by the chunk size.
+
+        Args:
+            chunks (Iterable[str]): The text, eg. a file read in chunks
+            decrypt (bool): Decrypt instead of encrypt
+
+        Yields:
+            str: The transformed text, one piece per chunk
+        """
+        table = self.decrypt_table if decrypt else self.encrypt_table
+        return (chunk.translate(table) for chunk in chunks)
+
+    def transform_file(self, source: str, target, decrypt: bool = False, chunk_size: int = CHUNK_SIZE) -> None:
+        """Encrypts or decrypts a file through a memory mapping, ASCII alphabets only
+
+        The file is mapped instead of read, and every chunk is shifted with
+        NumPy into one reused buffer (or with `bytes.translate` without
+        NumPy) and written out, so memory stays bounded by the chunk size.
+
+        Args:
+            source (str): Path to the file to read
+            target (BinaryIO): File object the result is written to
+            decrypt (bool): Decrypt instead of encrypt
+            chunk_size (int): Bytes transformed at once
+        """
+        table = self._byte_table(decrypt)
+
+        with open(source, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return  # Empty files cannot be mapped
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                if np is None:
+                    for start in range(0, len(mapping), chunk_size):
+                        target.write(mapping[start : start + chunk_size].translate(table))
+                    return
+
+                data = np.frombuffer(mapping, dtype=np.uint8)
+                buffer = np.empty(min(chunk_size, len(data)), dtype=np.uint8)
+                for start in range(0, len(data), chunk_size):
+                    piece = data[start : start + chunk_size]
+                    self.transform_array(piece, decrypt, out=buffer[: len(piece)])
+                    target.write(buffer[: len(piece)])
+                del data, piece  # The mapping cannot close while arrays still point into it
+
+
+def read_chunks(file, size: int = CHUNK_SIZE) -> Iterator:
+    """Reads a file in pieces of `size` characters (or bytes) until its end"""
+    return iter(partial(file.read, size), file.read(0))
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Encrypt or decrypt files with a shift cipher, in constant memory.")
+    parser.add_argument("mode", choices=("encrypt", "decrypt"))
+    parser.add_argument("-k", "--key", type=int, default=SHIFT, help=f"Places every letter is shifted (default: {SHIFT})")
+    parser.add_argument(
+        "-a", "--alphabet", action="append",
+        help="Alphabet to shift within, repeat it for several (default: a-z and A-Z)",
+    )
+    parser.add_argument("-i", "--input", help="File to read (default: stdin)")
+    parser.add_argument("-o", "--output", help="File to write (default: stdout)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Characters read at once")
+    args = parser.parse_args(argv)
+
+    try:
+        cipher = ShiftCipher(args.key, tuple(args.alphabet or ALPHABETS))
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    decrypt = args.mode == "decrypt"
+
+    # ASCII alphabets shift the raw bytes, other alphabets need decoded text
+    binary = cipher.encrypt_bytes_table is not None
+    # The standard streams are not closed, only the files opened here
+    if binary:
+        output = open(args.output, "wb") if args.output else nullcontext(sys.stdout.buffer)
+    else:
+        output = open(args.output, "w", newline="") if args.output else nullcontext(sys.stdout)
+
+    with output as target:
+        if binary and args.input:
+            cipher.transform_file(args.input, target, decrypt, args.chunk_size)
+        elif binary:
+            for chunk in read_chunks(sys.stdin.buffer, args.chunk_size):
+                target.write(cipher.decrypt_bytes(chunk) if decrypt else cipher.encrypt_bytes(chunk))
+        else:
+            with open(args.input, "r", newline="") if args.input else nullcontext(sys.stdin) as source:
+                for piece in cipher.stream(read_chunks(source, args.chunk_size), decrypt):
+                    target.write(piece)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main()
+    else:
+        a = "hello"
+
+        cipher = ShiftCipher()
+        cipher_string = cipher.encrypt(a)
+
+        print(cipher_string)
+
+        print(cipher.decrypt(cipher_string))
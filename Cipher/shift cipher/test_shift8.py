@@ -0,0 +1,124 @@
+import io
+import os
+import string
+import tempfile
+import unittest
+from unittest import mock
+
+import shift8
+from shift8 import ShiftCipher, main, read_chunks
+
+TEXT = "Hello, World! The quick brown fox jumps over the lazy dog. Zz\n"
+
+
+class ShiftCipherTest(unittest.TestCase):
+    def test_letters_wrap_around_in_their_own_alphabet(self):
+        cipher = ShiftCipher()
+        self.assertEqual(cipher.encrypt("hello"), "pmttw")
+        self.assertEqual(cipher.encrypt("xyz XYZ 123"), "fgh FGH 123")
+
+    def test_decrypt_restores_the_text(self):
+        for key in (0, 1, 8, 25, 26, 27, -3):
+            with self.subTest(key=key):
+                cipher = ShiftCipher(key)
+                self.assertEqual(cipher.decrypt(cipher.encrypt(TEXT)), TEXT)
+
+    def test_negative_key_shifts_back(self):
+        self.assertEqual(ShiftCipher(-8).encrypt("pmttw"), "hello")
+
+    def test_bytes_and_arrays_match_the_text(self):
+        cipher = ShiftCipher(5)
+        encrypted = cipher.encrypt(TEXT)
+        self.assertEqual(cipher.encrypt_bytes(TEXT.encode()), encrypted.encode())
+        self.assertEqual(cipher.decrypt_bytes(encrypted.encode()), TEXT.encode())
+
+        if shift8.np is not None:
+            array = shift8.np.frombuffer(TEXT.encode(), dtype=shift8.np.uint8).copy()
+            cipher.transform_array(array, out=array)
+            self.assertEqual(array.tobytes(), encrypted.encode())
+
+    def test_utf8_bytes_are_shifted_without_decoding(self):
+        cipher = ShiftCipher()
+        self.assertEqual(cipher.encrypt_bytes("héllo".encode()), cipher.encrypt("héllo").encode())
+
+    def test_custom_alphabets(self):
+        cipher = ShiftCipher(1, (string.digits,))
+        self.assertEqual(cipher.encrypt("a9b0"), "a0b1")
+
+        greek = ShiftCipher(1, ("αβγ",))
+        self.assertEqual(greek.encrypt("αγ"), "βα")
+        with self.assertRaises(ValueError):
+            greek.encrypt_bytes(b"abc")
+
+    def test_overlapping_alphabets_are_rejected(self):
+        with self.assertRaises(ValueError):
+            ShiftCipher(1, ("abc", "cde"))
+
+    def test_stream_equals_one_shot(self):
+        cipher = ShiftCipher()
+        chunks = list(read_chunks(io.StringIO(TEXT), 7))
+        self.assertEqual("".join(cipher.stream(chunks)), cipher.encrypt(TEXT))
+
+
+class TransformFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = os.path.join(self.tmp.name, "plain.txt")
+        with open(self.source, "wb") as file:
+            file.write(TEXT.encode() * 10)
+
+    def transform(self, **kwargs):
+        target = io.BytesIO()
+        ShiftCipher().transform_file(self.source, target, **kwargs)
+        return target.getvalue()
+
+    def test_chunks_equal_one_shot(self):
+        expected = ShiftCipher().encrypt(TEXT * 10).encode()
+        self.assertEqual(self.transform(chunk_size=7), expected)
+        self.assertEqual(self.transform(), expected)
+
+    def test_same_result_without_numpy(self):
+        expected = self.transform(chunk_size=7)
+        with mock.patch.object(shift8, "np", None):
+            self.assertEqual(self.transform(chunk_size=7), expected)
+
+    def test_empty_file(self):
+        open(self.source, "wb").close()
+        self.assertEqual(self.transform(), b"")
+
+
+class CommandLineTest(unittest.TestCase):
+    def run_main(self, argv, stdin):
+        stdin = io.TextIOWrapper(io.BytesIO(stdin.encode()), encoding="utf-8")
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+        with mock.patch("sys.stdin", stdin), mock.patch("sys.stdout", stdout):
+            main(argv)
+
+        self.assertFalse(stdin.closed or stdout.closed)
+        stdout.flush()
+        return stdout.buffer.getvalue().decode()
+
+    def test_standard_streams(self):
+        self.assertEqual(self.run_main(["encrypt", "--chunk-size", "5"], TEXT), ShiftCipher().encrypt(TEXT))
+        self.assertEqual(self.run_main(["decrypt", "-k", "3"], ShiftCipher(3).encrypt(TEXT)), TEXT)
+
+    def test_non_ascii_alphabet(self):
+        self.assertEqual(self.run_main(["encrypt", "-k", "1", "-a", "αβγ"], "αγ\n"), "βα\n")
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source, target = os.path.join(tmp, "in.txt"), os.path.join(tmp, "out.txt")
+            with open(source, "w") as file:
+                file.write(TEXT)
+            main(["encrypt", "-i", source, "-o", target])
+            with open(target) as file:
+                self.assertEqual(file.read(), ShiftCipher().encrypt(TEXT))
+
+    def test_overlapping_alphabets_exit_with_an_error(self):
+        with self.assertRaises(SystemExit):
+            main(["encrypt", "-a", "abc", "-a", "cde"])
+
+
+if __name__ == "__main__":
+    unittest.main()
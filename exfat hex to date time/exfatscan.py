@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import os
+import sys
+import csv
+import json
+import mmap
+import struct
+import argparse
+import multiprocessing
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:  # Checked by scan, the timestamp functions of hextodatetime work without it
+    np = None
+
+from hextodatetime import decode_fat_timestamps, format_timestamps
+
+ENTRY_SIZE = 32
+
+# Directory entry types, the in-use bit is cleared when a file is deleted
+FILE_ENTRY = 0x85
+STREAM_EXTENSION = 0xC0
+FILE_NAME = 0xC1
+IN_USE = 0x80
+
+ATTRIBUTE_DIRECTORY = 0x10
+
+# Bytes of the cluster heap scanned by one task
+TASK_SIZE = 64 << 20
+
+# name, FatOffset, FatLength, ClusterHeapOffset, ClusterCount, FirstClusterOfRootDirectory,
+# BytesPerSectorShift, SectorsPerClusterShift
+BOOT_SECTOR = struct.Struct("<3x8s69xIIIII8xBB")
+
+# EntryType, SecondaryCount, SetChecksum, FileAttributes, Create/LastModified/LastAccessed
+# timestamps, Create/LastModified 10ms increments, Create/LastModified/LastAccessed UTC offsets
+FILE_DIRECTORY_ENTRY = struct.Struct("<BBHH2xIIIBBBBB7x")
+
+# EntryType, GeneralSecondaryFlags, NameLength, NameHash, ValidDataLength, FirstCluster, DataLength
+STREAM_EXTENSION_ENTRY = struct.Struct("<BBxBH2xQ4xIQ")
+
+# EntryType, GeneralSecondaryFlags, 15 UTF-16 characters of the name
+FILE_NAME_ENTRY = struct.Struct("<BB30s")
+
+COLUMNS = ("offset", "cluster", "deleted", "directory", "size", "name", "created", "modified", "accessed")
+
+# The mapped image of a worker process
+_image = None
+
+
+class Volume:
+    """Layout of an exFAT volume, read from its boot sector
+
+    Args:
+        image (mmap.mmap): The mapped image.
+        offset (int): Byte offset of the volume in the image, eg. its partition start.
+
+    Raises:
+        ValueError: If there is no exFAT boot sector at the offset.
+    """
+
+    def __init__(self, image, offset: int = 0):
+        if len(image) < offset + 512:
+            raise ValueError("The image is too small for an exFAT volume")
+
+        name, _, _, heap_offset, cluster_count, self.root_cluster, sector_shift, cluster_shift = BOOT_SECTOR.unpack_from(image, offset)
+        if name != b"EXFAT   ":
+            raise ValueError(f"No exFAT boot sector at offset {offset}")
+
+        self.cluster_size = 1 << (sector_shift + cluster_shift)
+        self.heap_start = offset + (heap_offset << sector_shift)
+        self.heap_end = min(self.heap_start + cluster_count * self.cluster_size, len(image))
+
+    def cluster(self, position: int) -> int:
+        """Number of the cluster holding a byte of the image"""
+        return 2 + (position - self.heap_start) // self.cluster_size
+
+    def ranges(self, size: int = TASK_SIZE) -> list[tuple[int, int]]:
+        """Splits the cluster heap into ranges of whole clusters of about `size` bytes"""
+        step = max(size // self.cluster_size, 1) * self.cluster_size
+        return [(start, min(start + step, self.heap_end)) for start in range(self.heap_start, self.heap_end, step)]
+
+
+def set_checksums(entry_sets: np.ndarray) -> np.ndarray:
+    """Computes the SetChecksum of many directory entry sets of the same size at once
+
+    The checksum is a rotate-and-add over the bytes of a set, sequential
+    within a set but independent between sets, so it runs one byte column
+    at a time over all sets.
+
+    Args:
+        entry_sets (np.ndarray): uint8 array with one entry set per row, the
+            in-use bits of deleted sets already restored.
+
+    Returns:
+        np.ndarray: The 16-bit checksum of every row.
+    """
+    checksums = np.zeros(len(entry_sets), dtype=np.uint32)
+    for index in range(entry_sets.shape[1]):
+        if index in (2, 3):  # The SetChecksum field itself
+            continue
+        checksums = (((checksums << 15) | (checksums >> 1)) + entry_sets[:, index]) & 0xFFFF
+    return checksums
+
+
+def find_entry_sets(data: np.ndarray, start: int, end: int, deleted: bool) -> list[int]:
+    """Finds the valid File entry sets that start in a range of the image
+
+    Every 32-byte slot of the range is checked at once for a File entry
+    followed by a Stream Extension entry, and the checksums of the
+    candidates are verified in bulk, so Python never loops over slots.
+
+    Args:
+        data (np.ndarray): The mapped image as uint8.
+        start (int): First byte of the range, a multiple of 32 bytes from the cluster heap.
+        end (int): End of the range.
+        deleted (bool): Also find the sets of deleted files, whose in-use bits are cleared.
+
+    Returns:
+        list[int]: Byte offsets of the sets in the image, in order.
+    """
+    types = data[start:end:ENTRY_SIZE]
+    primary = (types == FILE_ENTRY) | ((types == (FILE_ENTRY & ~IN_USE)) if deleted else False)
+    positions = start + np.flatnonzero(primary) * ENTRY_SIZE
+    positions = positions[positions + 2 * ENTRY_SIZE <= len(data)]
+
+    counts = data[positions + 1].astype(np.int64)
+    in_use = data[positions] & IN_USE
+    sizes = (counts + 1) * ENTRY_SIZE
+    plausible = (
+        (counts >= 2) & (counts <= 18)
+        & ((data[positions + ENTRY_SIZE] | (in_use ^ IN_USE)) == STREAM_EXTENSION)
+        & (positions + sizes <= len(data))
+    )
+    positions, counts = positions[plausible], counts[plausible]
+
+    found = []
+    for count in np.unique(counts).tolist():
+        group = positions[counts == count]
+        size = (count + 1) * ENTRY_SIZE
+        entry_sets = data[group[:, None] + np.arange(size)]
+        entry_sets[:, ::ENTRY_SIZE] |= IN_USE  # Deleted sets were checksummed while in use
+        stored = entry_sets[:, 2].astype(np.uint32) | (entry_sets[:, 3].astype(np.uint32) << 8)
+        found.extend(group[set_checksums(entry_sets) == stored].tolist())
+
+    return sorted(found)
+
+
+@lru_cache(maxsize=None)
+def utc_offset(value: int) -> str:
+    """Formats an exFAT UTC offset field, empty if the timestamp is in unknown local time"""
+    if not value & 0x80:
+        return ""
+    minutes = (((value & 0x7F) ^ 0x40) - 0x40) * 15  # Signed 7-bit count of 15 minutes
+    sign = "-" if minutes < 0 else "+"
+    return f"{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+
+
+def read_entry_set(view: memoryview, position: int) -> tuple:
+    """Reads a File directory entry set found by find_entry_sets
+
+    Args:
+        view (memoryview): The mapped image.
+        position (int): Byte offset of the File entry (0x85, or 0x05 once deleted).
+
+    Returns:
+        tuple: (deleted, attributes, size, name, timestamps, increments, utc offsets).
+    """
+    entry_type, count, _, attributes, *stamps = FILE_DIRECTORY_ENTRY.unpack_from(view, position)
+    timestamps, increments, offsets = stamps[:3], stamps[3:5], stamps[5:]
+
+    deleted = not entry_type & IN_USE
+    end = position + (count + 1) * ENTRY_SIZE
+    _, _, name_length, _, _, _, size = STREAM_EXTENSION_ENTRY.unpack_from(view, position + ENTRY_SIZE)
+
+    name = b"".join(
+        chars
+        for name_type, _, chars in FILE_NAME_ENTRY.iter_unpack(view[position + 2 * ENTRY_SIZE : end])
+        if name_type | IN_USE == FILE_NAME
+    )
+    name = name.decode("utf-16-le", "replace")[:name_length]
+
+    return deleted, attributes, size, name, timestamps, increments, offsets
+
+
+def _attach_image(path: str) -> None:
+    global _image
+    with open(path, "rb") as file:
+        _image = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def scan_range(task: tuple) -> list[tuple]:
+    """Finds and decodes the File entry sets that start in a range of the cluster heap
+
+    Python only touches the entry sets that find_entry_sets verified, and
+    the timestamps of all of them are decoded together.
+
+    Args:
+        task (tuple): (volume, start, end, deleted), the range in bytes of the mapped image.
+
+    Returns:
+        list[tuple]: One row of COLUMNS per File entry set.
+    """
+    volume, start, end, deleted = task
+    view = memoryview(_image)
+
+    positions = find_entry_sets(np.frombuffer(_image, dtype=np.uint8), start, end, deleted)
+    if not positions:
+        return []
+    sets = [(position, read_entry_set(view, position)) for position in positions]
+
+    raw = np.array([entry_set[4] for _, entry_set in sets], dtype=np.uint32)
+    increments = np.array([entry_set[5] for _, entry_set in sets], dtype=np.uint8)
+
+    # exFAT keeps the time in the lower and the date in the upper 16 bits
+    fields = decode_fat_timestamps((raw << 16) | (raw >> 16))
+    fields["second"][:, :2] += increments // 100
+    texts = iter(format_timestamps(fields.reshape(-1)))
+
+    rows = []
+    for (position, (is_deleted, attributes, size, name, _, centis, offsets)), row_raw in zip(sets, raw.tolist()):
+        created, modified, accessed = (next(texts) for _ in range(3))
+        rows.append(
+            (
+                position,
+                volume.cluster(position),
+                is_deleted,
+                bool(attributes & ATTRIBUTE_DIRECTORY),
+                size,
+                name,
+                f"{created}.{centis[0] % 100:02d}{utc_offset(offsets[0])}" if row_raw[0] else "",
+                f"{modified}.{centis[1] % 100:02d}{utc_offset(offsets[1])}" if row_raw[1] else "",
+                f"{accessed}{utc_offset(offsets[2])}" if row_raw[2] else "",
+            )
+        )
+    return rows
+
+
+def scan(path: str, offset: int = 0, deleted: bool = False, processes: int = 1):
+    """Finds the File entry sets of an exFAT image and decodes their timestamps
+
+    The whole cluster heap is searched, not only the directories reachable
+    from the root, so the entries of orphaned directories (and with
+    `deleted` the entries of deleted files) are found too. The heap is split
+    into ranges of whole clusters that are scanned by a pool of processes,
+    each of them mapping the image on its own. An entry set that continues
+    in a cluster that is not the next one fails its checksum and is missed.
+
+    Args:
+        path (str): Path to the image.
+        offset (int): Byte offset of the exFAT volume in the image.
+        deleted (bool): Also report the entry sets of deleted files.
+        processes (int): Number of worker processes, 1 scans in this process.
+
+    Returns:
+        Iterator[tuple]: One row of COLUMNS per File entry set, in the order of the image.
+
+    Raises:
+        ImportError: If NumPy is not installed.
+        OSError: If the image cannot be mapped.
+        ValueError: If there is no exFAT volume at the offset.
+    """
+    if np is None:
+        raise ImportError("Scanning an image needs NumPy")
+
+    _attach_image(path)
+    volume = Volume(_image, offset)
+    tasks = [(volume, start, end, deleted) for start, end in volume.ranges()]
+    return _scan_tasks(path, tasks, processes)
+
+
+def _scan_tasks(path: str, tasks: list[tuple], processes: int):
+    if processes == 1:
+        for task in tasks:
+            yield from scan_range(task)
+        return
+
+    with multiprocessing.Pool(processes, initializer=_attach_image, initargs=(path,)) as pool:
+        for rows in pool.imap(scan_range, tasks):
+            yield from rows
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Extract the file timestamps of an exFAT image as CSV or JSON lines.")
+    parser.add_argument("image", help="Path to the exFAT image")
+    parser.add_argument("-f", "--format", choices=("csv", "jsonl"), default="csv")
+    parser.add_argument("-o", "--output", help="File to write (default: stdout)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Worker processes (default: one per core)")
+    parser.add_argument("--offset", type=int, default=0, help="Byte offset of the volume in the image, eg. its partition start")
+    parser.add_argument("--deleted", action="store_true", help="Also report the entries of deleted files")
+    args = parser.parse_args(argv)
+
+    target = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        rows = scan(args.image, args.offset, args.deleted, max(args.jobs, 1))
+        if args.format == "csv":
+            writer = csv.writer(target)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                target.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n")
+    except (ImportError, OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        if args.output:
+            target.close()
+
+
+if __name__ == "__main__":
+    main()
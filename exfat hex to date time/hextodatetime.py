@@ -1,3 +1,30 @@
+from __future__ import annotations
+
+import calendar
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterator
+
+try:
+    import numpy as np
+except ImportError:  # Only the bulk functions need it
+    np = None
+
+# Decoded fields of a FAT timestamp, as returned by decode_fat_timestamps
+TIMESTAMP_FIELDS = None
+if np is not None:
+    TIMESTAMP_FIELDS = np.dtype(
+        [
+            ("year", np.uint16),
+            ("month", np.uint8),
+            ("day", np.uint8),
+            ("hour", np.uint8),
+            ("minute", np.uint8),
+            ("second", np.uint8),
+        ]
+    )
+
+
 def decode_fat_timestamp(fat_timestamp):
     """
     Decodes a FAT timestamp into a readable date and time.
@@ -24,7 +51,209 @@ def decode_fat_timestamp(fat_timestamp):
     return f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:{second:02d}"
 
 
-# Example usage
-fat_timestamp = 0x7ef45e7d  # Example FAT timestamp
-decoded_datetime = decode_fat_timestamp(fat_timestamp)
-print(f"Decoded Date and Time: {decoded_datetime}")
+@lru_cache(maxsize=None)
+def date_table() -> tuple[tuple[str, str], ...]:
+    """
+    Decodes every possible 16-bit date half once, on first use.
+
+    Returns:
+        tuple: (text, error) for every date half, the text in "YYYY-MM-DD " format
+            and the error empty if the date exists.
+    """
+    month_days = {
+        (year, month): calendar.monthrange(year, month)[1] for year in range(1980, 2108) for month in range(1, 13)
+    }
+
+    table = []
+    for date_part in range(1 << 16):
+        year = (date_part >> 9) + 1980
+        month = (date_part >> 5) & 0x0F
+        day = date_part & 0x1F
+
+        if not 1 <= month <= 12:
+            error = f"month {month}"
+        elif not 1 <= day <= month_days[year, month]:
+            error = f"day {day} of {year:04d}-{month:02d}"
+        else:
+            error = ""
+        table.append((f"{year:04d}-{month:02d}-{day:02d} ", error))
+
+    return tuple(table)
+
+
+@lru_cache(maxsize=None)
+def time_table() -> tuple[tuple[str, str], ...]:
+    """
+    Decodes every possible 16-bit time half once, on first use.
+
+    Returns:
+        tuple: (text, error) for every time half, the text in "HH:MM:SS" format
+            and the error empty if the time exists.
+    """
+    table = []
+    for time_part in range(1 << 16):
+        hour = time_part >> 11
+        minute = (time_part >> 5) & 0x3F
+        second = (time_part & 0x1F) * 2
+
+        if hour > 23:
+            error = f"hour {hour}"
+        elif minute > 59:
+            error = f"minute {minute}"
+        elif second > 58:
+            error = f"second {second}"
+        else:
+            error = ""
+        table.append((f"{hour:02d}:{minute:02d}:{second:02d}", error))
+
+    return tuple(table)
+
+
+def decode_fat_timestamp_cached(fat_timestamp, strict=False):
+    """
+    Decodes a FAT timestamp with two lookups in the cached date and time tables.
+
+    Gives the same result as decode_fat_timestamp, but without any bit
+    fields or formatting per call, for timelines that decode the same
+    values over and over.
+
+    Args:
+        fat_timestamp (int): A 32-bit FAT timestamp.
+        strict (bool): Raise on dates and times that cannot exist instead of formatting them.
+
+    Returns:
+        str: Date and time in "YYYY-MM-DD HH:MM:SS" format.
+
+    Raises:
+        ValueError: In strict mode, if a field is out of range (eg. month 0, day 0 or second 60).
+    """
+    date_text, date_error = date_table()[fat_timestamp & 0xFFFF]
+    time_text, time_error = time_table()[(fat_timestamp >> 16) & 0xFFFF]
+
+    if strict and (date_error or time_error):
+        raise ValueError(f"Invalid FAT timestamp {fat_timestamp:#010x}: {date_error or time_error}")
+
+    return date_text + time_text
+
+
+def encode_fat_timestamp(value: datetime) -> int:
+    """
+    Encodes a date and time into a FAT timestamp, the reverse of decode_fat_timestamp.
+
+    Args:
+        value (datetime): The date and time, odd seconds and fractions are rounded down.
+
+    Returns:
+        int: The 32-bit FAT timestamp, date in the lower and time in the upper 16 bits.
+
+    Raises:
+        ValueError: If the year is outside of 1980-2107.
+    """
+    if not 1980 <= value.year <= 2107:
+        raise ValueError(f"FAT timestamps cannot hold the year {value.year}")
+
+    date_part = ((value.year - 1980) << 9) | (value.month << 5) | value.day
+    time_part = (value.hour << 11) | (value.minute << 5) | (value.second // 2)
+
+    return (time_part << 16) | date_part
+
+
+def decode_fat_timestamps(fat_timestamps) -> np.ndarray:
+    """
+    Decodes many FAT timestamps at once with vectorized masks and shifts.
+
+    The bit layout is the one of decode_fat_timestamp: date in the lower
+    16 bits, time in the upper 16 bits.
+
+    Args:
+        fat_timestamps: A buffer of little endian 32-bit values (bytes, mmap, memoryview)
+            or an array-like of integers.
+
+    Returns:
+        np.ndarray: A structured array of TIMESTAMP_FIELDS, one row per timestamp.
+
+    Raises:
+        ImportError: If NumPy is not installed.
+    """
+    if np is None:
+        raise ImportError("Decoding timestamps in bulk needs NumPy")
+
+    if isinstance(fat_timestamps, np.ndarray):
+        values = fat_timestamps.astype(np.uint32, copy=False)
+    else:
+        try:
+            values = np.frombuffer(fat_timestamps, dtype="<u4")
+        except TypeError:  # Not a buffer, a list of integers
+            values = np.asarray(fat_timestamps, dtype=np.uint32)
+
+    date_part = values & 0xFFFF
+    time_part = values >> 16
+
+    fields = np.empty(values.shape, dtype=TIMESTAMP_FIELDS)
+    fields["year"] = (date_part >> 9) + 1980
+    fields["month"] = (date_part >> 5) & 0x0F
+    fields["day"] = date_part & 0x1F
+    fields["hour"] = time_part >> 11
+    fields["minute"] = (time_part >> 5) & 0x3F
+    fields["second"] = (time_part & 0x1F) * 2
+
+    return fields
+
+
+def to_datetime64(fields: np.ndarray) -> np.ndarray:
+    """
+    Converts decoded timestamps into NumPy datetimes.
+
+    Args:
+        fields (np.ndarray): Timestamps decoded by decode_fat_timestamps.
+
+    Returns:
+        np.ndarray: datetime64[s] values, NaT where a field is out of range (eg. month 0 or February 30).
+
+    Raises:
+        ImportError: If NumPy is not installed.
+    """
+    if np is None:
+        raise ImportError("Converting timestamps to datetime64 needs NumPy")
+
+    year = fields["year"].astype(np.int64)
+    month = fields["month"].astype(np.int64)
+    day = fields["day"].astype(np.int64)
+
+    months = (year - 1970) * 12 + np.clip(month, 1, 12) - 1
+    first = months.astype("datetime64[M]")
+    date = first.astype("datetime64[D]") + (day - 1).astype("timedelta64[D]")
+
+    seconds = fields["hour"].astype(np.int64) * 3600 + fields["minute"].astype(np.int64) * 60 + fields["second"]
+    result = date.astype("datetime64[s]") + seconds.astype("timedelta64[s]")
+
+    # A day past the end of its month rolls into the next month
+    valid = (
+        (month >= 1) & (month <= 12) & (day >= 1)
+        & (date.astype("datetime64[M]") == first)
+        & (fields["hour"] < 24) & (fields["minute"] < 60) & (fields["second"] < 60)
+    )
+    result[~valid] = np.datetime64("NaT")
+
+    return result
+
+
+def format_timestamps(fields: np.ndarray) -> Iterator[str]:
+    """
+    Formats decoded timestamps one at a time, only when they are needed.
+
+    Args:
+        fields (np.ndarray): Timestamps decoded by decode_fat_timestamps.
+
+    Yields:
+        str: Date and time in "YYYY-MM-DD HH:MM:SS" format, as decode_fat_timestamp returns it.
+    """
+    for year, month, day, hour, minute, second in fields.tolist():
+        yield f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:{second:02d}"
+
+
+if __name__ == "__main__":
+    # Example usage
+    fat_timestamp = 0x7ef45e7d  # Example FAT timestamp
+    decoded_datetime = decode_fat_timestamp(fat_timestamp)
+    print(f"Decoded Date and Time: {decoded_datetime}")
@@ -0,0 +1,183 @@
+import io
+import json
+import os
+import struct
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import exfatscan
+from exfatscan import COLUMNS, Volume, main, scan, utc_offset
+from hextodatetime import encode_fat_timestamp
+
+SECTOR_SHIFT = 9
+HEAP_OFFSET = 4  # Sectors
+CLUSTER_COUNT = 8
+CLUSTER_SIZE = 1 << SECTOR_SHIFT
+
+
+def exfat_timestamp(value: datetime) -> int:
+    """exFAT keeps the date in the upper and the time in the lower 16 bits, the other way round than FAT"""
+    fat = encode_fat_timestamp(value)
+    return ((fat & 0xFFFF) << 16) | (fat >> 16)
+
+
+def checksum(data: bytes) -> int:
+    """The SetChecksum of an entry set, as the exFAT specification writes it"""
+    value = 0
+    for index, byte in enumerate(data):
+        if index not in (2, 3):
+            value = (((value & 1) << 15) | (value >> 1)) + byte & 0xFFFF
+    return value
+
+
+def entry_set(
+    name, size=0, directory=False, created=None, modified=None, accessed=None, centis=(0, 0), offsets=(0, 0, 0)
+):
+    """A File entry set with its Stream Extension and File Name entries"""
+    chars = name.encode("utf-16-le")
+    names = [chars[i : i + 30].ljust(30, b"\0") for i in range(0, len(chars), 30)]
+    stamps = [exfat_timestamp(value) if value else 0 for value in (created, modified, accessed)]
+
+    attributes = 0x10 if directory else 0x20
+    data = bytearray(struct.pack("<BBHH2xIIIBBBBB7x", 0x85, 1 + len(names), 0, attributes, *stamps, *centis, *offsets))
+    data += struct.pack("<BBxBH2xQ4xIQ", 0xC0, 1, len(name), 0, size, 5, size)
+    for part in names:
+        data += struct.pack("<BB30s", 0xC1, 0, part)
+    struct.pack_into("<H", data, 2, checksum(data))
+    return data
+
+
+def delete(data: bytearray) -> bytearray:
+    """Clears the in-use bit of every entry, as deleting the file does"""
+    for position in range(0, len(data), 32):
+        data[position] &= 0x7F
+    return data
+
+
+def image(sets: dict, offset: int = 0) -> bytes:
+    """An image with an exFAT boot sector at `offset` and entry sets at cluster heap offsets"""
+    heap = bytearray(CLUSTER_COUNT * CLUSTER_SIZE)
+    for position, data in sets.items():
+        heap[position : position + len(data)] = data
+
+    boot = bytearray(HEAP_OFFSET << SECTOR_SHIFT)
+    boot[3:11] = b"EXFAT   "
+    struct.pack_into("<IIIII", boot, 80, 1, 1, HEAP_OFFSET, CLUSTER_COUNT, 2)
+    boot[108], boot[109] = SECTOR_SHIFT, 0
+    return bytes(offset) + bytes(boot) + bytes(heap)
+
+
+class UtcOffsetTest(unittest.TestCase):
+    def test_offsets(self):
+        self.assertEqual(utc_offset(0), "")
+        self.assertEqual(utc_offset(0x80 | 8), "+02:00")
+        self.assertEqual(utc_offset(0x80 | (-4 & 0x7F)), "-01:00")
+        self.assertEqual(utc_offset(0x80 | 22), "+05:30")
+
+
+@unittest.skipIf(exfatscan.np is None, "Scanning an image needs NumPy")
+class ScanTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "image.bin")
+        self.heap_start = HEAP_OFFSET << SECTOR_SHIFT
+
+        self.sets = {
+            0: entry_set(
+                "notes.txt",
+                size=1234,
+                created=datetime(2023, 5, 6, 7, 8, 10),
+                modified=datetime(2024, 1, 2, 3, 4, 6),
+                accessed=datetime(2024, 1, 3),
+                centis=(150, 7),
+                offsets=(0x80 | 8, 0x80 | 8, 0),
+            ),
+            96: entry_set("Photos", directory=True, created=datetime(2020, 2, 29, 23, 59, 58)),
+            CLUSTER_SIZE: entry_set("a rather long file name.jpeg", size=99, modified=datetime(2021, 7, 1, 12, 0, 0)),
+            2 * CLUSTER_SIZE: delete(entry_set("secret.doc", size=5, created=datetime(2022, 3, 4, 5, 6, 8))),
+        }
+
+    def write(self, sets, offset=0):
+        with open(self.path, "wb") as file:
+            file.write(image(sets, offset))
+
+    def scan(self, **kwargs):
+        return list(scan(self.path, **kwargs))
+
+    def test_entry_sets_and_their_timestamps(self):
+        self.write(self.sets)
+        rows = self.scan()
+        self.assertEqual([row[5] for row in rows], ["notes.txt", "Photos", "a rather long file name.jpeg"])
+
+        notes = dict(zip(COLUMNS, rows[0]))
+        self.assertEqual(notes["offset"], self.heap_start)
+        self.assertEqual(notes["cluster"], 2)
+        self.assertEqual(notes["size"], 1234)
+        self.assertFalse(notes["deleted"] or notes["directory"])
+        self.assertEqual(notes["created"], "2023-05-06 07:08:11.50+02:00")
+        self.assertEqual(notes["modified"], "2024-01-02 03:04:06.07+02:00")
+        self.assertEqual(notes["accessed"], "2024-01-03 00:00:00")
+
+        photos = dict(zip(COLUMNS, rows[1]))
+        self.assertTrue(photos["directory"])
+        self.assertEqual(photos["created"], "2020-02-29 23:59:58.00")
+        self.assertEqual(photos["modified"], "")
+
+        self.assertEqual(rows[2][1], 3)
+
+    def test_deleted_entry_sets(self):
+        self.write(self.sets)
+        rows = self.scan(deleted=True)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[3][2:6], (True, False, 5, "secret.doc"))
+        self.assertEqual(rows[3][6], "2022-03-04 05:06:08.00")
+
+    def test_wrong_checksum_is_skipped(self):
+        broken = bytearray(self.sets[0])
+        broken[40] ^= 0xFF  # A byte of the stream extension
+        self.write({**self.sets, 0: broken})
+        self.assertEqual([row[5] for row in self.scan()], ["Photos", "a rather long file name.jpeg"])
+
+    def test_volume_at_an_offset(self):
+        self.write(self.sets, offset=1 << 20)
+        rows = self.scan(offset=1 << 20)
+        self.assertEqual(rows[0][0], (1 << 20) + self.heap_start)
+        self.assertEqual(rows[0][1], 2)
+
+    def test_process_pool_gives_the_same_rows(self):
+        self.write(self.sets)
+        self.assertEqual(self.scan(deleted=True, processes=2), self.scan(deleted=True))
+
+    def test_ranges_hold_whole_clusters(self):
+        self.write(self.sets)
+        with open(self.path, "rb") as file:
+            volume = Volume(file.read())
+        ranges = volume.ranges(CLUSTER_SIZE + 1)
+        self.assertEqual(len(ranges), CLUSTER_COUNT)
+        self.assertTrue(all((end - start) == CLUSTER_SIZE for start, end in ranges))
+
+    def test_not_an_exfat_image(self):
+        with open(self.path, "wb") as file:
+            file.write(bytes(4096))
+        with self.assertRaises(ValueError):
+            self.scan()
+
+    def test_command_line(self):
+        self.write(self.sets)
+        output = os.path.join(self.tmp.name, "out.jsonl")
+        main([self.path, "-f", "jsonl", "-o", output, "-j", "1"])
+        with open(output) as file:
+            rows = [json.loads(line) for line in file]
+        self.assertEqual([row["name"] for row in rows], ["notes.txt", "Photos", "a rather long file name.jpeg"])
+
+        stdout = io.StringIO()
+        with mock.patch("sys.stdout", stdout):
+            main([self.path, "-j", "1"])
+        self.assertEqual(stdout.getvalue().splitlines()[0], ",".join(COLUMNS))
+
+
+if __name__ == "__main__":
+    unittest.main()
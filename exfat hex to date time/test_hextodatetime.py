@@ -0,0 +1,122 @@
+import random
+import struct
+import unittest
+from datetime import datetime
+
+import hextodatetime
+from hextodatetime import (
+    decode_fat_timestamp,
+    decode_fat_timestamp_cached,
+    decode_fat_timestamps,
+    encode_fat_timestamp,
+    format_timestamps,
+    to_datetime64,
+)
+
+
+def timestamp(year, month, day, hour=0, minute=0, second=0):
+    """Packs the fields as they are, even the ones encode_fat_timestamp would refuse"""
+    date_part = ((year - 1980) << 9) | (month << 5) | day
+    time_part = (hour << 11) | (minute << 5) | (second // 2)
+    return (time_part << 16) | date_part
+
+
+class CachedDecodeTest(unittest.TestCase):
+    def test_known_value(self):
+        self.assertEqual(decode_fat_timestamp(0x7EF45E7D), "2027-03-29 15:55:40")
+        self.assertEqual(decode_fat_timestamp_cached(0x7EF45E7D), "2027-03-29 15:55:40")
+
+    def test_matches_the_bit_field_decoder(self):
+        rng = random.Random(0)
+        values = [rng.getrandbits(32) for _ in range(20000)] + [0, 0xFFFFFFFF, 0x0000FFFF, 0xFFFF0000]
+        for value in values:
+            self.assertEqual(decode_fat_timestamp_cached(value), decode_fat_timestamp(value))
+
+    def test_strict_mode_rejects_dates_and_times_that_cannot_exist(self):
+        invalid = {
+            timestamp(1981, 2, 29): "day 29 of 1981-02",
+            timestamp(2023, 4, 31): "day 31 of 2023-04",
+            timestamp(2023, 1, 0): "day 0",
+            timestamp(2023, 0, 1): "month 0",
+            timestamp(2023, 13, 1): "month 13",
+            timestamp(2023, 1, 1, hour=24): "hour 24",
+            timestamp(2023, 1, 1, minute=60): "minute 60",
+            timestamp(2023, 1, 1, second=60): "second 60",
+        }
+        for value, reason in invalid.items():
+            with self.subTest(reason=reason):
+                with self.assertRaisesRegex(ValueError, reason):
+                    decode_fat_timestamp_cached(value, strict=True)
+                self.assertEqual(decode_fat_timestamp_cached(value), decode_fat_timestamp(value))
+
+    def test_strict_mode_accepts_leap_days(self):
+        self.assertEqual(decode_fat_timestamp_cached(timestamp(2000, 2, 29), strict=True), "2000-02-29 00:00:00")
+        self.assertEqual(decode_fat_timestamp_cached(timestamp(2107, 12, 31, 23, 59, 58), strict=True), "2107-12-31 23:59:58")
+
+
+class EncodeTest(unittest.TestCase):
+    def test_round_trip(self):
+        values = (
+            datetime(1980, 1, 1),
+            datetime(2000, 2, 29, 12, 30, 44),
+            datetime(2024, 12, 31, 23, 59, 58),
+            datetime(2107, 12, 31, 23, 59, 58),
+        )
+        for value in values:
+            with self.subTest(value=value):
+                encoded = encode_fat_timestamp(value)
+                self.assertEqual(decode_fat_timestamp_cached(encoded, strict=True), value.strftime("%Y-%m-%d %H:%M:%S"))
+                self.assertEqual(decode_fat_timestamp(encoded), value.strftime("%Y-%m-%d %H:%M:%S"))
+
+    def test_odd_seconds_and_fractions_are_rounded_down(self):
+        encoded = encode_fat_timestamp(datetime(2024, 5, 6, 7, 8, 9, 999999))
+        self.assertEqual(decode_fat_timestamp(encoded), "2024-05-06 07:08:08")
+
+    def test_years_outside_of_the_range_are_rejected(self):
+        for year in (1979, 2108):
+            with self.assertRaises(ValueError):
+                encode_fat_timestamp(datetime(year, 1, 1))
+
+
+@unittest.skipIf(hextodatetime.np is None, "Decoding in bulk needs NumPy")
+class BulkDecodeTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.values = [rng.getrandbits(32) for _ in range(5000)] + [0, 0xFFFFFFFF, 0x7EF45E7D]
+
+    def test_matches_the_scalar_decoder(self):
+        fields = decode_fat_timestamps(self.values)
+        self.assertEqual(list(format_timestamps(fields)), [decode_fat_timestamp(value) for value in self.values])
+
+    def test_buffers_and_arrays_decode_alike(self):
+        data = struct.pack(f"<{len(self.values)}I", *self.values)
+        expected = decode_fat_timestamps(self.values)
+        array = hextodatetime.np.array(self.values, dtype=hextodatetime.np.int64)
+        for source in (data, memoryview(data), bytearray(data), array):
+            with self.subTest(source=type(source).__name__):
+                self.assertTrue((decode_fat_timestamps(source) == expected).all())
+
+    def test_datetime64_with_nat_for_impossible_values(self):
+        values = [
+            encode_fat_timestamp(datetime(2000, 2, 29, 12, 30, 44)),
+            timestamp(1981, 2, 29),
+            timestamp(2023, 0, 1),
+            timestamp(2023, 1, 1, second=60),
+        ]
+        result = to_datetime64(decode_fat_timestamps(values))
+        self.assertEqual(str(result[0]), "2000-02-29T12:30:44")
+        self.assertTrue(hextodatetime.np.isnat(result[1:]).all())
+
+    def test_datetime64_agrees_with_strict_mode(self):
+        result = to_datetime64(decode_fat_timestamps(self.values))
+        for value, converted in zip(self.values, result):
+            try:
+                text = decode_fat_timestamp_cached(value, strict=True)
+            except ValueError:
+                self.assertTrue(hextodatetime.np.isnat(converted), hex(value))
+            else:
+                self.assertEqual(str(converted).replace("T", " "), text)
+
+
+if __name__ == "__main__":
+    unittest.main()
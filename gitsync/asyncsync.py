@@ -0,0 +1,441 @@
+import asyncio
+import os
+import sys
+import time
+from functools import partial
+from typing import Callable, TextIO
+
+from repostate import (
+    git_dir,
+    read_ref,
+    read_remote_url,
+    load_state,
+    save_state,
+    is_unchanged,
+    take_snapshot,
+    cached_ahead_behind,
+    remember_ahead_behind,
+)
+from gitsync import (
+    SyncOptions,
+    SyncResult,
+    commit_message,
+    parse_transfer,
+    timed,
+    REJECTION_MARKERS,
+    PUSH_ATTEMPTS,
+    IN_SYNC,
+    MERGED,
+    PUSHED,
+    CONFLICT,
+    ERROR,
+    RESET,
+    BOLD,
+    BLUE,
+    GREEN,
+    YELLOW,
+    RED,
+)
+
+QUEUED = "queued"
+RUNNING = "running"
+
+# Number of running repositories listed in the rolling summary
+SUMMARY_RUNNING_ROWS = 5
+
+# Seconds between two checks of the budget of a throttled host
+HOST_POLL_INTERVAL = 0.1
+
+
+class GitError(Exception):
+    """A git command exited with a non-zero status
+
+    Args:
+        args: The git arguments that failed.
+        status: The exit status of the git process.
+        lines: The output lines of the git process.
+    """
+
+    def __init__(self, args: tuple, status: int, lines: list[str]):
+        self.status = status
+        self.lines = lines
+        last = lines[-1] if lines else ""
+        super().__init__(f"git {' '.join(args)} failed with exit code {status}: {last}")
+
+
+async def run_git(path: str, *args: str, emit=None, check: bool = True) -> list[str]:
+    """Run a git command and stream its output line by line
+
+    Args:
+        path: Repository the command runs in.
+        *args: The git arguments eg. "fetch", "origin".
+        emit: Function called with every output line as soon as it is read, None to stay quiet.
+        check: Raise a GitError if the command fails.
+
+    Returns:
+        list[str]: The output lines (stdout and stderr combined).
+    """
+    process = await asyncio.create_subprocess_exec(
+        "git",
+        *args,
+        cwd=path,
+        # Never wait for credentials on a terminal nobody watches
+        env=dict(os.environ, GIT_TERMINAL_PROMPT="0"),
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+
+    lines = []
+    async for raw in process.stdout:
+        # Progress meters redraw their line with carriage returns, keep the final state
+        line = raw.decode(errors="replace").rstrip().rpartition("\r")[2]
+        lines.append(line)
+        if emit and line:
+            emit(line)
+
+    status = await process.wait()
+    if check and status != 0:
+        raise GitError(args, status, lines)
+
+    return lines
+
+
+async def remote_changed_async(
+    path: str, gdir: str, remote: str, upstream: str, heads_cache: dict = None, url: str = ""
+) -> bool:
+    """Check with ls-remote if the upstream branch moved since the last fetch
+
+    All branches of the remote are asked for at once and kept in `heads_cache`,
+    so clones of the same remote are probed once per run. A clone that needs
+    the heads while the first probe of its URL is still running waits for it.
+
+    Args:
+        path: Path to the local Git repository.
+        gdir: Path to the git directory.
+        remote: Name of the remote repository.
+        upstream: Full name of the remote tracking ref eg. "refs/remotes/origin/main".
+        heads_cache: Remote URL -> {ref: SHA} shared between repositories of one run, None to always ask the remote.
+        url: URL of the remote, the key in `heads_cache`.
+
+    Returns:
+        bool: True if the remote branch differs from the remote tracking ref.
+    """
+    branch = "refs/heads/" + upstream.removeprefix(f"refs/remotes/{remote}/")
+    shared = heads_cache is not None and bool(url)
+
+    heads = heads_cache.get(url) if shared else None
+    if isinstance(heads, asyncio.Future):
+        heads = await heads  # None if that probe failed, then this clone asks on its own
+
+    if heads is None:
+        probe = asyncio.get_running_loop().create_future()
+        if shared:
+            heads_cache[url] = probe
+        try:
+            lines = await run_git(path, "ls-remote", "--heads", remote)
+            heads = {ref: sha for sha, _, ref in (line.partition("\t") for line in lines) if ref}
+        finally:
+            # A failed probe is not cached, and a push may have dropped this one from the cache meanwhile
+            if shared and heads_cache.get(url) is probe:
+                if heads is None:
+                    heads_cache.pop(url)
+                else:
+                    heads_cache[url] = heads
+            probe.set_result(heads)
+
+    return heads.get(branch, "") != read_ref(gdir, upstream)
+
+
+def count_transfer(lines: list[str]) -> tuple[int, int]:
+    """Add up the objects and bytes reported by the progress output of a fetch or push
+
+    Args:
+        lines: Output lines of a git command run with `--progress`.
+
+    Returns:
+        tuple: `(objects, bytes)`, zeros if nothing was transferred.
+    """
+    objects = size = 0
+    for transfer in filter(None, map(parse_transfer, lines)):
+        objects, size = max(objects, transfer[0]), max(size, transfer[1])
+
+    return objects, size
+
+
+async def sync_repo_async(path: str, options: SyncOptions = None, emit=None) -> SyncResult:
+    """Synchronize a local repository with its upstream branch using the git CLI
+
+    This is the asyncio counterpart of `gitsync.sync_repo`. Local changes are
+    committed with the same automatic message, then the ahead/behind counts
+    against the upstream decide between fast-forward, push, or merge (or
+    rebase) and push.
+
+    Args:
+        path: Path to the local Git repository.
+        options: A SyncOptions object, the defaults are used if None. `out` is ignored.
+        emit: Function called with every output line of the repository.
+
+    Returns:
+        SyncResult: The outcome of the synchronization.
+    """
+    options = options or SyncOptions()
+    remote = options.remote
+    emit = emit or (lambda line: None)
+    result = SyncResult(path)
+    start = time.monotonic()
+
+    try:
+        gdir = git_dir(path)
+        with timed(result, "snapshot"):
+            state = load_state(gdir)
+            # The tree walk is blocking file system work, keep it off the event loop
+            clean = options.snapshot and await asyncio.to_thread(is_unchanged, path, gdir, state)
+
+        # Checking for untracked, modified and deleted files
+        with timed(result, "status"):
+            status = [] if clean else await run_git(path, "status", "--porcelain")
+        for line in status:
+            code = line[:2]
+            if code == "??":
+                result.untracked += 1
+            elif "D" in code:
+                result.deleted += 1
+            else:
+                result.modified += 1
+            emit(line)
+
+        if result.untracked or result.modified or result.deleted:
+            with timed(result, "staging"):
+                await run_git(path, "add", "--all", emit=emit)
+            with timed(result, "commit"):
+                await run_git(path, "commit", "--quiet", "-m", commit_message(result), emit=emit)
+            result.committed = True
+            emit("Committed changes locally")
+        elif clean:
+            emit("No changes in the working tree since the last sync")
+        else:
+            emit("No changes found in local repository")
+
+        with timed(result, "probe"):
+            # Never from the saved state, the checked out branch or its upstream may have changed since
+            upstream = (await run_git(path, "rev-parse", "--symbolic-full-name", "@{upstream}"))[0]
+            url = read_remote_url(gdir, remote)
+            mirror = (options.fetch_sources or {}).get(url)
+            changed = not options.probe or await remote_changed_async(
+                path, gdir, remote, upstream, options.heads_cache, url
+            )
+
+        if changed and mirror:
+            # The objects are shared through alternates, only the remote tracking refs move
+            with timed(result, "fetch"):
+                await run_git(path, "fetch", "--quiet", "--no-tags", mirror, f"+refs/heads/*:refs/remotes/{remote}/*")
+            emit("Fetched from the shared object cache")
+        elif changed:
+            with timed(result, "fetch"):
+                lines = await run_git(path, "fetch", "--progress", remote, emit=emit)
+            result.fetch_objects, result.fetch_bytes = count_transfer(lines)
+        else:
+            emit("Remote branch unchanged since the last fetch, skipping the fetch")
+
+        # A rejected push is fetched from the remote itself and synced again
+        branch = "refs/heads/" + upstream.removeprefix(f"refs/remotes/{remote}/")
+        for attempt in range(PUSH_ATTEMPTS):
+            with timed(result, "merge"):
+                local, remote_sha = read_ref(gdir, "HEAD"), read_ref(gdir, upstream)
+                cached = cached_ahead_behind(state, local, remote_sha)
+                if cached:
+                    ahead, behind = cached[1], cached[2]
+                else:
+                    try:
+                        base = (await run_git(path, "merge-base", local, remote_sha))[0]
+                    except GitError as e:
+                        if e.status != 1:
+                            raise
+                        # Unrelated histories have no merge-base, retrying cannot help
+                        emit(
+                            f"{BOLD}Unrelated histories detected.{RESET} {RED}Please merge manually using `git merge --allow-unrelated-histories` if necessary.{RESET}"
+                        )
+                        result.outcome = ERROR
+                        result.error = "Unrelated histories"
+                        return result
+                    counts = await run_git(path, "rev-list", "--left-right", "--count", f"{local}...{remote_sha}")
+                    ahead, behind = (int(count) for count in counts[0].split())
+                    remember_ahead_behind(state, local, remote_sha, base, ahead, behind)
+
+            if ahead == 0 and behind == 0:
+                emit("Both Local and Remote Repositories are in SYNC")
+
+            elif ahead == 0:
+                with timed(result, "merge"):
+                    await run_git(path, "merge", "--ff-only", "@{upstream}", emit=emit)
+                result.outcome = MERGED
+
+            else:
+                if behind > 0:
+                    strategy = options.strategy
+                    combine = ("rebase",) if strategy == "rebase" else ("merge", "--no-edit")
+                    try:
+                        with timed(result, "merge"):
+                            await run_git(path, *combine, "@{upstream}", emit=emit)
+                    except GitError as e:
+                        if not any("conflict" in line.lower() for line in e.lines):
+                            raise
+                        await run_git(path, strategy, "--abort", check=False)
+                        emit(f"{RED}Conflict detected, the {strategy} was aborted. Please resolve conflicts manually.{RESET}")
+                        result.outcome = CONFLICT
+                        return result
+
+                try:
+                    with timed(result, "push"):
+                        lines = await run_git(path, "push", "--progress", emit=emit)
+                except GitError as e:
+                    if attempt == PUSH_ATTEMPTS - 1 or not any(marker in line for line in e.lines for marker in REJECTION_MARKERS):
+                        raise
+                    # The probe or the shared object cache was outdated, another clone pushed in the meantime
+                    emit(f"{YELLOW}The push was rejected, fetching {remote} directly and syncing again{RESET}")
+                    with timed(result, "fetch"):
+                        lines = await run_git(path, "fetch", "--progress", remote, emit=emit)
+                    result.fetch_objects, result.fetch_bytes = count_transfer(lines)
+                    continue
+                finally:
+                    if url and options.heads_cache is not None:
+                        options.heads_cache.pop(url, None)
+
+                result.push_objects, result.push_bytes = count_transfer(lines)
+                result.outcome = PUSHED
+                if mirror:
+                    # Clones that fetch from the mirror later must see this push, a newer one is never overwritten
+                    await run_git(path, "push", "--quiet", mirror, f"HEAD:{branch}", check=False)
+            break
+
+        if options.snapshot:
+            with timed(result, "snapshot"):
+                save_state(gdir, await asyncio.to_thread(take_snapshot, path, gdir, upstream, state))
+
+    except (GitError, OSError, ValueError, IndexError) as e:
+        emit(f"{RED}Error: {e}{RESET}")
+        result.outcome = ERROR
+        result.error = str(e)
+
+    finally:
+        result.duration = time.monotonic() - start
+
+    return result
+
+
+def print_summary(board: dict, final: bool = False, out: TextIO = None) -> None:
+    """Print the summary table of an asyncio run
+
+    Args:
+        board: Repository path -> [state, start time, SyncResult].
+        final: Print one row per repository instead of the rolling counters.
+        out: Stream the table is written to, `sys.stdout` if None.
+    """
+    log = partial(print, file=out or sys.stdout)
+    now = time.monotonic()
+    counts = {}
+    for state, _, result in board.values():
+        key = result.outcome if result else state
+        counts[key] = counts.get(key, 0) + 1
+
+    log(f"\n{BOLD}{BLUE}{'Status':<12}{'Repositories':>12}{RESET}")
+    for key in (QUEUED, RUNNING, IN_SYNC, MERGED, PUSHED, CONFLICT, ERROR):
+        if counts.get(key):
+            colour = RED if key in (CONFLICT, ERROR) else GREEN
+            log(f"{colour}{key:<12}{RESET}{counts[key]:>12}")
+
+    if final:
+        log(f"\n{BOLD}{BLUE}{'Repository':<60}{'Outcome':<12}{'Seconds':>8}{RESET}")
+        for path, (_, _, result) in board.items():
+            colour = GREEN if result.ok else RED
+            log(f"{path:<60}{colour}{result.outcome:<12}{RESET}{result.duration:>8.1f}")
+        return
+
+    running = sorted(
+        (start, path) for path, (state, start, _) in board.items() if state == RUNNING
+    )
+    for start, path in running[:SUMMARY_RUNNING_ROWS]:
+        log(f"\t{YELLOW}{path}{RESET} running for {now - start:.0f}s")
+
+
+async def sync_all(
+    repo_paths: list[str],
+    jobs: int,
+    options: SyncOptions = None,
+    summary_interval: float = 5.0,
+    jsonl: bool = False,
+    on_result: Callable = None,
+    limits=None,
+) -> list[SyncResult]:
+    """Synchronize many repositories concurrently from one event loop
+
+    At most `jobs` repositories are synchronized at the same time. The output
+    of every git process is printed live, each line prefixed with the name of
+    its repository, and a summary table is printed every `summary_interval`
+    seconds and once all repositories are done.
+
+    With `jsonl` all of that goes to stderr and stdout only receives one
+    JSON record per repository, written as soon as the repository is done.
+
+    Args:
+        repo_paths: Repository paths in the order they should be started.
+        jobs: Maximum number of repositories synchronized at once.
+        options: A SyncOptions object shared by all repositories.
+        summary_interval: Seconds between two rolling summaries, 0 to disable them.
+        jsonl: Write the SyncResult of every repository to stdout as a JSON line.
+        on_result: Function called with the SyncResult of every repository as soon as it is done.
+        limits: A hostlimit.HostLimits, repositories wait for the budget of their host
+            before they take one of the `jobs` slots.
+
+    Returns:
+        list[SyncResult]: The results in the order of `repo_paths`.
+    """
+    semaphore = asyncio.Semaphore(jobs)
+    board = {path: [QUEUED, None, None] for path in repo_paths}
+    out = sys.stderr if jsonl else sys.stdout
+    log = partial(print, file=out)
+
+    async def one(path: str) -> SyncResult:
+        name = os.path.basename(os.path.normpath(path))
+        prefix = f"{YELLOW}[{name}]{RESET} "
+
+        # A throttled host must not hold slots that repositories on other hosts could use
+        while limits and not limits.try_start(path):
+            await asyncio.sleep(HOST_POLL_INTERVAL)
+
+        try:
+            async with semaphore:
+                board[path][:2] = [RUNNING, time.monotonic()]
+                log(f"{prefix}{BOLD}{BLUE}Starting synchronization{RESET}")
+                result = await sync_repo_async(path, options, emit=lambda line: log(prefix + line))
+                board[path][2] = result
+        finally:
+            if limits:
+                limits.done(path)
+
+        if jsonl:
+            sys.stdout.write(result.to_json() + "\n")
+        if on_result:
+            on_result(result)
+        if result.ok:
+            log(f"{prefix}{BOLD}{GREEN}Synchronization completed successfully{RESET} ({result.outcome})")
+        else:
+            log(f"{prefix}{BOLD}{RED}Error occurred:{RESET} {result.outcome} {result.error}")
+        return result
+
+    async def summaries():
+        while True:
+            await asyncio.sleep(summary_interval)
+            print_summary(board, out=out)
+
+    reporter = asyncio.create_task(summaries()) if summary_interval > 0 else None
+    try:
+        results = await asyncio.gather(*(one(path) for path in repo_paths))
+    finally:
+        if reporter:
+            reporter.cancel()
+
+    out.flush()
+    print_summary(board, final=True, out=out)
+    return results
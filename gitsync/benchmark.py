@@ -0,0 +1,508 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# ANSI color codes
+RESET = "\033[0m"
+BOLD = "\033[1m"
+BLUE = "\033[1;34m"
+GREEN = "\033[1;32m"
+YELLOW = "\033[1;33m"
+RED = "\033[1;31m"
+
+SCENARIOS = ("clean", "dirty", "ahead", "behind", "diverged", "untracked", "large")
+TARGETS = ("gitsync", "multisync", "multisync-async")
+
+# Command lines of gitsync.py measured by --startup, "{repo}" is a synced repository
+STARTUP_COMMANDS = {
+    "help": ["--help"],
+    "status": ["--status", "{repo}"],
+    "dry-run": ["--dry-run", "{repo}"],
+}
+
+# Packages of GitPython, importing any of them on a --startup command is a regression
+HEAVY_IMPORTS = ("git", "gitdb", "smmap")
+PHASES = ("snapshot", "status", "staging", "commit", "probe", "fetch", "merge", "push")
+
+HELP_MESSAGE = f"""
+{BLUE}\t\t********** GITSYNC BENCHMARK **********{RESET}
+
+{GREEN}\tDescription:{RESET}
+\tGenerates local repositories with `file://` bare remotes in known states and measures how long
+\tgitsync.py and multisync.py take to synchronize them. Everything runs offline.
+
+{GREEN}\tUsage:{RESET}
+\t\t{YELLOW}python benchmark.py [Options]{RESET}
+
+{GREEN}\tOptions:{RESET}
+\t\t--repos <N>          : Number of repositories, spread evenly over the scenarios (default: 14).
+\t\t--scenarios <A,B,..> : Comma separated scenarios (default: {",".join(SCENARIOS)}).
+\t\t--targets <A,B,..>   : Comma separated targets (default: {",".join(TARGETS)}).
+\t\t--runs <N>           : Runs per target, every run starts from fresh copies of the repositories (default: 3).
+\t\t--jobs <N>           : Parallel jobs passed to multisync.py (default: 4).
+\t\t--files <N>          : Tracked files in every repository (default: 50).
+\t\t--untracked <N>      : Untracked files created in the "untracked" scenario (default: 2000).
+\t\t--large <N>          : Tracked files in the "large" scenario (default: 20000).
+\t\t--workdir <Dir>      : Directory the repositories are generated in and kept (default: a temporary directory).
+\t\t--keep               : Keep the temporary directory with the generated repositories.
+\t\t--format <text|jsonl>: Print a table or one JSON record per target (default: text).
+\t\t--startup            : Measure how fast gitsync.py starts for --help, --status and --dry-run under
+\t\t                       `python -X importtime` instead of running the sync targets. Fails if GitPython is imported.
+\t\t--startup-budget <ms>: With --startup, also fail if the median import time of a command exceeds this.
+
+{GREEN}\tScenarios:{RESET}
+\t- clean     : Nothing to do.
+\t- dirty     : Modified and deleted tracked files.
+\t- ahead     : Local commits that are not pushed yet.
+\t- behind    : Remote commits that are not fetched yet.
+\t- diverged  : Both, touching different files so they merge cleanly.
+\t- untracked : Many new files in nested directories.
+\t- large     : A clean repository with a large tree.
+
+{GREEN}\tOutput:{RESET}
+\t- Median wall clock time of the runs and the median time spent in every sync phase, summed over repositories.
+\t- Peak resident memory of the largest process the target started.
+\t- Number of git commands the target started, counted through a wrapper placed first on PATH.
+\t- With --startup: median wall clock and import time of every command and the GitPython packages it imported.
+
+{BLUE}\n\t\t********** END OF HELP MESSAGE **********{RESET}
+"""
+
+# Fixed identity and no user or system configuration, so every run sees the same git
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "gitsync benchmark",
+    "GIT_AUTHOR_EMAIL": "benchmark@localhost",
+    "GIT_COMMITTER_NAME": "gitsync benchmark",
+    "GIT_COMMITTER_EMAIL": "benchmark@localhost",
+    "GIT_CONFIG_NOSYSTEM": "1",
+    "GIT_TERMINAL_PROMPT": "0",
+}
+
+# Counts every git command started through PATH, then runs the real git
+GIT_WRAPPER = """#!/bin/sh
+echo "$1" >> "$GITSYNC_BENCH_LOG"
+exec "{git}" "$@"
+"""
+
+
+def git(cwd: str, *args: str) -> None:
+    subprocess.run(["git", *args], cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def write_files(root: str, count: int, prefix: str = "file", per_dir: int = 100) -> None:
+    """Create `count` small files, `per_dir` per directory
+
+    Args:
+        root: Directory the files are created in.
+        count: Number of files.
+        prefix: Prefix of the file names.
+        per_dir: Files per sub directory.
+    """
+    for i in range(count):
+        directory = os.path.join(root, f"{prefix}-dir{i // per_dir:04d}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{prefix}{i:06d}.txt"), "w") as file:
+            file.write(f"{prefix} {i}\n")
+
+
+def commit_file(repo: str, name: str, content: str, message: str) -> None:
+    with open(os.path.join(repo, name), "w") as file:
+        file.write(content)
+    git(repo, "add", name)
+    git(repo, "commit", "-q", "-m", message)
+
+
+def build_repo(root: str, name: str, scenario: str, files: int, untracked: int, large: int) -> str:
+    """Create a repository and its bare `file://` origin in the given scenario
+
+    Args:
+        root: Directory holding all generated repositories.
+        name: Name of the repository.
+        scenario: One of `SCENARIOS`.
+        files: Number of tracked files.
+        untracked: Number of untracked files of the "untracked" scenario.
+        large: Number of tracked files of the "large" scenario.
+
+    Returns:
+        str: Path to the working tree.
+    """
+    origin = os.path.join(root, "origins", f"{name}.git")
+    seed = os.path.join(root, "seeds", name)
+    repo = os.path.join(root, "repos", name)
+
+    git(root, "init", "-q", "--bare", "-b", "main", origin)
+    git(root, "init", "-q", "-b", "main", seed)
+    write_files(seed, large if scenario == "large" else files)
+    git(seed, "add", "--all")
+    git(seed, "commit", "-q", "-m", "Initial commit")
+    git(seed, "push", "-q", f"file://{origin}", "main")
+    git(root, "clone", "-q", f"file://{origin}", repo)
+
+    if scenario == "dirty":
+        first = os.path.join(repo, "file-dir0000")
+        names = sorted(os.listdir(first))
+        for entry in names[:-1]:
+            with open(os.path.join(first, entry), "a") as file:
+                file.write("changed\n")
+        os.remove(os.path.join(first, names[-1]))
+
+    if scenario in ("behind", "diverged"):
+        commit_file(seed, "remote.txt", "remote change\n", "Remote change")
+        git(seed, "push", "-q", f"file://{origin}", "main")
+
+    if scenario in ("ahead", "diverged"):
+        commit_file(repo, "local.txt", "local change\n", "Local change")
+
+    if scenario == "untracked":
+        write_files(repo, untracked, prefix="new")
+
+    return repo
+
+
+def build_fixtures(root: str, names: list[tuple[str, str]], args) -> list[str]:
+    """Generate all repositories of the benchmark
+
+    Args:
+        root: Directory the repositories are generated in.
+        names: (repository name, scenario) pairs.
+        args: The parsed command line.
+
+    Returns:
+        list: Paths to the working trees.
+    """
+    for sub in ("origins", "seeds", "repos"):
+        os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    return [build_repo(root, name, scenario, args.files, args.untracked, args.large) for name, scenario in names]
+
+
+def fresh_copy(template: str, run_dir: str) -> None:
+    """Copy the generated origins and working trees, pointing the copies at the copied origins
+
+    Args:
+        template: Directory holding the generated repositories.
+        run_dir: Directory of this run, replaced if it exists.
+    """
+    shutil.rmtree(run_dir, ignore_errors=True)
+    for sub in ("origins", "repos"):
+        shutil.copytree(os.path.join(template, sub), os.path.join(run_dir, sub), symlinks=True)
+
+    repos = os.path.join(run_dir, "repos")
+    for name in os.listdir(repos):
+        config = os.path.join(repos, name, ".git", "config")
+        with open(config, "r") as file:
+            text = file.read()
+        with open(config, "w") as file:
+            file.write(text.replace(os.path.join(template, "origins"), os.path.join(run_dir, "origins")))
+
+
+def run_measured(command: list[str], env: dict) -> tuple[float, int, list[str]]:
+    """Run a command and measure its wall clock time and peak memory
+
+    Args:
+        command: The command line.
+        env: Environment of the process.
+
+    Returns:
+        tuple: (seconds, peak RSS in KiB of the largest process of the tree, stdout lines).
+    """
+    start = time.perf_counter()
+    with tempfile.TemporaryFile() as out:
+        process = subprocess.Popen(command, env=env, stdout=out, stderr=subprocess.DEVNULL)
+        # wait4 reports the resources of this child and its waited descendants only
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = time.perf_counter() - start
+
+        out.seek(0)
+        lines = out.read().decode(errors="replace").splitlines()
+
+    return elapsed, usage.ru_maxrss, lines
+
+
+def run_target(target: str, repos: list[str], run_dir: str, env: dict, args) -> dict:
+    """Synchronize all repositories of a run with one target
+
+    Args:
+        target: One of `TARGETS`.
+        repos: Paths to the working trees of the run.
+        run_dir: Directory of the run.
+        env: Environment with the git wrapper first on PATH.
+        args: The parsed command line.
+
+    Returns:
+        dict: Wall time, phase totals, peak RSS, git command count and outcomes of the run.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    gitsync_path = os.path.join(here, "gitsync.py")
+    log_path = os.path.join(run_dir, "git-commands.log")
+    env = dict(env, GITSYNC_BENCH_LOG=log_path)
+    open(log_path, "w").close()
+
+    if target == "gitsync":
+        elapsed, rss, lines = 0.0, 0, []
+        for repo in repos:
+            seconds, peak, output = run_measured([sys.executable, gitsync_path, "--format", "jsonl", repo], env)
+            elapsed, rss, lines = elapsed + seconds, max(rss, peak), lines + output
+    else:
+        list_path = os.path.join(run_dir, "repos.txt")
+        with open(list_path, "w") as file:
+            file.write("\n".join(repos) + "\n")
+
+        command = [sys.executable, os.path.join(here, "multisync.py"), "--format", "jsonl", "-j", str(args.jobs)]
+        command += ["--state-dir", os.path.join(run_dir, "state")]
+        if target == "multisync-async":
+            command += ["--async", "--summary", "0"]
+        elapsed, rss, lines = run_measured(command + [gitsync_path, list_path], env)
+
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+
+    phases = {phase: 0.0 for phase in PHASES}
+    outcomes = {}
+    for record in records:
+        if record.get("type") != "repo":
+            continue
+        outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+        for phase, seconds in record["timings"].items():
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+    with open(log_path, "r") as file:
+        commands = sum(1 for _ in file)
+
+    return {"wall": elapsed, "phases": phases, "rss_kib": rss, "git_commands": commands, "outcomes": outcomes}
+
+
+def parse_importtime(report: str) -> tuple[float, set]:
+    """Read the report that `python -X importtime` writes to stderr
+
+    Args:
+        report: The stderr of the process.
+
+    Returns:
+        tuple: (seconds spent in top level imports, names of every imported module).
+    """
+    total, modules = 0, set()
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented by two spaces per level, their time is in their parent's
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+        modules.add(name.strip())
+
+    return total / 1e6, modules
+
+
+def run_startup(repo: str, env: dict, runs: int) -> list[dict]:
+    """Measure the startup of the gitsync.py commands that must not import GitPython
+
+    Args:
+        repo: A repository that gitsync.py synced before.
+        env: Environment of the processes.
+        runs: Runs per command.
+
+    Returns:
+        list: One record per command of `STARTUP_COMMANDS` with median times and the heavy packages imported.
+    """
+    gitsync_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gitsync.py")
+    records = []
+    for name, arguments in STARTUP_COMMANDS.items():
+        command = [sys.executable, "-X", "importtime", gitsync_path] + [arg.format(repo=repo) for arg in arguments]
+        walls, imports, heavy = [], [], set()
+        for _ in range(runs):
+            start = time.perf_counter()
+            process = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            walls.append(time.perf_counter() - start)
+
+            seconds, modules = parse_importtime(process.stderr)
+            imports.append(seconds)
+            heavy |= {module for module in modules if module.partition(".")[0] in HEAVY_IMPORTS}
+
+        records.append(
+            {
+                "type": "startup",
+                "command": name,
+                "runs": runs,
+                "wall_median": statistics.median(walls),
+                "import_median": statistics.median(imports),
+                "heavy_imports": sorted(heavy),
+            }
+        )
+    return records
+
+
+def summarize(target: str, runs: list[dict]) -> dict:
+    """Reduce the runs of a target to medians
+
+    Args:
+        target: One of `TARGETS`.
+        runs: Results of `run_target`.
+
+    Returns:
+        dict: The benchmark record of the target.
+    """
+    return {
+        "type": "benchmark",
+        "target": target,
+        "runs": len(runs),
+        "wall_median": statistics.median(run["wall"] for run in runs),
+        "wall_min": min(run["wall"] for run in runs),
+        "phases": {phase: statistics.median(run["phases"][phase] for run in runs) for phase in runs[0]["phases"]},
+        "peak_rss_mib": max(run["rss_kib"] for run in runs) / 1024,
+        "git_commands": statistics.median(run["git_commands"] for run in runs),
+        "outcomes": runs[-1]["outcomes"],
+    }
+
+
+def print_table(records: list[dict]) -> None:
+    print(
+        f"\n{BOLD}{BLUE}{'Target':<18}{'Wall (s)':>10}{'Min (s)':>10}{'RSS (MiB)':>11}{'git cmds':>10}  Outcomes{RESET}"
+    )
+    for record in records:
+        outcomes = ", ".join(f"{key} {count}" for key, count in sorted(record["outcomes"].items()))
+        print(
+            f"{record['target']:<18}{record['wall_median']:>10.2f}{record['wall_min']:>10.2f}"
+            f"{record['peak_rss_mib']:>11.1f}{record['git_commands']:>10.0f}  {outcomes}"
+        )
+
+    print(f"\n{BOLD}{BLUE}{'Phase (s)':<18}" + "".join(f"{record['target']:>18}" for record in records) + RESET)
+    for phase in PHASES:
+        print(f"{phase:<18}" + "".join(f"{record['phases'].get(phase, 0.0):>18.3f}" for record in records))
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    """Parse the command line, printing the help message on any error
+
+    Args:
+        argv: The command line arguments without the script name.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+
+    parser.add_argument("-h", "--help", action="store_true")
+    parser.add_argument("--repos", type=int, default=14)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--untracked", type=int, default=2000)
+    parser.add_argument("--large", type=int, default=20000)
+    parser.add_argument("--workdir")
+    parser.add_argument("--keep", action="store_true")
+    parser.add_argument("--format", choices=("text", "jsonl"), default="text")
+    parser.add_argument("--startup", action="store_true")
+    parser.add_argument("--startup-budget", type=float)
+
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit:
+        print(HELP_MESSAGE)
+        sys.exit(1)
+
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    args.targets = [name for name in args.targets.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS) | set(args.targets) - set(TARGETS)
+
+    if args.help or unknown or not args.scenarios or args.repos < 1 or args.runs < 1 or args.files < 1:
+        print(HELP_MESSAGE)
+        sys.exit(1)
+
+    return args
+
+
+if __name__ == "__main__":
+
+    args = parse_args(sys.argv[1:])
+    log = print if args.format == "text" else lambda *a: print(*a, file=sys.stderr)
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="gitsync-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    template = os.path.join(workdir, "template")
+
+    real_git = shutil.which("git")
+    if not real_git:
+        print(f"{BOLD}{RED}Error:{RESET} git not found on PATH")
+        sys.exit(1)
+
+    # Isolated HOME: no user configuration, hooks or credential helpers
+    home = os.path.join(workdir, "home")
+    wrapper_dir = os.path.join(workdir, "bin")
+    os.makedirs(home, exist_ok=True)
+    os.makedirs(wrapper_dir, exist_ok=True)
+    with open(os.path.join(wrapper_dir, "git"), "w") as file:
+        file.write(GIT_WRAPPER.format(git=real_git))
+    os.chmod(os.path.join(wrapper_dir, "git"), 0o755)
+
+    env = dict(os.environ, **GIT_ENV, HOME=home)
+    os.environ.update(GIT_ENV, HOME=home)
+    env["PATH"] = wrapper_dir + os.pathsep + env.get("PATH", "")
+
+    if args.startup:
+        try:
+            # One synced repository, so --status and --dry-run have a saved state to read
+            build_fixtures(template, [("startup", "clean")], args)
+            repo = os.path.join(template, "repos", "startup")
+            run_measured([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "gitsync.py"), repo], env)
+
+            failed = False
+            log(f"\n{BOLD}{BLUE}{'Command':<12}{'Wall (ms)':>11}{'Imports (ms)':>14}  GitPython{RESET}")
+            for record in run_startup(repo, env, args.runs):
+                over = args.startup_budget is not None and record["import_median"] * 1000 > args.startup_budget
+                failed = failed or over or bool(record["heavy_imports"])
+                if args.format == "jsonl":
+                    print(json.dumps(record))
+                heavy = f"{RED}{', '.join(record['heavy_imports'])}{RESET}" if record["heavy_imports"] else "not imported"
+                budget = f"  {RED}over the budget of {args.startup_budget:g} ms{RESET}" if over else ""
+                log(
+                    f"{record['command']:<12}{record['wall_median'] * 1000:>11.1f}"
+                    f"{record['import_median'] * 1000:>14.1f}  {heavy}{budget}"
+                )
+        finally:
+            if not args.keep and not args.workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+        sys.exit(1 if failed else 0)
+
+    try:
+        scenarios = [args.scenarios[i % len(args.scenarios)] for i in range(args.repos)]
+        names = [(f"{scenario}-{i:03d}", scenario) for i, scenario in enumerate(scenarios)]
+        log(f"{BOLD}{BLUE}Generating {len(names)} repositories in {YELLOW}{template}{RESET}")
+        start = time.perf_counter()
+        shutil.rmtree(template, ignore_errors=True)
+        build_fixtures(template, names, args)
+        log(f"Generated in {time.perf_counter() - start:.1f}s")
+
+        records = []
+        for target in args.targets:
+            runs = []
+            for run in range(args.runs):
+                run_dir = os.path.join(workdir, "run")
+                fresh_copy(template, run_dir)
+                repos = [os.path.join(run_dir, "repos", name) for name, _ in names]
+                runs.append(run_target(target, repos, run_dir, env, args))
+                log(f"{YELLOW}{target}{RESET} run {run + 1}/{args.runs}: {runs[-1]['wall']:.2f}s")
+
+            records.append(summarize(target, runs))
+            if args.format == "jsonl":
+                print(json.dumps(records[-1]))
+
+        if args.format == "text":
+            print_table(records)
+
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+DISCOVERY_FILE = "discovery.json"
+
+# Directories that hold thousands of subdirectories and never a repository worth syncing
+DEFAULT_IGNORES = ("node_modules", "__pycache__", ".venv", "venv", ".tox", ".cache", ".Trash*")
+
+
+def is_repository(path: str) -> bool:
+    """Check that a path is the working tree of a git repository
+
+    Args:
+        path: Path to check.
+
+    Returns:
+        bool: True if it holds a `.git` directory, or a `.git` file (worktrees and submodules).
+    """
+    return os.path.exists(os.path.join(path, ".git"))
+
+
+def load_cache(state_dir: str, ignores: tuple[str, ...]) -> dict:
+    """Load the directories listed by previous discoveries
+
+    Args:
+        state_dir: Directory holding the multisync state files.
+        ignores: The ignore patterns of this discovery, a cache built with others is dropped.
+
+    Returns:
+        dict: Directory path -> {"mtime": ns, "repo": bool, "children": [names]}.
+    """
+    try:
+        with open(os.path.join(state_dir, DISCOVERY_FILE), "r") as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+    if cache.get("ignores") != list(ignores):
+        return {}
+    return cache.get("directories", {})
+
+
+def save_cache(state_dir: str, ignores: tuple[str, ...], directories: dict) -> None:
+    """Atomically write the directories listed by this discovery"""
+    os.makedirs(state_dir, exist_ok=True)
+    path = os.path.join(state_dir, DISCOVERY_FILE)
+
+    with open(path + ".tmp", "w") as file:
+        json.dump({"ignores": list(ignores), "directories": directories}, file, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def scan_directory(path: str, ignores: tuple[str, ...], cached: dict = None) -> tuple[dict, bool]:
+    """List one directory, or reuse its cached listing if it did not change
+
+    The mtime of a directory changes whenever an entry is added, removed or
+    renamed in it, so an unchanged mtime means an unchanged list of
+    subdirectories (and an unchanged `.git` entry). Changes deeper down only
+    touch the mtime of their own directory, which is checked on its own.
+
+    Args:
+        path: Directory to list.
+        ignores: fnmatch patterns of directory names that are not descended into.
+        cached: The entry of this directory in the cache, if any.
+
+    Returns:
+        tuple: ({"mtime": ns, "repo": bool, "children": [names]}, True if it was listed).
+    """
+    mtime = os.stat(path).st_mtime_ns
+    if cached and cached["mtime"] == mtime:
+        return cached, False
+
+    repo, children = False, []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name == ".git":
+                repo = True
+            elif entry.is_dir(follow_symlinks=False) and not any(fnmatch(entry.name, pattern) for pattern in ignores):
+                children.append(entry.name)
+
+    # Nested repositories (submodules, vendored clones) are synced by their parent
+    return {"mtime": mtime, "repo": repo, "children": [] if repo else sorted(children)}, True
+
+
+def discover(
+    roots: list[str], state_dir: str, ignores: tuple[str, ...] = DEFAULT_IGNORES, jobs: int = 16, log=print
+) -> list[str]:
+    """Find the git repositories below some root directories
+
+    The trees are walked in parallel, every directory is listed by a pool
+    thread (`os.scandir` releases the GIL). A directory holding `.git` is a
+    repository and is not descended into. The listing of every directory is
+    cached with its mtime in the state directory, so the next discovery only
+    lists the directories that changed and merely stats the others.
+
+    Args:
+        roots: Directories to search.
+        state_dir: Directory holding the multisync state files.
+        ignores: fnmatch patterns of directory names that are not descended into.
+        jobs: Number of directories listed at the same time.
+        log: Function used to print the progress messages.
+
+    Returns:
+        list: Absolute paths of the repositories found, sorted.
+    """
+    start = time.monotonic()
+    ignores = tuple(ignores)
+    cache = load_cache(state_dir, ignores)
+    directories = {}
+    repos = []
+    listed = 0
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        running = {}
+        for root in dict.fromkeys(os.path.abspath(root) for root in roots):
+            running[pool.submit(scan_directory, root, ignores, cache.get(root))] = root
+
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path = running.pop(future)
+                try:
+                    entry, fresh = future.result()
+                except OSError as e:
+                    log(f"Cannot search {path}: {e.strerror}")
+                    continue
+
+                directories[path] = entry
+                listed += fresh
+                if entry["repo"]:
+                    repos.append(path)
+
+                for name in entry["children"]:
+                    child = os.path.join(path, name)
+                    running[pool.submit(scan_directory, child, ignores, cache.get(child))] = child
+
+    # Directories that were not reached again are dropped from the cache
+    save_cache(state_dir, ignores, directories)
+    log(
+        f"Discovered {len(repos)} repositories in {len(directories)} directories "
+        f"({listed} listed, {len(directories) - listed} unchanged) in {time.monotonic() - start:.2f}s"
+    )
+    return sorted(repos)
@@ -1,5 +1,33 @@
-from git import Repo, Remote, GitCommandError, FetchInfo
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Callable, TextIO
+from repostate import (
+    RepoState,
+    git_dir,
+    read_ref,
+    load_state,
+    save_state,
+    is_unchanged,
+    take_snapshot,
+    tree_fingerprint,
+    cached_ahead_behind,
+    remember_ahead_behind,
+)
+import os
+import argparse
+import subprocess
+import threading
+import json
 import sys
+import time
+import re
+
+# GitPython takes longer to import than the rest of the script, so it is only
+# imported once a sync runs, and `--help`, `--status` and `--dry-run` never load it
+if TYPE_CHECKING:
+    from git import Repo, Remote, Head, RemoteReference
 
 # ANSI color codes
 RESET = "\033[0m"
@@ -9,216 +37,948 @@ GREEN = "\033[1;32m"
 YELLOW = "\033[1;33m"
 RED = "\033[1;31m"
 
+# Possible outcomes of a synchronization
+IN_SYNC = "in-sync"
+MERGED = "merged"
+PUSHED = "pushed"
+CONFLICT = "conflict"
+ERROR = "error"
+
+# A push refused because the remote moved since the fetch or probe, the remote is fetched and synced again
+REJECTED = "rejected"
+
+# Output of a push the remote refused, eg. because another clone pushed since the fetch
+REJECTION_MARKERS = ("[rejected]", "[remote rejected]", "failed to push some refs")
+
+# Pushes of a repository before a rejection is an error, other clones of the same remote may push in between
+PUSH_ATTEMPTS = 3
+
+# Number of paths written to `git update-index --stdin` at a time
+STAGE_CHUNK_SIZE = 1000
+
+# GitPython's IndexFile.add changes the working directory of the whole process
+# while it hashes the files, so concurrent syncs must not add at the same time
+INDEX_ADD_LOCK = threading.Lock()
+
+# Phases timed in SyncResult.timings, in the order they run
+PHASES = ("snapshot", "status", "staging", "commit", "probe", "fetch", "merge", "push")
 
-def Commit_Dates(repo: Repo, remote: Remote) -> list[int]:
-    """Get the commit dates for the local and remote repositories
+# Final progress line of a transfer eg. "Receiving objects: 100% (3/3), 293.25 KiB | 15.44 MiB/s, done."
+TRANSFER_LINE = re.compile(
+    r"(?:Receiving|Unpacking|Writing) objects:\s+\d+% \((\d+)/\d+\)(?:, ([\d.]+) (bytes|KiB|MiB|GiB))?"
+)
+# Summary of the pack, also printed when git skips the progress of short transfers
+TOTAL_LINE = re.compile(r"Total (\d+) \(delta")
+SIZE_UNITS = {"bytes": 1, "KiB": 1 << 10, "MiB": 1 << 20, "GiB": 1 << 30}
 
-    This function will return a tuple of two integers representing the
-    commit dates for the local and remote repositories. The first element
-    of the tuple is the commit date for the local repository, and the
-    second element is the commit date for the remote repository.
+
+def parse_transfer(line: str) -> tuple[int, int] | None:
+    """Read the object and byte counts from a git fetch/push progress line
+
+    Args:
+        line: A progress line of git eg. "Writing objects: 100% (3/3), 1.20 KiB | 1.20 MiB/s, done."
+
+    Returns:
+        tuple: `(objects, bytes)`, None if the line is not a transfer progress line.
+    """
+    match = TRANSFER_LINE.search(line)
+    if not match:
+        total = TOTAL_LINE.search(line)
+        return (int(total.group(1)), 0) if total else None
+
+    objects, size, unit = match.groups()
+    return int(objects), int(float(size) * SIZE_UNITS[unit]) if size else 0
+
+
+@lru_cache(maxsize=None)
+def transfer_progress_class() -> type:
+    """Build the TransferProgress class on first use, it extends a GitPython class
+
+    Returns:
+        type: A RemoteProgress that collects the number of objects and bytes transferred by a fetch or push.
+    """
+    from git import RemoteProgress
+
+    class TransferProgress(RemoteProgress):
+        """Collects the number of objects and bytes transferred by a fetch or push"""
+
+        def __init__(self):
+            super().__init__()
+            self.objects = 0
+            self.bytes = 0
+
+        def _record(self, line: str) -> None:
+            transfer = parse_transfer(line)
+            if transfer:
+                self.objects = max(self.objects, transfer[0])
+                self.bytes = max(self.bytes, transfer[1])
+
+        def update(self, op_code, cur_count, max_count=None, message=""):
+            if op_code & (self.RECEIVING | self.WRITING):
+                self._record(self._cur_line)
+
+        def line_dropped(self, line):
+            # "Unpacking objects" and "Total" lines are not parsed by gitpython
+            self._record(line)
+
+    return TransferProgress
+
+
+@contextmanager
+def timed(result, phase: str):
+    """Add the time spent in the `with` block to a phase of a SyncResult
+
+    Args:
+        result: The SyncResult whose `timings` are updated.
+        phase: One of `PHASES`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        result.timings[phase] = result.timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+def tracked_branches(repo: Repo, options: SyncOptions) -> list[tuple[Head, RemoteReference]]:
+    """List the local branches to synchronize with their remote tracking refs
+
+    By default only the checked out branch is synchronized, with its upstream
+    on `options.remote` (or the remote branch of the same name). With
+    `options.all_branches` every local branch that has an upstream is
+    synchronized, limited to the upstreams on `options.remotes` if given.
+
+    Args:
+        repo: A gitpython Repo object pointing to the local repository.
+        options: The SyncOptions of the synchronization.
+
+    Returns:
+        list: (local branch, remote tracking ref) pairs, the checked out branch first.
+
+    Raises:
+        ValueError: If the checked out branch has neither an upstream nor a remote branch of the same name.
+    """
+    if not options.all_branches:
+        remote = repo.remote(options.remote)
+        branch = repo.active_branch
+        tracking = branch.tracking_branch()
+        if tracking is None or tracking.remote_name != remote.name:
+            tracking = next((ref for ref in remote.refs if ref.remote_head == branch.name), None)
+        if tracking is None:
+            # Any other remote branch would be merged in and overwritten by the push
+            raise ValueError(
+                f"Branch {branch.name} has no upstream on {remote.name} and {remote.name} has no branch of that name"
+            )
+        return [(branch, tracking)]
+
+    active = None if repo.head.is_detached else repo.active_branch
+    pairs = []
+    for branch in repo.heads:
+        tracking = branch.tracking_branch()
+        if tracking is not None and (not options.remotes or tracking.remote_name in options.remotes):
+            pairs.append((branch, tracking))
+
+    return sorted(pairs, key=lambda pair: pair[0] != active)
+
+
+def remote_changed(repo: Repo, remote: Remote, tracking: list[RemoteReference], heads_cache: dict = None) -> bool:
+    """Check if any of the remote branches moved since the last fetch without fetching
+
+    Only the ref advertisement of the remote is requested (`git ls-remote`),
+    which is much cheaper than a fetch negotiation, and the SHA of every
+    remote branch is compared with its locally cached remote tracking ref.
 
     Args:
         repo: A gitpython Repo object pointing to the local repository.
         remote: A gitpython Remote object pointing to the remote repository.
+        tracking: The remote tracking refs of `remote` that are synchronized.
+        heads_cache: Remote URL -> {ref: SHA} shared between repositories of one run,
+            so repositories with the same remote are probed only once.
 
     Returns:
-        list: A list of two integers representing the commit dates for the local and remote repositories. `[last_commit_local, last_commit_remote]`
+        bool: True if a remote branch differs from its remote tracking ref.
     """
+    heads = heads_cache.get(remote.url) if heads_cache is not None else None
 
-    remote.fetch()
+    if heads is None:
+        heads = {}
+        for line in repo.git.ls_remote("--heads", remote.name).splitlines():
+            sha, _, ref = line.partition("\t")
+            heads[ref] = sha
 
-    last_commit_local = repo.head.commit.committed_date
-    last_commit_remote = remote.refs[0].commit.committed_date
+        if heads_cache is not None:
+            heads_cache[remote.url] = heads
 
-    return [last_commit_local, last_commit_remote]
+    # Read from the ref files, a tracking ref that was never fetched reads as ""
+    return any(heads.get(f"refs/heads/{ref.remote_head}") != read_ref(repo.git_dir, ref.path) for ref in tracking)
 
 
-if __name__ == "__main__":
+def ahead_behind(repo: Repo, local: str, upstream: str, state: RepoState) -> tuple[int, int]:
+    """Count the commits that only the local or only the remote branch has
 
-    HELP = f"""
-{BLUE}\t\t********** GIT AUTOMATION SCRIPT **********{RESET}
+    Both counts are taken from the merge-base of the two branches, so they
+    are correct for diverged histories and independent of commit dates.
+    The result is cached per (local SHA, remote SHA) pair in `state`.
 
-{GREEN}\tDescription:{RESET}
-\tThis script automates the synchronization of changes between your local Git repository and a remote repository. 
-\tIt manages commits, pushes, and resolves conflicts to keep your codebase up-to-date.
+    Args:
+        repo: A gitpython Repo object pointing to the local repository.
+        local: Commit SHA of the local branch.
+        upstream: Commit SHA of the remote tracking ref.
+        state: The RepoState holding the merge-base cache.
 
-{GREEN}\tUsage:{RESET}
-\t\t{YELLOW}python gitsync.py <Local_Repository_Path>{RESET}
+    Returns:
+        tuple: `(ahead, behind)` number of commits.
+    """
+    cached = cached_ahead_behind(state, local, upstream)
+    if cached:
+        return cached[1], cached[2]
+
+    # Fails with status 1 for unrelated histories, which have no merge-base
+    base = repo.git.merge_base(local, upstream)
+    # The symmetric difference counts both sides from the merge-base in one walk
+    counts = repo.git.rev_list("--left-right", "--count", f"{local}...{upstream}")
+    ahead, behind = (int(count) for count in counts.split())
+
+    remember_ahead_behind(state, local, upstream, base, ahead, behind)
+    return ahead, behind
+
+
+@dataclass
+class SyncOptions:
+    """Options for synchronizing a single repository
+
+    Attributes:
+        remote: Name of the remote repository to synchronize with.
+        all_branches: Synchronize every local branch that has an upstream, not only the checked out one.
+        remotes: With `all_branches`, only the upstreams on these remotes, all remotes if empty.
+        out: Stream the progress messages are written to, `sys.stdout` if None.
+        snapshot: Skip the status scan when the working tree is unchanged since the last sync.
+        probe: Ask the remote for its branch SHA with ls-remote and only fetch if it moved.
+        heads_cache: Remote URL -> {ref: SHA} of the ls-remote probes, shared between repositories.
+        fetch_sources: Remote URL -> path of a local mirror that is fetched from instead of the remote.
+        strategy: "merge" or "rebase", how diverged local and remote branches are combined.
+        stream_threshold: Stage through `git update-index --stdin` when more than this many
+            files changed, 0 to always stage in-process.
+    """
 
-{GREEN}\tParameters:{RESET}
-\t\t<Local_Repository_Path> : Path to your local Git repository.
+    remote: str = "origin"
+    all_branches: bool = False
+    remotes: tuple = ()
+    out: TextIO = None
+    snapshot: bool = True
+    probe: bool = True
+    heads_cache: dict = None
+    fetch_sources: dict = None
+    strategy: str = "merge"
+    stream_threshold: int = 5000
+
+
+@dataclass
+class SyncResult:
+    """Outcome of synchronizing a single repository
+
+    Attributes:
+        path: Path of the local repository.
+        outcome: One of `IN_SYNC`, `MERGED`, `PUSHED`, `CONFLICT` or `ERROR`.
+        untracked: Number of untracked files staged for the automatic commit.
+        modified: Number of modified files staged for the automatic commit.
+        deleted: Number of deleted files staged for the automatic commit.
+        committed: True if an automatic commit was created.
+        error: Error message if the synchronization failed.
+        duration: Seconds the synchronization took.
+        timings: Phase name -> seconds spent in it, see `PHASES`.
+        fetch_objects: Number of objects received by the fetch.
+        fetch_bytes: Number of bytes received by the fetch.
+        push_objects: Number of objects sent by the push.
+        push_bytes: Number of bytes sent by the push.
+        branches: Local branch name -> outcome of that branch.
+    """
 
-{GREEN}\tFunctionality:{RESET}
-\t- Checks if the local repository is ahead of the remote repository.
-\t- Fetches and merges changes from the remote repository if local is behind.
-\t- Automatically stages untracked files for commit.
-\t- Manages modifications in tracked files, staging them for commit.
-\t- Handles deletions of tracked files.
-\t- Commits changes locally with an automatic message.
-\t- Displays the synchronized status of the local Git repository.
+    path: str
+    outcome: str = IN_SYNC
+    untracked: int = 0
+    modified: int = 0
+    deleted: int = 0
+    committed: bool = False
+    error: str = ""
+    duration: float = 0.0
+    timings: dict = field(default_factory=dict)
+    fetch_objects: int = 0
+    fetch_bytes: int = 0
+    push_objects: int = 0
+    push_bytes: int = 0
+    branches: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        """True unless the repository needs manual attention"""
+        return self.outcome not in (CONFLICT, ERROR)
+
+    def to_json(self) -> str:
+        """Serialize the result as one JSON line of the `--format jsonl` output"""
+        return json.dumps({"type": "repo", "ok": self.ok, **asdict(self)})
+
+
+def stream_update_index(repo: Repo, paths: list[str], chunk_size: int = STAGE_CHUNK_SIZE) -> None:
+    """Stage a large set of paths through a single `git update-index --stdin`
+
+    The paths are written to git in chunks as NUL separated records, git adds
+    the files that exist, removes the ones that were deleted and writes the
+    index file once at the end.
 
-{GREEN}\tOutput:{RESET}
-\t- Provides status updates on repository synchronization.
-\t- Alerts about untracked, modified, and deleted files staged for commit.
-\t- Reports the outcome of commit and push operations.
+    Args:
+        repo: A gitpython Repo object pointing to the local repository.
+        paths: Paths relative to the working tree to add, update or remove.
+        chunk_size: Number of paths written to git at a time.
+    """
+    process = repo.git.update_index(
+        "--add", "--remove", "-z", "--stdin", as_process=True, istream=subprocess.PIPE
+    )
+    for i in range(0, len(paths), chunk_size):
+        process.stdin.write(b"".join(path.encode() + b"\0" for path in paths[i : i + chunk_size]))
+    process.stdin.close()
 
-{GREEN}\tNotes:{RESET}
-\t- {BOLD}Make sure the commit histories of both repositories match before running the scripts{RESET}
-\t- Ensure permissions allow pushing changes to the remote repository.
-\t- Keep the working directory clean with staged changes before running the script.
+    process.wait()  # Raises GitCommandError if git failed
 
-{BLUE}\n\t\t********** END OF HELP MESSAGE **********{RESET}
 
-"""
+def stage_changes(repo: Repo, result: SyncResult, log: Callable, stream_threshold: int = 0) -> list[str]:
+    """Stage untracked, modified and deleted files of the working tree
 
-    args = sys.argv
+    All changes are collected first and then applied as one bulk update, so
+    the index file is written once per sync instead of once per file.
 
-    if len(args) < 2:
-        print(HELP)
-        exit()
+    Args:
+        repo: A gitpython Repo object pointing to the local repository.
+        result: The SyncResult where the number of staged files is counted.
+        log: Function used to print the progress messages.
+        stream_threshold: Stream the paths to `git update-index --stdin` when more
+            than this many files changed, 0 to always stage in-process.
 
-    DIR = args[1]
-    repo = Repo(DIR)
-    remote = repo.remote("origin")
+    Returns:
+        list[str]: The staged paths.
+    """
+    with timed(result, "status"):
+        index = repo.index
+        diff = index.diff(None)
+        untracked_files = repo.untracked_files
+    result.untracked = len(untracked_files)
 
-    diff = repo.index.diff(None)
-    flags = {
-        "d": 0,
-        "u": len(repo.untracked_files),
-        "m": 0,
-    }  # d = deleted, u = untracked, m = modified
+    added, removed = list(untracked_files), []
 
     # Checking for Untracked Files
-    print(f"\n{BLUE}Checking for Untracked Files:{RESET}")
+    log(f"\n{BLUE}Checking for Untracked Files:{RESET}")
 
-    for i in repo.untracked_files:
-        print(f"\t{YELLOW}Untracked:{RESET} {i}")
-    repo.index.add(repo.untracked_files)
+    for i in untracked_files:
+        log(f"\t{YELLOW}Untracked:{RESET} {i}")
 
     # Checking for file deletion or modification
-    print(f"\n{BLUE}Checking for Deleted or Modified Files:{RESET}")
+    log(f"\n{BLUE}Checking for Deleted or Modified Files:{RESET}")
     for i in diff:
         if i.deleted_file:
-            flags["d"] += 1
-            repo.index.remove(i.a_path)
-            print(f"\t{RED}Deleted: {RESET}" + i.a_path if i.a_path else "")
+            result.deleted += 1
+            removed.append(i.a_path)
+            log(f"\t{RED}Deleted: {RESET}" + i.a_path if i.a_path else "")
         else:
-            flags["m"] += 1
+            result.modified += 1
             if i.change_type == "A":
-                print(f"\t{GREEN}Added: {RESET}" + i.a_path if i.a_path else "")
+                log(f"\t{GREEN}Added: {RESET}" + i.a_path if i.a_path else "")
             else:
-                print(f"\t{GREEN}Modified: {RESET}" + i.a_path if i.a_path else "")
-                repo.index.add(i.a_path if i.a_path else "")
+                log(f"\t{GREEN}Modified: {RESET}" + i.a_path if i.a_path else "")
+                added.append(i.a_path)
+
+    with timed(result, "staging"):
+        if stream_threshold and len(added) + len(removed) > stream_threshold:
+            stream_update_index(repo, added + removed)
+
+        elif added or removed:
+            if added:
+                with INDEX_ADD_LOCK:
+                    index.add(added, write=False)
+            for path in removed:
+                index.entries.pop((path, 0), None)
 
-    # Generating the commit message
+            # The cached trees of the old index no longer match its entries
+            index.write(ignore_extension_data=True)
+
+    return added + removed
+
+
+def commit_message(result: SyncResult) -> str:
+    """Generate the automatic commit message for the staged files
+
+    Args:
+        result: The SyncResult holding the number of staged files.
+
+    Returns:
+        str: The commit message eg. "Automatic Commit : Added 2 Files Modified 1 Files ".
+    """
     msg = "Automatic Commit : "
-    msg += f"Added {flags['u']} Files " if flags["u"] != 0 else ""
-    msg += f"Deleted {flags['d']} Files " if flags["d"] != 0 else ""
-    msg += f"Modified {flags['m']} Files " if flags["m"] != 0 else ""
+    msg += f"Added {result.untracked} Files " if result.untracked != 0 else ""
+    msg += f"Deleted {result.deleted} Files " if result.deleted != 0 else ""
+    msg += f"Modified {result.modified} Files " if result.modified != 0 else ""
+
+    return msg
+
+
+def commit_changes(repo: Repo, result: SyncResult, log: Callable, staged: list[str]) -> None:
+    """Commit the staged changes with an automatic commit message
+
+    Args:
+        repo: A gitpython Repo object pointing to the local repository.
+        result: The SyncResult holding the number of staged files.
+        log: Function used to print the progress messages.
+        staged: The paths returned by `stage_changes`.
+    """
+    msg = commit_message(result)
 
     # Committing Changes
-    if flags["d"] > 0 or flags["u"] > 0 or flags["m"] > 0:
-        print("\nCommitting changes locally...")
+    if result.deleted > 0 or result.untracked > 0 or result.modified > 0:
+        log("\nCommitting changes locally...")
 
-        print(f"\n{BLUE}Files to be committed:{RESET}")
+        log(f"\n{BLUE}Files to be committed:{RESET}")
 
-        for item in repo.index.diff(remote.refs[0].commit):
-            print(f"\t{item.a_path}")
+        for path in staged:
+            log(f"\t{path}")
         try:
-            repo.index.commit(msg)
+            with timed(result, "commit"):
+                repo.index.commit(msg)
+            result.committed = True
         except Exception as e:
-            print(f"\n{RED}Unable to commit changes{RESET}")
-            print(f"{RED}Error: {e}{RESET}")
+            log(f"\n{RED}Unable to commit changes{RESET}")
+            log(f"{RED}Error: {e}{RESET}")
+            result.outcome = ERROR
+            result.error = str(e)
 
     else:
-        print("No changes found in local repository")
+        log("No changes found in local repository")
 
-    # Fetching and merging changes from Remote Repository
-    Date_of_Commits = Commit_Dates(repo, remote)
-    L_commit, R_commit = Date_of_Commits[0], Date_of_Commits[1]
 
-    # Syncing changes in Local and Remote Repository
-    if L_commit == R_commit:
-        print("Both Local and Remote Repositories are in SYNC")
-        pass
+def merge_remote(
+    repo: Repo, upstream: str, result: SyncResult, log: Callable, ahead: int, strategy: str = "merge"
+) -> str:
+    """Bring the fetched commits of the remote branch into the checked out branch
 
-    elif L_commit < R_commit:
-        print("Checking for changes in Remote Repository...")
+    A local branch that is only behind is fast-forwarded. A diverged branch
+    is merged with, or rebased onto, the remote branch depending on
+    `strategy`. A conflicting merge or rebase is aborted so the repository
+    is left as it was.
 
-        print("Remote Repository is up to date")
-        print("Local Repository might be Outdated")
-        print("\nFetching Changes...")
-        print("Fetched Changes successfully")
+    Args:
+        repo: A gitpython Repo object pointing to the local repository.
+        upstream: Full name of the remote tracking ref eg. "refs/remotes/origin/main".
+        result: The SyncResult where an error message is recorded.
+        log: Function used to print the progress messages.
+        ahead: Number of local commits that are not on the remote branch.
+        strategy: "merge" or "rebase", used when both branches have new commits.
 
-        # Merging Changes
-        try:
-            repo.git.merge(remote.refs[0])
-        except GitCommandError as e:
-            if "conflict" in e.stdout.lower():
-                print(
-                    f"{RED}Conflict detected. Please resolve conflicts manually.{RESET}"
-                )
-                sys.exit(1)  # Exit the script to allow manual conflict resolution
+    Returns:
+        str: `MERGED`, `CONFLICT` or `ERROR`.
+    """
+    from git import GitCommandError
+
+    try:
+        with timed(result, "merge"):
+            if ahead == 0:
+                log("Local Repository is behind, fast-forwarding...")
+                repo.git.merge("--ff-only", upstream)
+            elif strategy == "rebase":
+                log("Local and Remote Repositories diverged, rebasing local commits...")
+                repo.git.rebase(upstream)
+            else:
+                log("Local and Remote Repositories diverged, merging...")
+                repo.git.merge("--no-edit", upstream)
 
-            elif e.status == 128:
-                print(
-                    f"{BOLD}Unrelated histories detected.{RESET} {RED}Please merge manually using `git merge --allow-unrelated-histories` if necessary.{RESET}"
-                )
-                sys.exit(1)
+    except GitCommandError as e:
+        output = f"{e.stdout}\n{e.stderr}".lower()
 
-            else:
-                print(f"{BOLD}An error occurred during the merge:\n {RESET}", e)
-                print("Trying to pull changes from remote repo...")
+        if "conflict" in output:
+            repo.git.execute(["git", strategy, "--abort"], with_exceptions=False)
+            log(f"{RED}Conflict detected, the {strategy} was aborted. Please resolve conflicts manually.{RESET}")
+            return CONFLICT
 
-                try:
-                    remote.pull()
-                except:
-                    print(f"{BOLD}An error occurred during the pull:\n {RESET}", e)
-                    sys.exit(1)
+        log(f"{BOLD}An error occurred during the {strategy}:\n {RESET}", e)
+        result.error = str(e)
+        return ERROR
 
-        print("Merged Changes successfully")
+    log("Merged Changes successfully")
+    return MERGED
 
-    # If Local Repository is ahead of Remote Repository, then Commit and Push
+
+def push_local(
+    remote: Remote, refspecs: list[str], result: SyncResult, log: Callable, heads_cache: dict = None
+) -> str:
+    """Push local branches to the remote repository in one push
+
+    Several branches are pushed atomically, either all of them are updated
+    on the remote or none is. Whatever the outcome, the remote no longer has
+    the heads probed before the push, so they are dropped from `heads_cache`.
+
+    Args:
+        remote: A gitpython Remote object pointing to the remote repository.
+        refspecs: "<local ref>:<remote ref>" of every branch to push.
+        result: The SyncResult where the transfer and an error message are recorded.
+        log: Function used to print the progress messages.
+        heads_cache: Remote URL -> {ref: SHA} of the ls-remote probes of the run.
+
+    Returns:
+        str: `PUSHED`, `REJECTED` if the remote moved since it was fetched, or `ERROR`.
+    """
+    from git import GitCommandError
+
+    log("Remote Repository is not up to date.")
+    if len(refspecs) > 1:
+        log(f"Trying to push {len(refspecs)} branches to {remote.name}...")
     else:
-        print("Remote Repository is not up to date.")
-        print("\nTrying to Push code to remote repo...")
+        log("Trying to push changes to remote repo...")
+
+    progress = transfer_progress_class()()
+    try:
+        with timed(result, "push"):
+            infos = remote.push(refspecs, progress=progress, atomic=len(refspecs) > 1)
+        rejected = any(info.flags & (info.REJECTED | info.REMOTE_REJECTED) for info in infos)
+        if not rejected:
+            infos.raise_if_error()
+    except GitCommandError as e:
+        # GitPython raises instead of returning a PushInfo when it cannot parse git's report
+        rejected = any(marker in str(e.stderr) for marker in REJECTION_MARKERS)
+        if not rejected:
+            log(f"{BOLD}An error occurred during the push:\n {RESET}", e)
+            result.error = str(e)
+            return ERROR
+    finally:
+        if heads_cache is not None:
+            heads_cache.pop(remote.url, None)
+
+    if rejected:
+        log(f"{YELLOW}The push was rejected, {remote.name} moved since it was fetched{RESET}")
+        result.error = "Push rejected, the remote moved since the fetch"
+        return REJECTED
+
+    result.push_objects += progress.objects
+    result.push_bytes += progress.bytes
+    log("Pushed code to remote repo")
+    log(f"\n\t{GREEN}*** WORK SYNCED SUCCESSFULLY ***\n{RESET}")
+    return PUSHED
+
+
+def sync_branches(
+    repo: Repo,
+    pairs: list[tuple[Head, RemoteReference]],
+    state: RepoState,
+    result: SyncResult,
+    log: Callable,
+    strategy: str,
+    heads_cache: dict = None,
+    fetch_sources: dict = None,
+) -> list[str]:
+    """Fast-forward, push, or merge and push every branch depending on its ahead/behind counts
+
+    The checked out branch is merged (or rebased) in the working tree. Other
+    branches are only fast-forwarded by moving their ref, a diverged branch
+    that is not checked out is reported for a manual merge. The branches to
+    push are collected and sent in one push per remote.
+
+    Args:
+        repo: A gitpython Repo object pointing to the local repository.
+        pairs: (local branch, remote tracking ref) pairs from `tracked_branches`.
+        state: The RepoState holding the merge-base cache.
+        result: The SyncResult where the outcome of every branch is recorded.
+        log: Function used to print the progress messages.
+        strategy: "merge" or "rebase", how diverged branches are combined.
+        heads_cache: Remote URL -> {ref: SHA} of the ls-remote probes of the run.
+        fetch_sources: Remote URL -> path of its mirror in the shared object cache, updated after a push.
 
-        if repo.is_dirty(untracked_files=True):
-            print(
-                f"\n{RED}Unresolved conflicts detected. Please resolve conflicts manually.\n{RESET}"
+    Returns:
+        list: Names of the remotes that rejected the push because they moved since the fetch.
+    """
+    from git import GitCommandError
+
+    active = None if repo.head.is_detached else repo.active_branch
+    pushes = {}  # Remote name -> [(branch name, refspec)]
+
+    for branch, tracking in pairs:
+        if len(pairs) > 1:
+            log(f"\n{BLUE}Branch {YELLOW}{branch.name}{BLUE} <-> {tracking.name}:{RESET}")
+        if not tracking.is_valid():
+            log(f"{RED}{tracking.name} does not exist on the remote, skipping{RESET}")
+            result.branches[branch.name] = ERROR
+            continue
+
+        local, upstream = branch.commit.hexsha, tracking.commit.hexsha
+        try:
+            with timed(result, "merge"):
+                ahead, behind = ahead_behind(repo, local, upstream, state)
+        except GitCommandError as e:
+            if e.status != 1:
+                raise
+            log(
+                f"{BOLD}Unrelated histories detected.{RESET} {RED}Please merge manually using `git merge --allow-unrelated-histories` if necessary.{RESET}"
             )
-            sys.exit(1)
+            result.branches[branch.name] = ERROR
+            result.error = "Unrelated histories"
+            continue
+
+        outcome = IN_SYNC
+        if ahead == 0 and behind == 0:
+            log("Both Local and Remote Repositories are in SYNC")
+
+        elif behind > 0 and branch == active:
+            outcome = merge_remote(repo, tracking.path, result, log, ahead, strategy)
+
+        elif behind > 0 and ahead == 0:
+            # Not checked out, so there is no working tree to update, only the ref
+            with timed(result, "merge"):
+                repo.git.update_ref("-m", f"gitsync: fast-forward to {tracking.name}", branch.path, upstream, local)
+            log("Local branch is behind, fast-forwarded")
+            outcome = MERGED
+
+        elif behind > 0:
+            log(f"{RED}Diverged from {tracking.name}, check the branch out and merge manually.{RESET}")
+            outcome = CONFLICT
 
-        elif len(repo.index.diff(remote.refs[0].commit)) > 0:
-            # Check for merge conflicts
-            print("Merge conflicts detected.")
-            print("Trying to pull changes from remote repo...")
-            try:
-                remote.pull()
-                print("Pull successful.")
-                print("Trying to push changes to remote repo...")
+        else:
+            log("Local branch is ahead")
+
+        # Pushing if the local branch has new commits and now contains the remote ones
+        if ahead > 0 and outcome in (IN_SYNC, MERGED):
+            refspec = f"{branch.path}:refs/heads/{tracking.remote_head}"
+            pushes.setdefault(tracking.remote_name, []).append((branch.name, refspec))
+
+        result.branches[branch.name] = outcome
+
+    rejected = []
+    for remote_name, items in pushes.items():
+        remote = repo.remote(remote_name)
+        refspecs = [refspec for _, refspec in items]
+        pushed = push_local(remote, refspecs, result, log, heads_cache)
+        if pushed == REJECTED:
+            rejected.append(remote_name)
+
+        mirror = (fetch_sources or {}).get(remote.url)
+        if pushed == PUSHED and mirror:
+            # Clones that fetch from the mirror later must see this push, a newer one is never overwritten
+            repo.git.execute(["git", "push", "--quiet", mirror, *refspecs], with_exceptions=False)
+        for name, _ in items:
+            result.branches[name] = PUSHED if pushed == PUSHED else ERROR
+
+    # The repository reports the most severe outcome of its branches
+    for outcome in (ERROR, CONFLICT, PUSHED, MERGED):
+        if outcome in result.branches.values():
+            result.outcome = outcome
+            break
+
+    return rejected
+
+
+def sync_repo(path: str, options: SyncOptions = None) -> SyncResult:
+    """Synchronize a local repository with its remote repository
+
+    Untracked, modified and deleted files are committed automatically, then
+    the ahead/behind counts of the local and remote branch decide between
+    nothing to do, fast-forward, push, or merge (or rebase) and push. With
+    `options.all_branches` every branch with an upstream is handled in the
+    same pass, with one fetch and one push per remote.
+    Errors are reported in the returned SyncResult instead of being raised,
+    so many repositories can be synced from a single process.
 
-                remote.push()
+    Args:
+        path: Path to the local Git repository.
+        options: A SyncOptions object, the defaults are used if None.
 
-                print("Pushed code to remote repo")
-                print("Continuing with Local Repository...")
+    Returns:
+        SyncResult: The outcome of the synchronization.
+    """
+    from git import Repo
 
-                print(f"\n\t{GREEN}*** WORK SYNCED SUCCESSFULLY ***\n{RESET}")
+    options = options or SyncOptions()
+    log = partial(print, file=options.out or sys.stdout)
+    result = SyncResult(path)
+    start = time.monotonic()
 
-                remote.push()
+    try:
+        repo = Repo(path)
+        pairs = tracked_branches(repo, options)
+        state = load_state(repo.git_dir)
 
-            except Exception as e:
-                print(f"{BOLD}An error occurred during the push:\n {RESET}", e)
-                print(f"{BOLD}\nResolve Conflicts Manually !!\n {RESET}", e)
+        with timed(result, "snapshot"):
+            unchanged = options.snapshot and is_unchanged(repo.working_tree_dir, repo.git_dir, state)
 
+        # An untouched working tree cannot have anything to commit
+        if unchanged:
+            log(f"\n{BLUE}No changes in the working tree since the last sync{RESET}")
         else:
-            print("No merge conflicts detected.")
-            print("Trying to push changes to remote repo...")
+            staged = stage_changes(repo, result, log, options.stream_threshold)
+            commit_changes(repo, result, log, staged)
+
+        # Fetching changes from every Remote Repository, all branches in one negotiation
+        remotes = {}
+        for _, tracking in pairs:
+            remotes.setdefault(tracking.remote_name, []).append(tracking)
+
+        for remote_name, tracking in remotes.items():
+            remote = repo.remote(remote_name)
+            with timed(result, "probe"):
+                fetch = not options.probe or remote_changed(repo, remote, tracking, options.heads_cache)
+
+            mirror = (options.fetch_sources or {}).get(remote.url)
+            if fetch and mirror:
+                # The objects are shared through alternates, only the remote tracking refs move
+                with timed(result, "fetch"):
+                    repo.git.fetch("--quiet", "--no-tags", mirror, f"+refs/heads/*:refs/remotes/{remote_name}/*")
+                log(f"Fetched {remote_name} from the shared object cache")
+            elif fetch:
+                progress = transfer_progress_class()()
+                with timed(result, "fetch"):
+                    remote.fetch(progress=progress)
+                result.fetch_objects += progress.objects
+                result.fetch_bytes += progress.bytes
+            else:
+                log(f"Remote branches on {remote_name} unchanged since the last fetch, skipping the fetch")
+
+        # Syncing changes in Local and Remote Repository
+        if result.ok:
+            rejected = sync_branches(
+                repo, pairs, state, result, log, options.strategy, options.heads_cache, options.fetch_sources
+            )
 
-            remote.push()
+            # The probe or the shared object cache was outdated, another clone pushed in the meantime
+            for _ in range(PUSH_ATTEMPTS - 1):
+                if not rejected:
+                    break
+                for remote_name in rejected:
+                    # Directly, the shared object cache may be missing the push of another clone
+                    log(f"Fetching {remote_name} directly and syncing its branches again")
+                    progress = transfer_progress_class()()
+                    with timed(result, "fetch"):
+                        repo.remote(remote_name).fetch(progress=progress)
+                    result.fetch_objects += progress.objects
+                    result.fetch_bytes += progress.bytes
+
+                result.outcome, result.error = IN_SYNC, ""
+                again = [(branch, tracking) for branch, tracking in pairs if tracking.remote_name in rejected]
+                rejected = sync_branches(
+                    repo, again, state, result, log, options.strategy, options.heads_cache, options.fetch_sources
+                )
 
-            print("Pushed code to remote repo")
-            print("Continuing with Local Repository...")
+            if rejected:
+                result.outcome = ERROR
+
+        if options.snapshot:
+            with timed(result, "snapshot"):
+                if result.ok:
+                    # The ref the checked out branch is synced with, as used by the asyncio mode
+                    active = None if repo.head.is_detached else repo.active_branch
+                    upstream = next((tracking.path for branch, tracking in pairs if branch == active), "")
+                    state = take_snapshot(repo.working_tree_dir, repo.git_dir, upstream, state)
+                else:
+                    state.fingerprint = ""  # Scan again next time
+                save_state(repo.git_dir, state)
+
+    except Exception as e:
+        log(f"\n{RED}An error occurred while syncing {path}{RESET}")
+        log(f"{RED}Error: {e}{RESET}")
+        result.outcome = ERROR
+        result.error = str(e)
+
+    result.duration = time.monotonic() - start
+    return result
+
+
+def help_message() -> str:
+    """The help text of the command line interface, only built when it is printed"""
+    return f"""
+{BLUE}\t\t********** GIT AUTOMATION SCRIPT **********{RESET}
 
-            print(f"\n\t{GREEN}*** WORK SYNCED SUCCESSFULLY ***\n{RESET}")
+{GREEN}\tDescription:{RESET}
+\tThis script automates the synchronization of changes between your local Git repository and a remote repository. 
+\tIt manages commits, pushes, and resolves conflicts to keep your codebase up-to-date.
+
+{GREEN}\tUsage:{RESET}
+\t\t{YELLOW}python gitsync.py [Options] <Local_Repository_Path>{RESET}
+
+{GREEN}\tParameters:{RESET}
+\t\t<Local_Repository_Path> : Path to your local Git repository.
+
+{GREEN}\tOptions:{RESET}
+\t\t--all-branches         : Sync every local branch that has an upstream, with one fetch and one atomic push per remote.
+\t\t--remote <Name>        : Remote to sync with (default: origin). Repeat it to limit --all-branches to these remotes.
+\t\t--full-scan            : Always scan the working tree, even if it is unchanged since the last sync.
+\t\t--no-probe             : Always fetch, instead of probing the remote branch with ls-remote first.
+\t\t--rebase               : Rebase local commits onto the remote branch when both have new commits (default: merge).
+\t\t--format <text|jsonl>  : Print one JSON record with the outcome, per phase timings and transfer counts (default: text).
+\t\t--stream-threshold <N> : Stage through `git update-index --stdin` when more than N files changed (default: 5000, 0 = never).
+\t\t--status               : Tell if the repository changed since the last sync, from the saved state only, without syncing.
+\t\t--dry-run              : Like --status, and also probe the remote branch with ls-remote. Nothing is changed.
+
+{GREEN}\tFunctionality:{RESET}
+\t- Counts the commits the local and remote branches are ahead/behind of their merge-base.
+\t- Fast-forwards the local branch if it is behind, pushes it if it is ahead.
+\t- With --all-branches, fast-forwards branches that are not checked out by moving their ref.
+\t- Merges (or rebases) and pushes if both branches have new commits.
+\t- Automatically stages untracked files for commit.
+\t- Manages modifications in tracked files, staging them for commit.
+\t- Handles deletions of tracked files.
+\t- Stages all changes in one bulk update, writing the index only once.
+\t- Commits changes locally with an automatic message.
+\t- Displays the synchronized status of the local Git repository.
+\t- Skips the working tree scan when nothing changed since the last successful sync.
+\t- Only fetches when ls-remote shows that the remote branch moved.
+
+{GREEN}\tOutput:{RESET}
+\t- Provides status updates on repository synchronization.
+\t- Alerts about untracked, modified, and deleted files staged for commit.
+\t- Reports the outcome of commit and push operations.
+
+{GREEN}\tNotes:{RESET}
+\t- {BOLD}Repositories with unrelated commit histories have to be merged manually{RESET}
+\t- Ensure permissions allow pushing changes to the remote repository.
+\t- Keep the working directory clean with staged changes before running the script.
+
+{BLUE}\n\t\t********** END OF HELP MESSAGE **********{RESET}
+
+"""
+
+
+def quick_status(path: str, probe: bool = False) -> dict:
+    """Tell what a sync would find in a repository, without GitPython and without changing anything
+
+    Only the state saved by the last successful sync, the ref files and the
+    stat data of the working tree are read (the checks of the snapshot
+    phase), so the answer costs a directory walk instead of a status scan.
+    The branch compared with the remote is the one of the last sync.
+
+    Args:
+        path: Path to the local Git repository.
+        probe: Also ask the remote for the SHA of its branch with `git ls-remote`.
+
+    Returns:
+        dict: "path", "synced" (a sync succeeded before), "head_moved", "tree_changed",
+            "tracking_moved" (the remote tracking ref was fetched since), "remote_moved"
+            (None without `probe`), "ahead" and "behind" (None if not cached) and "needs_sync".
+
+    Raises:
+        ValueError: If the path is not a git repository.
+    """
+    gdir = git_dir(path)
+    if not os.path.isfile(os.path.join(gdir, "HEAD")):
+        raise ValueError(f"{path} is not a git repository")
+
+    state = load_state(gdir)
+    synced = bool(state.head and state.remote_ref)
+    head = read_ref(gdir, "HEAD")
+    tracking = read_ref(gdir, state.remote_ref) if synced else ""
+
+    status = {
+        "path": path,
+        "synced": synced,
+        "head_moved": synced and head != state.head,
+        # A fingerprint that was too recent to be trusted counts as a change
+        "tree_changed": not state.fingerprint or tree_fingerprint(path, gdir, state.ignored) != state.fingerprint,
+        "tracking_moved": synced and tracking != state.remote_sha,
+        "remote_moved": None,
+        "ahead": None,
+        "behind": None,
+    }
+
+    counts = cached_ahead_behind(state, head, tracking) if synced else None
+    if counts:
+        status["ahead"], status["behind"] = counts[1], counts[2]
+
+    if probe and synced:
+        # "refs/remotes/origin/main" -> remote "origin", branch "refs/heads/main"
+        remote, _, branch = state.remote_ref.removeprefix("refs/remotes/").partition("/")
+        output = subprocess.run(
+            ["git", "ls-remote", remote, f"refs/heads/{branch}"],
+            cwd=path,
+            capture_output=True,
+            text=True,
+            env=dict(os.environ, GIT_TERMINAL_PROMPT="0"),
+        ).stdout
+        status["remote_moved"] = output.partition("\t")[0] != tracking
+
+    status["needs_sync"] = not synced or any(
+        status[key] for key in ("head_moved", "tree_changed", "tracking_moved", "remote_moved", "ahead", "behind")
+    )
+    return status
+
+
+def print_status(status: dict, dry_run: bool) -> None:
+    """Print the result of `quick_status` for the `--status` and `--dry-run` options"""
+    reasons = [
+        text
+        for key, text in (
+            ("head_moved", "HEAD moved"),
+            ("tree_changed", "the working tree changed"),
+            ("tracking_moved", "the remote branch was fetched"),
+            ("remote_moved", "the remote branch moved"),
+        )
+        if status[key]
+    ]
+    if status["ahead"] or status["behind"]:
+        reasons.append(f"{status['ahead']} commits ahead, {status['behind']} behind")
+    if not status["synced"]:
+        reasons = ["never synced"]
+
+    if status["needs_sync"]:
+        action = "Would sync" if dry_run else "Needs a sync"
+        print(f"{YELLOW}{action}{RESET} {status['path']}: {', '.join(reasons)}")
+    else:
+        print(f"{GREEN}In sync{RESET} {status['path']}: nothing changed since the last sync")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-h", "--help", action="store_true")
+    parser.add_argument("--all-branches", action="store_true")
+    parser.add_argument("--remote", action="append", default=[])
+    parser.add_argument("--full-scan", action="store_true")
+    parser.add_argument("--no-probe", action="store_true")
+    parser.add_argument("--rebase", action="store_true")
+    parser.add_argument("--stream-threshold", type=int, default=5000)
+    parser.add_argument("--format", choices=("text", "jsonl"), default="text")
+    parser.add_argument("--status", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("path", nargs="?")
+
+    try:
+        args = parser.parse_args(sys.argv[1:])
+    except SystemExit:
+        print(help_message())
+        exit()
+
+    if args.help or not args.path:
+        print(help_message())
+        exit()
+
+    if args.status or args.dry_run:
+        try:
+            status = quick_status(args.path, probe=args.dry_run)
+        except (OSError, ValueError) as e:
+            print(f"{RED}Error: {e}{RESET}", file=sys.stderr)
+            sys.exit(1)
+
+        if args.format == "jsonl":
+            print(json.dumps({"type": "status", **status}))
+        else:
+            print_status(status, args.dry_run)
+        sys.exit(0)
+
+    result = sync_repo(
+        args.path,
+        SyncOptions(
+            remote=args.remote[0] if args.remote else "origin",
+            all_branches=args.all_branches,
+            remotes=tuple(args.remote),
+            snapshot=not args.full_scan,
+            probe=not args.no_probe,
+            strategy="rebase" if args.rebase else "merge",
+            stream_threshold=args.stream_threshold,
+            # Keep stdout for the JSON record, the progress messages go to stderr
+            out=sys.stderr if args.format == "jsonl" else None,
+        ),
+    )
+
+    if args.format == "jsonl":
+        print(result.to_json())
+
+    sys.exit(0 if result.ok else 1)
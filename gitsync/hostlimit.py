@@ -0,0 +1,105 @@
+import time
+import threading
+from urllib.parse import urlsplit
+
+
+def remote_host(url: str) -> str:
+    """Find the host a remote URL connects to
+
+    Args:
+        url: A remote URL eg. "https://github.com/user/repo.git" or "git@github.com:user/repo.git".
+
+    Returns:
+        str: The lower case host name, empty for local repositories.
+    """
+    if "://" in url:
+        return (urlsplit(url).hostname or "").lower()
+
+    # scp-like syntax "[user@]host:path", a colon after a slash is part of a local path
+    head, colon, _ = url.partition(":")
+    if colon and "/" not in head and len(head) > 1:  # "C:" is a Windows drive
+        return head.rpartition("@")[2].lower()
+
+    return ""
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average and bursts of up to `burst` events
+
+    Args:
+        rate: Tokens added per second.
+        burst: Maximum number of tokens, the bucket starts full.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self) -> bool:
+        """Take one token if there is one"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class HostLimits:
+    """Per host budget of concurrent synchronizations and synchronization starts per second
+
+    A synchronization keeps at most one connection to its host open at a
+    time (probe, fetch and push run one after the other), so limiting the
+    concurrent synchronizations per host limits its connections. Local
+    remotes are never limited. Thread safe.
+
+    Args:
+        hosts: Repository path -> host name from `remote_host`.
+        connections: Concurrent synchronizations per host, 0 for no limit.
+        rate: Synchronizations started per second and host, 0 for no limit.
+    """
+
+    def __init__(self, hosts: dict[str, str], connections: int = 0, rate: float = 0.0):
+        self.hosts = hosts
+        self.connections = connections
+        self.rate = rate
+
+        self._lock = threading.Lock()
+        self._active = {}
+        self._buckets = {}
+
+    def try_start(self, path: str) -> bool:
+        """Count a synchronization of the repository as started if its host has budget left
+
+        Args:
+            path: Repository path.
+
+        Returns:
+            bool: True if it may start now, `done` must be called once it finished.
+        """
+        host = self.hosts.get(path, "")
+        if not host:
+            return True
+
+        with self._lock:
+            if self.connections and self._active.get(host, 0) >= self.connections:
+                return False
+
+            if self.rate:
+                bucket = self._buckets.setdefault(host, TokenBucket(self.rate, max(1.0, self.rate)))
+                if not bucket.take():
+                    return False
+
+            self._active[host] = self._active.get(host, 0) + 1
+            return True
+
+    def done(self, path: str) -> None:
+        """Give the budget of a finished synchronization back"""
+        host = self.hosts.get(path, "")
+        if host:
+            with self._lock:
+                self._active[host] -= 1
@@ -1,7 +1,18 @@
+import io
+import math
 import os
 import sys
-import subprocess
+import json
+import time
+import asyncio
+import argparse
 import threading
+import importlib.util
+from dataclasses import replace
+from functools import partial
+
+import discovery
+import syncqueue
 
 # ANSI color codes
 RESET = "\033[0m"
@@ -16,24 +27,59 @@ HELP_MESSAGE = f"""
 
 {GREEN}\tDescription:{RESET}
 \tThis script automates the synchronization of multiple Git repositories using the gitsync.py script. 
-\tIt executes gitsync.py for each repository listed in a text file and manages up to 4 repositories in parallel.
+\tIt imports gitsync.py once and syncs each repository listed in a text file using a bounded pool of worker threads.
 
 {GREEN}\tUsage:{RESET}
-\t\t{YELLOW}python multisync.py <Path_to_gitsync.py> <Path_to_txt_file_with_repos>{RESET}
+\t\t{YELLOW}python multisync.py [Options] <Path_to_gitsync.py> <Path_to_txt_file_with_repos>{RESET}
+\t\t{YELLOW}python multisync.py [Options] --discover <Root> <Path_to_gitsync.py> [<Path_to_txt_file_with_repos>]{RESET}
 
 {GREEN}\tParameters:{RESET}
 \t\t<Path_to_gitsync.py> : Path to the gitsync.py script.
-\t\t<Path_to_txt_file_with_repos> : Path to a text file containing the paths to local Git repositories.
+\t\t<Path_to_txt_file_with_repos> : Path to a text file containing the paths to local Git repositories, optional with --discover.
+
+{GREEN}\tOptions:{RESET}
+\t\t-j, --jobs <N>      : Number of repositories synchronized at the same time (default: 4, 64 with --async).
+\t\t--async             : Drive git from a single asyncio event loop and stream the output of every repository live.
+\t\t--summary <Sec>     : Seconds between two rolling summary tables in asyncio mode, 0 to disable (default: 5).
+\t\t--adaptive          : Adapt the number of parallel jobs to the observed network and disk latency.
+\t\t--max-jobs <N>      : Upper limit for the number of parallel jobs in adaptive mode (default: 4 x jobs).
+\t\t--state-dir <Dir>   : Directory where run history is stored (default: ~/.multisync).
+\t\t--all-branches      : Sync every local branch that has an upstream, with one fetch and one atomic push per remote (not with --async).
+\t\t--remote <Name>     : Remote to sync with (default: origin). Repeat it to limit --all-branches to these remotes.
+\t\t--object-cache      : Fetch every remote shared by several repositories once into a mirror in the state directory,
+\t\t                      its clones fetch from the mirror and borrow its objects through git alternates (not with --watch).
+\t\t--retries <N>       : Retries of a repository that failed with an error, with exponential backoff (default: 2).
+\t\t--retry-delay <Sec> : Upper bound of the first retry delay, doubled for every retry (default: 5).
+\t\t--restart           : Start a new run even if the last one was interrupted, instead of resuming it.
+\t\t--discover <Root>   : Sync every Git repository found below this directory, repeat it for several roots.
+\t\t--ignore <Pattern>  : Directory names not searched by --discover, on top of node_modules, .venv, .cache and the like.
+\t\t--host-connections <N> : Repositories synced at the same time per remote host, 0 = no limit (default: 8).
+\t\t--host-rate <N>     : Repository syncs started per second per remote host, 0 = no limit (default: 0).
+\t\t--full-scan         : Always scan the working trees, even if they are unchanged since the last sync.
+\t\t--no-probe          : Always fetch, instead of probing the remote branches with ls-remote first.
+\t\t--rebase            : Rebase local commits onto the remote branch when both have new commits (default: merge).
+\t\t--stream-threshold <N> : Stage through `git update-index --stdin` when more than N files changed (default: 5000, 0 = never).
+\t\t--ssh-multiplex     : Share one SSH connection per Git host between all git processes (OpenSSH ControlMaster).
+\t\t--watch             : Keep running and sync a repository as soon as its working tree changes (inotify) or its remote branch moves.
+\t\t--debounce <Sec>    : Seconds a watched working tree must stay quiet before it is synced (default: 2).
+\t\t--probe-interval <Sec> : Seconds between two ls-remote probes of every repository in watch mode (default: 60).
+\t\t--format <text|jsonl> : Write one JSON record per repository and a final summary record to stdout, progress to stderr (default: text).
 
 {GREEN}\tFunctionality:{RESET}
-\t- Reads the text file to get the list of repository paths.
-\t- Executes gitsync.py for each repository.
-\t- Runs 4 repositories at a time using threading for parallel execution.
+\t- Reads the text file to get the list of repository paths, skipping the ones that are not Git repositories.
+\t- Or searches root directories for repositories in parallel, only listing again the directories that changed since the last search.
+\t- Runs the gitsync.py sync logic for each repository inside this process.
+\t- Starts the next repository as soon as a worker becomes free.
+\t- Keeps every remote host within its connection and rate budget, a throttled host never idles the workers of the others.
+\t- Records every repository in a SQLite queue in the state directory, so an interrupted run resumes where it stopped.
+\t- Syncs the repositories that took longest on previous runs first, so the run does not end on a slow straggler.
 \t- Provides status updates for each repository as the synchronization progresses.
 
 {GREEN}\tOutput:{RESET}
 \t- Displays status updates on synchronization for each repository.
-\t- Logs the completion status ({GREEN}success{RESET}/{RED}failure{RESET}) for each gitsync.py execution.
+\t- Logs the completion status ({GREEN}success{RESET}/{RED}failure{RESET}) for each repository, with the gitsync output on failure.
+\t- In watch mode, only syncs the repositories whose working tree or remote branch changed, seconds after the change.
+\t- Ends with a summary of the outcomes, transferred objects and the p50/p95/max time of every sync phase.
 
 {GREEN}\tNotes:{RESET}
 \t- {BOLD}Ensure that gitsync.py is accessible and executable from the provided path.{RESET}
@@ -42,61 +88,513 @@ HELP_MESSAGE = f"""
 {BLUE}\n\t\t********** END OF HELP MESSAGE **********{RESET}
 """
 
+DEFAULT_STATE_DIR = os.path.join(os.path.expanduser("~"), ".multisync")
+DURATIONS_FILE = "durations.json"
+
+# A repo running this much slower than its remembered duration means the
+# disk or the network is saturated, so the adaptive limiter backs off.
+SLOWDOWN_THRESHOLD = 1.5
+# Below this ratio there is still headroom and one more job is allowed.
+SPEEDUP_THRESHOLD = 1.2
+
+
+class ConcurrencyLimiter:
+    """Bounds the number of repositories that are synchronized at once.
+
+    In adaptive mode the limit moves between `min_limit` and `max_limit`
+    (additive increase, multiplicative decrease). After every window of
+    `limit` completed repositories the average slowdown, i.e. the observed
+    duration divided by the duration remembered from previous runs, decides
+    whether one more job is allowed or a quarter of them are taken away.
+
+    Args:
+        limit: Initial number of parallel jobs.
+        min_limit: Lowest limit adaptation may reach. Defaults to `limit`.
+        max_limit: Highest limit adaptation may reach. Defaults to `limit`.
+    """
+
+    def __init__(self, limit: int, min_limit: int = None, max_limit: int = None):
+        self.limit = limit
+        self.min_limit = min_limit or limit
+        self.max_limit = max_limit or limit
+        self.active = 0
+
+        self._cond = threading.Condition()
+        self._slowdown = 0.0
+        self._samples = 0
+
+    @property
+    def adaptive(self) -> bool:
+        return self.min_limit != self.max_limit
+
+    def acquire(self) -> None:
+        """Block until a job slot is free and take it"""
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self, elapsed: float = None, expected: float = None) -> None:
+        """Give a job slot back and feed the job's duration to the adaptation
+
+        Args:
+            elapsed: Seconds the job took, None if no job was run.
+            expected: Seconds the same job took on previous runs, None if unknown.
+        """
+        with self._cond:
+            self.active -= 1
+            if self.adaptive and elapsed is not None and expected:
+                self._adapt(elapsed / expected)
+            self._cond.notify_all()
+
+    def _adapt(self, slowdown: float) -> None:
+        self._slowdown += slowdown
+        self._samples += 1
+
+        # Judge a full window of jobs at the current level before moving again
+        if self._samples < self.limit:
+            return
+
+        average = self._slowdown / self._samples
+        self._slowdown, self._samples = 0.0, 0
 
-# Function to run gitsync.py for a given repository
-def run_gitsync(gitsync_path, repo_path):
+        if average > SLOWDOWN_THRESHOLD and self.limit > self.min_limit:
+            self.limit = max(self.min_limit, min(self.limit - 1, self.limit * 3 // 4))
+        elif average < SPEEDUP_THRESHOLD and self.limit < self.max_limit:
+            self.limit += 1
+
+
+def load_durations(state_dir: str) -> dict[str, float]:
+    """Load the per-repository sync durations remembered from previous runs
+
+    Args:
+        state_dir: Directory holding the multisync state files.
+
+    Returns:
+        dict: Absolute repository path -> duration in seconds.
+    """
     try:
-        print(
+        with open(os.path.join(state_dir, DURATIONS_FILE), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_durations(state_dir: str, durations: dict[str, float]) -> None:
+    """Atomically write the per-repository sync durations
+
+    Args:
+        state_dir: Directory holding the multisync state files.
+        durations: Absolute repository path -> duration in seconds.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    path = os.path.join(state_dir, DURATIONS_FILE)
+
+    with open(path + ".tmp", "w") as file:
+        json.dump(durations, file, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def order_longest_first(repo_paths: list[str], durations: dict[str, float]) -> list[str]:
+    """Sort repositories so the slowest ones from previous runs start first
+
+    Repositories without history are unknown and could be slow, so they are
+    scheduled before everything else. The sort is stable, repositories with
+    equal durations keep the order of the text file.
+
+    Args:
+        repo_paths: Repository paths as listed in the text file.
+        durations: Durations returned by `load_durations`.
+
+    Returns:
+        list: The repository paths in scheduling order.
+    """
+    return sorted(
+        repo_paths,
+        key=lambda path: durations.get(os.path.abspath(path), float("inf")),
+        reverse=True,
+    )
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of values
+
+    Args:
+        values: The observed values, not empty.
+        fraction: The percentile as a fraction eg. 0.95.
+
+    Returns:
+        float: The smallest value that at least `fraction` of all values are less than or equal to.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(results: list, phases: tuple[str, ...], elapsed: float) -> dict:
+    """Aggregate the SyncResults of a run
+
+    Args:
+        results: The SyncResult of every repository.
+        phases: The phase names in the order they run, see `gitsync.PHASES`.
+        elapsed: Wall clock seconds of the whole run.
+
+    Returns:
+        dict: The summary record, as written by `--format jsonl`.
+    """
+    outcomes = {}
+    for result in results:
+        outcomes[result.outcome] = outcomes.get(result.outcome, 0) + 1
+
+    timings = {}
+    for phase in (*phases, "total"):
+        if phase == "total":
+            values = [result.duration for result in results]
+        else:
+            values = [result.timings[phase] for result in results if phase in result.timings]
+        if values:
+            timings[phase] = {
+                "count": len(values),
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "max": max(values),
+            }
+
+    return {
+        "type": "summary",
+        "repositories": len(results),
+        "elapsed": elapsed,
+        "outcomes": outcomes,
+        "timings": timings,
+        **{
+            key: sum(getattr(result, key) for result in results)
+            for key in ("fetch_objects", "fetch_bytes", "push_objects", "push_bytes")
+        },
+    }
+
+
+def print_run_summary(summary: dict) -> None:
+    """Print a summary returned by `summarize` as tables
+
+    Args:
+        summary: The summary record.
+    """
+    print(f"\n{BOLD}{BLUE}Synchronized {summary['repositories']} repositories in {summary['elapsed']:.1f}s{RESET}")
+    for outcome, count in summary["outcomes"].items():
+        colour = RED if outcome in ("conflict", "error") else GREEN
+        print(f"\t{colour}{outcome:<12}{RESET}{count:>6}")
+
+    print(f"\t{'fetched':<12}{summary['fetch_objects']:>6} objects, {summary['fetch_bytes']} bytes")
+    print(f"\t{'pushed':<12}{summary['push_objects']:>6} objects, {summary['push_bytes']} bytes")
+
+    print(f"\n{BOLD}{BLUE}{'Phase':<12}{'Repos':>8}{'p50 (s)':>10}{'p95 (s)':>10}{'max (s)':>10}{RESET}")
+    for phase, stats in summary["timings"].items():
+        print(f"{phase:<12}{stats['count']:>8}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['max']:>10.3f}")
+
+
+def enable_ssh_multiplexing(state_dir: str, persist: int = 60) -> None:
+    """Make every git process of this run share one SSH connection per host
+
+    The first git process connecting to a host becomes the OpenSSH
+    ControlMaster, all following ls-remote probes, fetches and pushes to
+    that host open a channel on the existing connection instead of paying
+    for a new TCP and authentication handshake.
+
+    Args:
+        state_dir: Directory holding the multisync state files, the control sockets are created there.
+        persist: Seconds the master connection stays open after its last user.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    control_path = os.path.join(state_dir, "ssh-%C")
+
+    ssh = os.environ.get("GIT_SSH_COMMAND", "ssh")
+    os.environ["GIT_SSH_COMMAND"] = (
+        f'{ssh} -o ControlMaster=auto -o "ControlPath={control_path}" -o ControlPersist={persist}'
+    )
+
+
+def load_gitsync(gitsync_path: str):
+    """Import gitsync.py from the given path as the `gitsync` module
+
+    The sync logic then runs inside this process instead of starting a new
+    Python interpreter (and importing GitPython again) for every repository.
+
+    Args:
+        gitsync_path: Path to the gitsync.py script.
+
+    Returns:
+        module: The imported gitsync module.
+    """
+    gitsync_dir = os.path.dirname(os.path.abspath(gitsync_path))
+    if gitsync_dir not in sys.path:
+        sys.path.insert(0, gitsync_dir)
+
+    spec = importlib.util.spec_from_file_location("gitsync", gitsync_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["gitsync"] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+# Function to run gitsync for a given repository
+def run_gitsync(gitsync, repo_path, options, jsonl=False):
+    # With JSON lines, stdout only carries the records and the progress goes to stderr
+    log = partial(print, file=sys.stderr if jsonl else sys.stdout)
+    try:
+        log(
             f"{BOLD}{BLUE}Starting synchronization for repository:{RESET} {YELLOW}{repo_path}{RESET}"
         )
-        # Execute gitsync.py as a subprocess
-        result = subprocess.run(
-            ["python", gitsync_path, repo_path], capture_output=True, text=True
-        )
-        if result.returncode == 0:
-            print(
-                f"{BOLD}{GREEN}Synchronization completed successfully for {YELLOW}{repo_path}{RESET}"
+        # Collect the output of each repository separately so parallel
+        # synchronizations do not interleave their messages
+        output = io.StringIO()
+        result = gitsync.sync_repo(repo_path, replace(options, out=output))
+
+        if jsonl:
+            # One write per record, so records of parallel workers never interleave
+            sys.stdout.write(result.to_json() + "\n")
+
+        if result.ok:
+            log(
+                f"{BOLD}{GREEN}Synchronization completed successfully for {YELLOW}{repo_path}{RESET} ({result.outcome})"
             )
         else:
-            print(
-                f"{BOLD}{RED}Error occurred in {YELLOW}{repo_path}{RED}:{RESET} {result.stderr}"
+            log(
+                f"{BOLD}{RED}Error occurred in {YELLOW}{repo_path}{RED}:{RESET} {result.outcome}\n{output.getvalue()}"
             )
+        return result
     except Exception as e:
-        print(
+        log(
             f"{BOLD}{RED}An exception occurred for {YELLOW}{repo_path}{RED}:{RESET} {e}"
         )
 
 
-# Function to process repositories with threading
-def process_repos_in_threads(gitsync_path, repo_paths, max_threads=4):
-    threads = []
+def start_queue(sync_queue, repo_paths, durations, restart=False, log=print):
+    """Start or resume the persistent run of the repositories
+
+    Args:
+        sync_queue: The SyncQueue of the state directory.
+        repo_paths: Repository paths as listed in the text file.
+        durations: Durations returned by `load_durations`.
+        restart: Start over even if the last run was interrupted.
+        log: Function used to print the progress messages.
+
+    Returns:
+        list: The repositories left to synchronize, longest first.
+    """
+    todo = sync_queue.start(order_longest_first(repo_paths, durations), restart)
+    done = sync_queue.resumed()
+    if done:
+        log(f"{BOLD}{YELLOW}Resuming the interrupted run:{RESET} {done} repositories already finished, {len(todo)} left")
+    return todo
+
+
+# Function to process repositories with a pool of worker threads
+def process_repos_in_threads(
+    gitsync,
+    repo_paths,
+    options=None,
+    max_threads=4,
+    adaptive_limit=None,
+    state_dir=None,
+    jsonl=False,
+    sync_queue=None,
+    restart=False,
+    limits=None,
+):
+    results = {}
+    state_dir = state_dir or DEFAULT_STATE_DIR
+    durations = load_durations(state_dir)
+    log = partial(print, file=sys.stderr if jsonl else sys.stdout)
 
-    for repo_path in repo_paths:
-        # Start a new thread to run gitsync.py for each repo
-        thread = threading.Thread(target=run_gitsync, args=(gitsync_path, repo_path))
-        threads.append(thread)
-        thread.start()
+    # Every worker takes the next due repository from the persistent queue as
+    # soon as it is done with its previous one, so a slow fetch never idles the others
+    sync_queue = sync_queue or syncqueue.SyncQueue(state_dir)
+    todo = start_queue(sync_queue, repo_paths, durations, restart, log)
 
-        # If we have reached the max_threads limit, wait for all to finish
-        if len(threads) == max_threads:
-            for t in threads:
-                t.join()  # Wait for all current threads to finish
-            threads = []  # Reset the thread list for the next batch
+    if adaptive_limit:
+        limiter = ConcurrencyLimiter(max_threads, 1, max(adaptive_limit, max_threads))
+    else:
+        limiter = ConcurrencyLimiter(max_threads)
 
-    # Ensure any remaining threads are completed
+    lock = threading.Lock()
+    # ls-remote results per remote URL, clones of the same remote are probed once
+    options = options or gitsync.SyncOptions()
+    options = replace(options, heads_cache=dict(options.heads_cache or {}))
+
+    def worker():
+        while True:
+            limiter.acquire()
+            # Blocks while the remaining repositories back off before a retry, or
+            # while every due repository waits for the budget of its host
+            repo_path = sync_queue.take(ready=limits.try_start if limits else None)
+            if repo_path is None:
+                limiter.release()
+                return
+
+            key = os.path.abspath(repo_path)
+            start = time.monotonic()
+            result = run_gitsync(gitsync, repo_path, options, jsonl)
+            elapsed = time.monotonic() - start
+            if limits:
+                limits.done(repo_path)
+
+            with lock:
+                if result:
+                    results[repo_path] = result
+                expected = durations.get(key)
+                # Smooth the history so one unusual run does not reorder everything
+                durations[key] = elapsed if expected is None else (expected + elapsed) / 2
+            limiter.release(elapsed, expected)
+
+            if sync_queue.finish(repo_path, result):
+                log(f"{YELLOW}Retrying {repo_path} after a backoff{RESET}")
+
+    threads = [
+        threading.Thread(target=worker)
+        for _ in range(min(limiter.max_limit, len(todo)))
+    ]
+    for t in threads:
+        t.start()
     for t in threads:
         t.join()
 
+    sync_queue.close()
+    save_durations(state_dir, durations)
+    return list(results.values())
 
-# Main function
-if __name__ == "__main__":
 
-    if len(sys.argv) != 3:
+# Function to process repositories concurrently from an asyncio event loop
+def process_repos_async(
+    gitsync,
+    repo_paths,
+    options=None,
+    jobs=64,
+    summary_interval=5.0,
+    state_dir=None,
+    jsonl=False,
+    sync_queue=None,
+    restart=False,
+    limits=None,
+):
+    import asyncsync  # Next to gitsync.py, importable once load_gitsync ran
+
+    results = {}
+    state_dir = state_dir or DEFAULT_STATE_DIR
+    durations = load_durations(state_dir)
+    log = partial(print, file=sys.stderr if jsonl else sys.stdout)
+
+    sync_queue = sync_queue or syncqueue.SyncQueue(state_dir)
+    start_queue(sync_queue, repo_paths, durations, restart, log)
+
+    # ls-remote results per remote URL, clones of the same remote are probed once
+    options = options or gitsync.SyncOptions()
+    options = replace(options, heads_cache=dict(options.heads_cache or {}))
+
+    def record(result):
+        results[result.path] = result
+        if sync_queue.finish(result.path, result):
+            log(f"{YELLOW}Retrying {result.path} after a backoff{RESET}")
+
+    # One event loop per round, every round runs the repositories that are due
+    while True:
+        batch = list(iter(lambda: sync_queue.take(block=False), None))
+        if not batch:
+            delay = sync_queue.next_delay()
+            if delay is None:
+                break
+            time.sleep(delay)
+            continue
+
+        asyncio.run(asyncsync.sync_all(batch, jobs, options, summary_interval, jsonl, on_result=record, limits=limits))
+
+    for result in results.values():
+        key = os.path.abspath(result.path)
+        expected = durations.get(key)
+        durations[key] = result.duration if expected is None else (expected + result.duration) / 2
+
+    sync_queue.close()
+    save_durations(state_dir, durations)
+    return list(results.values())
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    """Parse the command line, printing the help message on any error
+
+    Args:
+        argv: The command line arguments without the script name.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+
+    parser.add_argument("-h", "--help", action="store_true")
+    parser.add_argument("-j", "--jobs", type=int)
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    parser.add_argument("--summary", type=float, default=5.0)
+    parser.add_argument("--adaptive", action="store_true")
+    parser.add_argument("--max-jobs", type=int)
+    parser.add_argument("--state-dir", default=DEFAULT_STATE_DIR)
+    parser.add_argument("--all-branches", action="store_true")
+    parser.add_argument("--remote", action="append", default=[])
+    parser.add_argument("--object-cache", action="store_true")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--retry-delay", type=float, default=5.0)
+    parser.add_argument("--restart", action="store_true")
+    parser.add_argument("--discover", action="append", default=[])
+    parser.add_argument("--ignore", action="append", default=[])
+    parser.add_argument("--host-connections", type=int, default=8)
+    parser.add_argument("--host-rate", type=float, default=0.0)
+    parser.add_argument("--full-scan", action="store_true")
+    parser.add_argument("--no-probe", action="store_true")
+    parser.add_argument("--rebase", action="store_true")
+    parser.add_argument("--stream-threshold", type=int, default=5000)
+    parser.add_argument("--ssh-multiplex", action="store_true")
+    parser.add_argument("--format", choices=("text", "jsonl"), default="text")
+    parser.add_argument("--watch", action="store_true")
+    parser.add_argument("--debounce", type=float, default=2.0)
+    parser.add_argument("--probe-interval", type=float, default=60.0)
+    parser.add_argument("gitsync_path", nargs="?")
+    parser.add_argument("txt_file_path", nargs="?")
+
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit:
         print(HELP_MESSAGE)
         sys.exit(1)
 
-    gitsync_path = sys.argv[1]
-    txt_file_path = sys.argv[2]
+    if args.jobs is None:
+        args.jobs = 64 if args.use_async else 4
+
+    if args.help or not args.gitsync_path or not (args.txt_file_path or args.discover):
+        print(HELP_MESSAGE)
+        sys.exit(1)
+
+    # Option values and combinations that cannot work, each with its own reason
+    invalid = [
+        (args.jobs < 1, "--jobs must be at least 1"),
+        (args.retries < 0, "--retries cannot be negative"),
+        (args.host_connections < 0, "--host-connections cannot be negative"),
+        (args.host_rate < 0, "--host-rate cannot be negative"),
+        (args.use_async and args.watch, "--watch cannot be combined with --async"),
+        (args.use_async and args.all_branches, "--all-branches cannot be combined with --async"),
+        (args.watch and args.object_cache, "--watch cannot be combined with --object-cache"),
+    ]
+    for failed, reason in invalid:
+        if failed:
+            print(f"{BOLD}{RED}Error:{RESET} {reason}")
+            sys.exit(1)
+
+    return args
+
+
+# Main function
+if __name__ == "__main__":
+
+    args = parse_args(sys.argv[1:])
+
+    gitsync_path = args.gitsync_path
+    txt_file_path = args.txt_file_path
 
     # Check if gitsync.py exists
     if not os.path.isfile(gitsync_path):
@@ -106,25 +604,129 @@ if __name__ == "__main__":
         sys.exit(1)
 
     # Check if the text file with repo paths exists
-    if not os.path.isfile(txt_file_path):
+    if txt_file_path and not os.path.isfile(txt_file_path):
         print(
             f"{BOLD}{RED}Error:{RESET} Repository text file not found at {YELLOW}{txt_file_path}{RESET}"
         )
         sys.exit(1)
 
+    jsonl = args.format == "jsonl"
+    log = partial(print, file=sys.stderr if jsonl else sys.stdout)
+    repo_paths = []
+
     # Read the text file to get the repository paths
-    with open(txt_file_path, "r") as file:
-        repo_paths = [
-            (line.strip()).replace("'", "").replace('"', "")
-            for line in file
-            if line.strip()
-        ]
+    if txt_file_path:
+        with open(txt_file_path, "r") as file:
+            # Absolute paths, the working directory of the process is not stable
+            # while GitPython stages files in another thread
+            repo_paths = [
+                os.path.abspath((line.strip()).replace("'", "").replace('"', ""))
+                for line in file
+                if line.strip()
+            ]
+
+    for path in [path for path in repo_paths if not discovery.is_repository(path)]:
+        log(f"{YELLOW}Skipping {path}, it is not a Git repository{RESET}")
+        repo_paths.remove(path)
+
+    if args.discover:
+        found = discovery.discover(
+            args.discover,
+            args.state_dir,
+            discovery.DEFAULT_IGNORES + tuple(args.ignore),
+            jobs=max(args.jobs, 16),
+            log=log,
+        )
+        repo_paths = list(dict.fromkeys(repo_paths + found))
 
     if not repo_paths:
         print(
-            f"{BOLD}{RED}No valid repository paths found in {YELLOW}{txt_file_path}{RESET}"
+            f"{BOLD}{RED}No valid repository paths found in {YELLOW}{txt_file_path or ', '.join(args.discover)}{RESET}"
         )
         sys.exit(1)
 
-    # Run gitsync.py for each repository using threading
-    process_repos_in_threads(gitsync_path, repo_paths)
+    if args.ssh_multiplex:
+        enable_ssh_multiplexing(args.state_dir)
+
+    gitsync = load_gitsync(gitsync_path)
+    options = gitsync.SyncOptions(
+        remote=args.remote[0] if args.remote else "origin",
+        all_branches=args.all_branches,
+        remotes=tuple(args.remote),
+        snapshot=not args.full_scan,
+        probe=not args.no_probe,
+        strategy="rebase" if args.rebase else "merge",
+        stream_threshold=args.stream_threshold,
+    )
+
+    start = time.monotonic()
+
+    if args.object_cache:
+        import objectcache  # Next to gitsync.py, importable once load_gitsync ran
+
+        sources, heads = objectcache.prepare(
+            repo_paths,
+            os.path.join(args.state_dir, "objects"),
+            options.remote,
+            jobs=args.jobs,
+            log=partial(print, file=sys.stderr if jsonl else sys.stdout),
+        )
+        options = replace(options, fetch_sources=sources, heads_cache=heads)
+
+    if args.watch:
+        import watchsync  # Next to gitsync.py, importable once load_gitsync ran
+
+        watchsync.watch(
+            repo_paths,
+            partial(run_gitsync, gitsync, options=options, jsonl=jsonl),
+            jobs=args.jobs,
+            debounce=args.debounce,
+            probe_interval=args.probe_interval,
+            log=partial(print, file=sys.stderr if jsonl else sys.stdout),
+        )
+        sys.exit(0)
+
+    sync_queue = syncqueue.SyncQueue(args.state_dir, max_attempts=args.retries + 1, base_delay=args.retry_delay)
+
+    limits = None
+    if args.host_connections or args.host_rate:
+        import hostlimit  # Next to gitsync.py, importable once load_gitsync ran
+        import objectcache
+
+        # Read from the config files, resolving the hosts starts no git process
+        hosts = {path: hostlimit.remote_host(objectcache.remote_url(path, options.remote)) for path in repo_paths}
+        limits = hostlimit.HostLimits(hosts, args.host_connections, args.host_rate)
+
+    if args.use_async:
+        results = process_repos_async(
+            gitsync,
+            repo_paths,
+            options,
+            jobs=args.jobs,
+            summary_interval=args.summary,
+            state_dir=args.state_dir,
+            jsonl=jsonl,
+            sync_queue=sync_queue,
+            restart=args.restart,
+            limits=limits,
+        )
+    else:
+        # Run gitsync for each repository using threading
+        results = process_repos_in_threads(
+            gitsync,
+            repo_paths,
+            options,
+            max_threads=args.jobs,
+            adaptive_limit=(args.max_jobs or 4 * args.jobs) if args.adaptive else None,
+            state_dir=args.state_dir,
+            jsonl=jsonl,
+            sync_queue=sync_queue,
+            restart=args.restart,
+            limits=limits,
+        )
+
+    summary = summarize(results, gitsync.PHASES, time.monotonic() - start)
+    if jsonl:
+        print(json.dumps(summary))
+    else:
+        print_run_summary(summary)
@@ -0,0 +1,154 @@
+import os
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from repostate import git_dir, read_remote_url
+
+
+def git(cwd: str, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+        env=dict(os.environ, GIT_TERMINAL_PROMPT="0"),
+    ).stdout
+
+
+def remote_url(path: str, remote: str = "origin") -> str:
+    """Read the URL of a remote from the repository configuration
+
+    Args:
+        path: Path to the working tree.
+        remote: Name of the remote.
+
+    Returns:
+        str: The URL, empty if the remote does not exist.
+    """
+    # Read from the config file, a git process per repository would cost more than the sync of an unchanged one
+    return read_remote_url(git_dir(path), remote)
+
+
+def mirror_path(cache_dir: str, url: str) -> str:
+    """Path of the bare mirror of a remote URL inside the cache directory"""
+    return os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest()[:16] + ".git")
+
+
+def update_mirror(cache_dir: str, url: str) -> str:
+    """Create or update the bare mirror of a remote, the one network fetch per remote and run
+
+    Repositories borrow objects from the mirror through alternates, so the
+    mirror must never drop objects: automatic gc is disabled and deleted
+    branches are not pruned.
+
+    Args:
+        cache_dir: Directory holding the mirrors.
+        url: URL of the remote.
+
+    Returns:
+        str: Path to the mirror.
+    """
+    mirror = mirror_path(cache_dir, url)
+    if not os.path.isdir(mirror):
+        os.makedirs(cache_dir, exist_ok=True)
+        git(cache_dir, "init", "--quiet", "--bare", mirror)
+        git(mirror, "config", "gc.auto", "0")
+        git(mirror, "config", "remote.origin.url", url)
+
+    git(mirror, "fetch", "--quiet", "--no-tags", url, "+refs/heads/*:refs/heads/*")
+    return mirror
+
+
+def mirror_heads(mirror: str) -> dict[str, str]:
+    """Read the branches of a mirror, in the form `git ls-remote --heads` reports them
+
+    Args:
+        mirror: Path to the mirror.
+
+    Returns:
+        dict: "refs/heads/<branch>" -> commit SHA.
+    """
+    heads = {}
+    for line in git(mirror, "for-each-ref", "--format=%(objectname) %(refname)", "refs/heads").splitlines():
+        sha, _, ref = line.partition(" ")
+        heads[ref] = sha
+
+    return heads
+
+
+def link_alternates(path: str, mirror: str) -> None:
+    """Let a repository read objects from the mirror instead of copying them
+
+    Args:
+        path: Path to the working tree.
+        mirror: Path to the mirror.
+    """
+    gdir = git_dir(path)
+    try:
+        with open(os.path.join(gdir, "commondir"), "r") as file:
+            gdir = os.path.normpath(os.path.join(gdir, file.read().strip()))
+    except OSError:
+        pass
+
+    alternates = os.path.join(gdir, "objects", "info", "alternates")
+    objects = os.path.join(os.path.abspath(mirror), "objects")
+    try:
+        with open(alternates, "r") as file:
+            if objects in file.read().splitlines():
+                return
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(alternates), exist_ok=True)
+    with open(alternates, "a") as file:
+        file.write(objects + "\n")
+
+
+def prepare(repo_paths: list[str], cache_dir: str, remote: str = "origin", jobs: int = 4, log=print) -> tuple[dict, dict]:
+    """Fetch every remote shared by several repositories once into the object cache
+
+    Only remote URLs used by at least two repositories are cached, a single
+    clone gains nothing from going through a mirror. A clone that pushes to a
+    cached remote also pushes to its mirror and drops its heads, and a clone
+    whose push is rejected because the mirror missed a push fetches the
+    remote itself.
+
+    Args:
+        repo_paths: Paths to the working trees.
+        cache_dir: Directory holding the mirrors.
+        remote: Name of the remote in the repositories.
+        jobs: Number of mirrors updated at the same time.
+        log: Function used to print the progress messages.
+
+    Returns:
+        tuple: (remote URL -> mirror path, remote URL -> heads of the mirror), for
+            `SyncOptions.fetch_sources` and `SyncOptions.heads_cache`.
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        urls = dict(zip(repo_paths, pool.map(lambda path: remote_url(path, remote), repo_paths)))
+
+        clones = {}
+        for path, url in urls.items():
+            if url:
+                clones.setdefault(url, []).append(path)
+        shared = [url for url, paths in clones.items() if len(paths) > 1]
+
+        def one(url: str):
+            try:
+                return url, update_mirror(cache_dir, url)
+            except subprocess.CalledProcessError as e:
+                log(f"Cannot update the object cache of {url}, its clones fetch directly: {e.stderr.strip()}")
+                return url, None
+
+        sources, heads = {}, {}
+        for url, mirror in pool.map(one, shared):
+            if mirror:
+                for path in clones[url]:
+                    link_alternates(path, mirror)
+                sources[url] = mirror
+                heads[url] = mirror_heads(mirror)
+
+    log(f"Fetched {len(sources)} shared remotes once for {sum(len(clones[url]) for url in sources)} repositories")
+    return sources, heads
@@ -0,0 +1,334 @@
+import os
+import json
+import time
+import hashlib
+import subprocess
+import configparser
+from dataclasses import dataclass, field, asdict, fields, replace
+
+# Stored inside the .git directory so it never shows up as an untracked file
+STATE_FILE = "gitsync-state.json"
+
+# Files modified this close to the snapshot could change again within the
+# same timestamp tick, so such a snapshot is not trusted (like git's racy-clean check)
+RACY_WINDOW_NS = 2_000_000_000
+
+# Number of (local SHA, remote SHA) pairs whose merge-base is remembered
+MERGE_BASE_CACHE_SIZE = 16
+
+
+@dataclass
+class RepoState:
+    """What gitsync knows about a repository after its last successful sync
+
+    Attributes:
+        head: Commit SHA of HEAD.
+        remote_ref: Full name of the remote tracking ref eg. "refs/remotes/origin/main".
+        remote_sha: Commit SHA of the remote tracking ref.
+        fingerprint: Working tree fingerprint from `tree_fingerprint`, empty if unknown.
+        ignored: Directories git ignores completely, relative to the working tree, left out of the fingerprint.
+        merge_bases: "<local SHA>..<remote SHA>" -> [merge-base SHA, ahead, behind].
+    """
+
+    head: str = ""
+    remote_ref: str = ""
+    remote_sha: str = ""
+    fingerprint: str = ""
+    ignored: list = field(default_factory=list)
+    merge_bases: dict = field(default_factory=dict)
+
+
+def git_dir(path: str) -> str:
+    """Find the .git directory of a working tree, following `gitdir:` files of worktrees
+
+    Args:
+        path: Path to the working tree.
+
+    Returns:
+        str: Path to the git directory.
+    """
+    dot_git = os.path.join(path, ".git")
+    if os.path.isfile(dot_git):
+        with open(dot_git, "r") as file:
+            target = file.read().strip().removeprefix("gitdir:").strip()
+        return os.path.normpath(os.path.join(path, target))
+
+    return dot_git
+
+
+def _common_dir(gdir: str) -> str:
+    try:
+        with open(os.path.join(gdir, "commondir"), "r") as file:
+            return os.path.normpath(os.path.join(gdir, file.read().strip()))
+    except OSError:
+        return gdir
+
+
+def read_ref(gdir: str, ref: str) -> str:
+    """Resolve a ref to a commit SHA by reading the ref files, without running git
+
+    Args:
+        gdir: Path to the git directory.
+        ref: Full ref name eg. "HEAD" or "refs/remotes/origin/main".
+
+    Returns:
+        str: The commit SHA, empty if the ref does not exist.
+    """
+    for _ in range(10):  # Symbolic refs rarely nest, but never loop forever
+        base = gdir if ref == "HEAD" else _common_dir(gdir)
+        try:
+            with open(os.path.join(base, ref), "r") as file:
+                value = file.read().strip()
+        except OSError:
+            return _packed_ref(_common_dir(gdir), ref)
+
+        if not value.startswith("ref:"):
+            return value
+        ref = value[4:].strip()
+
+    return ""
+
+
+def _packed_ref(common_dir: str, ref: str) -> str:
+    try:
+        with open(os.path.join(common_dir, "packed-refs"), "r") as file:
+            for line in file:
+                sha, _, name = line.rstrip("\n").partition(" ")
+                if name == ref:
+                    return sha
+    except OSError:
+        pass
+
+    return ""
+
+
+def read_remote_url(gdir: str, remote: str) -> str:
+    """Read the URL of a remote from the config file, without running git
+
+    Files included with `[include]` are not followed.
+
+    Args:
+        gdir: Path to the git directory.
+        remote: Name of the remote.
+
+    Returns:
+        str: The URL, empty if the remote is not configured or the config cannot be read.
+    """
+    # Keys may repeat (eg. several fetch refspecs) or have no value (boolean true)
+    config = configparser.ConfigParser(strict=False, allow_no_value=True, interpolation=None)
+    try:
+        config.read(os.path.join(_common_dir(gdir), "config"))
+    except configparser.Error:
+        return ""
+
+    url = config.get(f'remote "{remote}"', "url", fallback=None) or ""
+    if len(url) > 1 and url[0] == url[-1] == '"':
+        url = url[1:-1]
+    return url
+
+
+def ignored_directories(path: str) -> set[str]:
+    """List the directories of a working tree that git ignores completely
+
+    Build outputs and dependency folders like `node_modules` can hold more
+    directories than the whole project and never change what gets committed.
+
+    Args:
+        path: Path to the working tree.
+
+    Returns:
+        set: Absolute paths of the ignored directories.
+    """
+    try:
+        output = subprocess.run(
+            ["git", "ls-files", "--others", "--ignored", "--exclude-standard", "--directory", "-z"],
+            cwd=path,
+            capture_output=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return set()
+
+    return {
+        os.path.join(path, os.fsdecode(entry).rstrip("/"))
+        for entry in output.split(b"\0")
+        if entry.endswith(b"/")
+    }
+
+
+def tree_fingerprint(path: str, gdir: str, ignored: list = ()) -> str:
+    """Fingerprint the working tree from the stat data of its directories and files
+
+    Adding, removing or renaming a file changes the mtime of its directory,
+    editing a file changes its own mtime or size, and staging changes the
+    index file. Hashing all of them detects any change without running git.
+    Ignored directories are not walked, creating or deleting one still
+    changes the mtime of its parent.
+
+    Args:
+        path: Path to the working tree.
+        gdir: Path to the git directory.
+        ignored: Directories git ignores, relative to the working tree.
+
+    Returns:
+        str: The fingerprint, empty if a file changed too recently to be trusted.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    racy_after = time.time_ns() - RACY_WINDOW_NS
+    newest = 0
+    skipped = {os.path.join(path, name) for name in ignored}
+
+    # Editing the exclude file can make an ignored directory count again
+    for name in ("index", os.path.join("info", "exclude")):
+        try:
+            stat = os.stat(os.path.join(gdir, name))
+            digest.update(f"{name}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode())
+        except OSError:
+            pass
+
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        for entry in entries:
+            if entry.name == ".git" or entry.path in skipped:
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+
+            newest = max(newest, stat.st_mtime_ns)
+            digest.update(f"{entry.path}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode(errors="surrogateescape"))
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+
+    return "" if newest > racy_after else digest.hexdigest()
+
+
+def load_state(gdir: str) -> RepoState:
+    """Load the state saved by the last successful sync
+
+    Args:
+        gdir: Path to the git directory.
+
+    Returns:
+        RepoState: The saved state, an empty RepoState if there is none.
+    """
+    try:
+        with open(os.path.join(gdir, STATE_FILE), "r") as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return RepoState()
+
+    known = {item.name for item in fields(RepoState)}
+    return RepoState(**{key: value for key, value in data.items() if key in known})
+
+
+def save_state(gdir: str, state: RepoState) -> None:
+    """Atomically save the state of a repository
+
+    Args:
+        gdir: Path to the git directory.
+        state: The RepoState to save.
+    """
+    path = os.path.join(gdir, STATE_FILE)
+    with open(path + ".tmp", "w") as file:
+        json.dump(asdict(state), file, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def is_unchanged(path: str, gdir: str, state: RepoState) -> bool:
+    """Check if the working tree and HEAD are exactly as the last successful sync left them
+
+    Args:
+        path: Path to the working tree.
+        gdir: Path to the git directory.
+        state: The state returned by `load_state`.
+
+    Returns:
+        bool: True if the status scan can be skipped.
+    """
+    if not state.fingerprint or not state.head:
+        return False
+    if read_ref(gdir, "HEAD") != state.head:
+        return False
+
+    return tree_fingerprint(path, gdir, state.ignored) == state.fingerprint
+
+
+def cached_ahead_behind(state: RepoState, local: str, remote: str) -> tuple:
+    """Look up the merge-base and ahead/behind counts of a commit pair
+
+    Args:
+        state: The state returned by `load_state`.
+        local: Commit SHA of the local branch.
+        remote: Commit SHA of the remote branch.
+
+    Returns:
+        tuple: (merge-base, ahead, behind), None if the pair is not cached.
+    """
+    if local == remote:
+        return (local, 0, 0)
+
+    cached = state.merge_bases.get(f"{local}..{remote}")
+    return tuple(cached) if cached else None
+
+
+def remember_ahead_behind(state: RepoState, local: str, remote: str, base: str, ahead: int, behind: int) -> None:
+    """Cache the merge-base and ahead/behind counts of a commit pair
+
+    Commits are immutable, so the result for a pair never goes stale. Only
+    the most recent `MERGE_BASE_CACHE_SIZE` pairs are kept.
+
+    Args:
+        state: The RepoState the pair is cached in.
+        local: Commit SHA of the local branch.
+        remote: Commit SHA of the remote branch.
+        base: Commit SHA of their merge-base.
+        ahead: Number of commits only on the local branch.
+        behind: Number of commits only on the remote branch.
+    """
+    key = f"{local}..{remote}"
+    state.merge_bases.pop(key, None)
+    state.merge_bases[key] = [base, ahead, behind]
+
+    while len(state.merge_bases) > MERGE_BASE_CACHE_SIZE:
+        state.merge_bases.pop(next(iter(state.merge_bases)))
+
+
+def take_snapshot(path: str, gdir: str, remote_ref: str, state: RepoState = None) -> RepoState:
+    """Record HEAD, the remote tracking ref and the working tree fingerprint
+
+    The ignored directories are only listed again (with git) when the
+    working tree changed since the previous snapshot.
+
+    Args:
+        path: Path to the working tree.
+        gdir: Path to the git directory.
+        remote_ref: Full name of the remote tracking ref.
+        state: The previous state, its merge-base cache and ignored directories are kept.
+
+    Returns:
+        RepoState: The current state of the repository.
+    """
+    state = state or RepoState()
+    ignored = state.ignored
+    fingerprint = tree_fingerprint(path, gdir, ignored)
+    if not fingerprint or fingerprint != state.fingerprint:
+        ignored = sorted(os.path.relpath(directory, path) for directory in ignored_directories(path))
+        fingerprint = tree_fingerprint(path, gdir, ignored)
+
+    return replace(
+        state,
+        head=read_ref(gdir, "HEAD"),
+        remote_ref=remote_ref,
+        remote_sha=read_ref(gdir, remote_ref),
+        fingerprint=fingerprint,
+        ignored=ignored,
+    )
@@ -0,0 +1,255 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+from typing import Callable
+
+QUEUE_FILE = "queue.sqlite"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Seconds between two offers of due jobs that `SyncQueue.take` was not ready for
+READY_POLL_INTERVAL = 0.1
+
+# Failures that another attempt cannot fix, they need a human
+PERMANENT_ERRORS = ("Unrelated histories",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    run INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    outcome TEXT,
+    error TEXT,
+    updated REAL,
+    PRIMARY KEY (run, path)
+);
+CREATE TABLE IF NOT EXISTS repos (
+    path TEXT PRIMARY KEY,
+    last_success REAL,
+    last_outcome TEXT,
+    last_error TEXT,
+    failed_runs INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def backoff(attempts: int, base: float, cap: float) -> float:
+    """Delay before the next attempt, exponential with full jitter
+
+    Spreading the retries randomly over the whole window keeps repositories
+    that failed together (eg. during a network outage) from retrying together.
+
+    Args:
+        attempts: Number of attempts made so far, at least 1.
+        base: Upper bound of the delay after the first attempt, in seconds.
+        cap: Upper bound of any delay, in seconds.
+
+    Returns:
+        float: Seconds to wait.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempts - 1)))
+
+
+class SyncQueue:
+    """Persistent job queue of a multisync run, backed by SQLite
+
+    Every repository of a run is a job that moves from `PENDING` over
+    `RUNNING` to `DONE` or `FAILED`, and every transition is committed
+    immediately. A run that was killed is resumed by the next one with only
+    its unfinished jobs. Transient failures go back to `PENDING` with an
+    exponential backoff until `max_attempts` is reached. Thread safe.
+
+    Args:
+        state_dir: Directory holding the multisync state files.
+        max_attempts: Attempts per repository and run, 1 disables retries.
+        base_delay: Upper bound of the first retry delay in seconds.
+        max_delay: Upper bound of any retry delay in seconds.
+    """
+
+    def __init__(self, state_dir: str, max_attempts: int = 3, base_delay: float = 5.0, max_delay: float = 300.0):
+        os.makedirs(state_dir, exist_ok=True)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.run = None
+
+        self._db = sqlite3.connect(os.path.join(state_dir, QUEUE_FILE), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._cond = threading.Condition()
+
+    def close(self) -> None:
+        """Mark the run finished if no job is left, and close the database"""
+        with self._cond:
+            left = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE run = ? AND status IN (?, ?)", (self.run, PENDING, RUNNING)
+            ).fetchone()[0]
+            if self.run is not None and not left:
+                with self._db:
+                    self._db.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), self.run))
+            self._db.close()
+
+    def start(self, repo_paths: list[str], restart: bool = False) -> list[str]:
+        """Start a run, or resume the last one if it was interrupted
+
+        Args:
+            repo_paths: Repository paths in scheduling order.
+            restart: Start a new run even if the last one was interrupted.
+
+        Returns:
+            list: The repositories this run still has to synchronize, in scheduling order.
+        """
+        with self._cond, self._db:
+            last = self._db.execute("SELECT id FROM runs WHERE finished IS NULL ORDER BY id DESC LIMIT 1").fetchone()
+
+            if last and not restart:
+                self.run = last[0]
+                known = dict(self._db.execute("SELECT path, status FROM jobs WHERE run = ?", (self.run,)))
+                # Jobs that were running when the process died start over
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, next_attempt = 0 WHERE run = ? AND status = ?",
+                    (PENDING, self.run, RUNNING),
+                )
+                # Unfinished jobs of repositories that are no longer in the list are not synced
+                wanted = set(repo_paths)
+                dropped = [path for path, status in known.items() if status in (PENDING, RUNNING) and path not in wanted]
+                self._db.executemany("DELETE FROM jobs WHERE run = ? AND path = ?", [(self.run, path) for path in dropped])
+            else:
+                self._db.execute("UPDATE runs SET finished = ? WHERE finished IS NULL", (time.time(),))
+                self.run = self._db.execute("INSERT INTO runs (started) VALUES (?)", (time.time(),)).lastrowid
+                known = {}
+
+            todo = []
+            for position, path in enumerate(repo_paths):
+                if known.get(path) in (DONE, FAILED):
+                    continue
+                self._db.execute(
+                    "INSERT INTO jobs (run, path, position, status) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (run, path) DO UPDATE SET position = excluded.position",
+                    (self.run, path, position, PENDING),
+                )
+                todo.append(path)
+
+            return todo
+
+    def resumed(self) -> int:
+        """Number of jobs of the current run that were finished by an earlier, interrupted process"""
+        return self._db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE run = ? AND status IN (?, ?)", (self.run, DONE, FAILED)
+        ).fetchone()[0]
+
+    def take(self, block: bool = True, ready: Callable[[str], bool] = None) -> str:
+        """Take the next due job and mark it running
+
+        Args:
+            block: Wait for jobs that are backing off or could still fail and come back.
+            ready: Called with the due jobs in scheduling order, the first one it accepts
+                is taken. Due jobs it refuses are offered again every `READY_POLL_INTERVAL`.
+
+        Returns:
+            str: The repository path, None when the run has nothing left to do.
+        """
+        with self._cond:
+            while True:
+                now = time.time()
+                due = self._db.execute(
+                    "SELECT path FROM jobs WHERE run = ? AND status = ? AND next_attempt <= ? ORDER BY position",
+                    (self.run, PENDING, now),
+                )
+                refused = False
+                for (path,) in due:
+                    if ready and not ready(path):
+                        refused = True
+                        continue
+
+                    due.close()
+                    with self._db:
+                        self._db.execute(
+                            "UPDATE jobs SET status = ?, updated = ? WHERE run = ? AND path = ?",
+                            (RUNNING, now, self.run, path),
+                        )
+                    return path
+
+                delay = READY_POLL_INTERVAL if refused else self.next_delay()
+                if delay is None or not block:
+                    return None
+                self._cond.wait(timeout=delay or None)
+
+    def next_delay(self) -> float:
+        """Seconds until the next job is due
+
+        Returns:
+            float: 0 if only running jobs are left (they may come back), None if nothing is left.
+        """
+        pending, running = self._db.execute(
+            "SELECT MIN(CASE WHEN status = ? THEN next_attempt END), COUNT(CASE WHEN status = ? THEN 1 END) "
+            "FROM jobs WHERE run = ?",
+            (PENDING, RUNNING, self.run),
+        ).fetchone()
+
+        if pending is not None:
+            return max(pending - time.time(), 0.001)
+        return 0 if running else None
+
+    def finish(self, path: str, result) -> bool:
+        """Record the result of a job, scheduling a retry for transient failures
+
+        Args:
+            path: The repository path returned by `take`.
+            result: Its SyncResult, None if the synchronization raised.
+
+        Returns:
+            bool: True if the repository will be retried.
+        """
+        now = time.time()
+        ok = result is not None and result.ok
+        outcome = result.outcome if result is not None else "error"
+        error = result.error if result is not None else "exception"
+
+        with self._cond, self._db:
+            attempts = self._db.execute(
+                "SELECT attempts FROM jobs WHERE run = ? AND path = ?", (self.run, path)
+            ).fetchone()[0] + 1
+
+            # Conflicts need a human, errors are usually the network or the host
+            transient = not ok and outcome == "error" and error not in PERMANENT_ERRORS
+            retry = transient and attempts < self.max_attempts
+
+            status = DONE if ok else PENDING if retry else FAILED
+            next_attempt = now + backoff(attempts, self.base_delay, self.max_delay) if retry else 0
+            self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, next_attempt = ?, outcome = ?, error = ?, updated = ? "
+                "WHERE run = ? AND path = ?",
+                (status, attempts, next_attempt, outcome, error, now, self.run, path),
+            )
+
+            if ok:
+                self._db.execute(
+                    "INSERT INTO repos (path, last_success, last_outcome, last_error, failed_runs) VALUES (?, ?, ?, '', 0) "
+                    "ON CONFLICT (path) DO UPDATE SET last_success = excluded.last_success, "
+                    "last_outcome = excluded.last_outcome, last_error = '', failed_runs = 0",
+                    (path, now, outcome),
+                )
+            elif not retry:
+                self._db.execute(
+                    "INSERT INTO repos (path, last_outcome, last_error, failed_runs) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT (path) DO UPDATE SET last_outcome = excluded.last_outcome, "
+                    "last_error = excluded.last_error, failed_runs = failed_runs + 1",
+                    (path, outcome, error),
+                )
+
+            self._cond.notify_all()
+            return retry
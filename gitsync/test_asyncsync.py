@@ -0,0 +1,144 @@
+import asyncio
+import os
+import subprocess
+import tempfile
+import unittest
+
+from asyncsync import remote_changed_async, sync_repo_async
+from gitsync import SyncOptions, ERROR, IN_SYNC, MERGED, PUSHED
+from repostate import git_dir, load_state
+
+
+def git(path, *args):
+    return subprocess.run(["git", *args], cwd=path, capture_output=True, text=True, check=True).stdout.strip()
+
+
+class AsyncSyncTest(unittest.TestCase):
+    """Clones of a bare repository on a file:// URL, synced with the asyncio engine"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.origin = os.path.join(self.tmp.name, "origin.git")
+        self.url = "file://" + self.origin
+        git(self.tmp.name, "init", "-q", "--bare", "-b", "main", self.origin)
+
+        seed = self.clone("seed")
+        self.commit(seed, "README", "seed\n")
+        git(seed, "push", "-q", "-u", "origin", "main")
+
+    def clone(self, name):
+        path = os.path.join(self.tmp.name, name)
+        git(self.tmp.name, "clone", "-q", self.url, path)
+        git(path, "config", "user.name", "test")
+        git(path, "config", "user.email", "test@example.com")
+        return path
+
+    def commit(self, path, name, text):
+        with open(os.path.join(path, name), "w") as file:
+            file.write(text)
+        git(path, "add", name)
+        git(path, "commit", "-q", "-m", name)
+
+    def sync(self, path, **options):
+        return asyncio.run(sync_repo_async(path, SyncOptions(**options)))
+
+    def test_local_changes_are_committed_and_pushed(self):
+        path = self.clone("a")
+        with open(os.path.join(path, "notes.txt"), "w") as file:
+            file.write("hello\n")
+
+        result = self.sync(path)
+        self.assertEqual(result.outcome, PUSHED, result.error)
+        self.assertTrue(result.committed)
+        self.assertEqual(result.untracked, 1)
+        self.assertEqual(git(self.origin, "rev-parse", "main"), git(path, "rev-parse", "HEAD"))
+
+    def test_remote_commits_are_merged(self):
+        path = self.clone("a")
+        self.commit(os.path.join(self.tmp.name, "seed"), "other.txt", "other\n")
+        git(os.path.join(self.tmp.name, "seed"), "push", "-q")
+
+        result = self.sync(path)
+        self.assertEqual(result.outcome, MERGED, result.error)
+        self.assertEqual(git(path, "rev-parse", "HEAD"), git(self.origin, "rev-parse", "main"))
+
+        self.assertEqual(self.sync(path).outcome, IN_SYNC)
+
+    def test_switching_branch_syncs_the_new_upstream(self):
+        seed = os.path.join(self.tmp.name, "seed")
+        git(seed, "push", "-q", "origin", "main:feature")
+        path = self.clone("a")
+        self.assertEqual(self.sync(path).outcome, IN_SYNC)
+        self.assertEqual(load_state(git_dir(path)).remote_ref, "refs/remotes/origin/main")
+
+        git(path, "checkout", "-q", "feature")
+        git(seed, "fetch", "-q")
+        git(seed, "checkout", "-q", "feature")
+        self.commit(seed, "feature.txt", "feature\n")
+        git(seed, "push", "-q", "origin", "feature")
+
+        result = self.sync(path)
+        self.assertEqual(result.outcome, MERGED, result.error)
+        self.assertEqual(git(path, "rev-parse", "HEAD"), git(self.origin, "rev-parse", "feature"))
+        self.assertEqual(load_state(git_dir(path)).remote_ref, "refs/remotes/origin/feature")
+
+    def test_push_rejected_after_a_stale_probe_is_synced_again(self):
+        path = self.clone("a")
+        # The cached heads still show the remote as it was when the clone was made
+        heads_cache = {self.url: {"refs/heads/main": git(path, "rev-parse", "origin/main")}}
+
+        seed = os.path.join(self.tmp.name, "seed")
+        self.commit(seed, "other.txt", "other\n")
+        git(seed, "push", "-q")
+        self.commit(path, "mine.txt", "mine\n")
+
+        result = self.sync(path, heads_cache=heads_cache)
+        self.assertEqual(result.outcome, PUSHED, result.error)
+        self.assertEqual(git(self.origin, "rev-parse", "main"), git(path, "rev-parse", "HEAD"))
+        self.assertNotIn(self.url, heads_cache)
+
+    def test_unrelated_histories_are_reported(self):
+        path = self.clone("a")
+        other = os.path.join(self.tmp.name, "other")
+        git(self.tmp.name, "init", "-q", "-b", "main", other)
+        git(other, "config", "user.name", "test")
+        git(other, "config", "user.email", "test@example.com")
+        self.commit(other, "unrelated.txt", "unrelated\n")
+        git(other, "push", "-q", "--force", self.url, "main")
+
+        result = self.sync(path)
+        self.assertEqual(result.outcome, ERROR)
+        self.assertEqual(result.error, "Unrelated histories")
+
+
+class ProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.gdir = os.path.join(self.tmp.name, ".git")
+        os.makedirs(os.path.join(self.gdir, "refs", "remotes", "origin"))
+        with open(os.path.join(self.gdir, "refs", "remotes", "origin", "main"), "w") as file:
+            file.write("a" * 40 + "\n")
+
+    def probe(self, heads_cache):
+        # The path is not a repository, so any ls-remote would fail
+        return asyncio.run(
+            remote_changed_async(
+                self.tmp.name, self.gdir, "origin", "refs/remotes/origin/main", heads_cache, "https://example.com/r.git"
+            )
+        )
+
+    def test_cached_heads_are_used_without_asking_the_remote(self):
+        self.assertFalse(self.probe({"https://example.com/r.git": {"refs/heads/main": "a" * 40}}))
+        self.assertTrue(self.probe({"https://example.com/r.git": {"refs/heads/main": "b" * 40}}))
+
+    def test_failed_probe_is_not_cached(self):
+        heads_cache = {}
+        with self.assertRaises(Exception):
+            self.probe(heads_cache)
+        self.assertEqual(heads_cache, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
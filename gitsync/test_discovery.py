@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from discovery import DEFAULT_IGNORES, discover, load_cache
+
+
+class DiscoverTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "code")
+        self.state_dir = os.path.join(self.tmp.name, "state")
+
+        for repo in ("work/api", "work/web", "personal/notes", "work/web/vendor/lib", "work/node_modules/pkg"):
+            os.makedirs(os.path.join(self.root, repo, ".git"))
+        os.makedirs(os.path.join(self.root, "empty"))
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def touch(self, name):
+        """Move the mtime of a directory forward, as a change within the same clock tick might not"""
+        stat = os.stat(self.path(name))
+        os.utime(self.path(name), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def discover(self, **kwargs):
+        self.messages = []
+        return discover([self.root], self.state_dir, log=self.messages.append, **kwargs)
+
+    def test_finds_repositories_but_not_nested_or_ignored_ones(self):
+        self.assertEqual(self.discover(), [self.path("personal/notes"), self.path("work/api"), self.path("work/web")])
+
+    def test_unchanged_directories_are_not_listed_again(self):
+        first = self.discover()
+        self.assertIn("(7 listed, 0 unchanged)", self.messages[-1])
+
+        self.assertEqual(self.discover(), first)
+        self.assertIn("(0 listed, 7 unchanged)", self.messages[-1])
+
+    def test_directory_changed_between_scans(self):
+        self.discover()
+        os.makedirs(os.path.join(self.root, "personal", "blog", ".git"))
+        shutil.rmtree(self.path("work/api"))
+        self.touch("personal")
+        self.touch("work")
+
+        self.assertEqual(self.discover(), [self.path("personal/blog"), self.path("personal/notes"), self.path("work/web")])
+        self.assertNotIn(self.path("work/api"), load_cache(self.state_dir, DEFAULT_IGNORES))
+
+    def test_other_ignore_patterns_drop_the_cache(self):
+        self.discover()
+        self.assertEqual(load_cache(self.state_dir, ("work",)), {})
+        self.assertEqual(self.discover(ignores=("work",)), [self.path("personal/notes")])
+
+    def test_missing_root_is_reported(self):
+        messages = []
+        self.assertEqual(discover([self.path("missing")], self.state_dir, log=messages.append), [])
+        self.assertTrue(messages[0].startswith(f"Cannot search {self.path('missing')}"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from unittest import mock
+
+from hostlimit import HostLimits, TokenBucket, remote_host
+
+
+class Clock:
+    """Stands in for time.monotonic, moved by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RemoteHostTest(unittest.TestCase):
+    def test_url_forms(self):
+        self.assertEqual(remote_host("https://GitHub.com/user/repo.git"), "github.com")
+        self.assertEqual(remote_host("ssh://git@gitlab.example.com:2222/repo.git"), "gitlab.example.com")
+        self.assertEqual(remote_host("git@github.com:user/repo.git"), "github.com")
+        self.assertEqual(remote_host("server:repo.git"), "server")
+
+    def test_local_paths_have_no_host(self):
+        self.assertEqual(remote_host("/srv/git/repo.git"), "")
+        self.assertEqual(remote_host("file:///srv/git/repo.git"), "")
+        self.assertEqual(remote_host("./dir:with/colon"), "")
+        self.assertEqual(remote_host("C:\\repos\\repo.git"), "")
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("hostlimit.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_starts_full_and_allows_a_burst(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+
+    def test_refills_at_the_rate(self):
+        bucket = TokenBucket(rate=2, burst=1)
+        self.assertTrue(bucket.take())
+        self.clock.now += 0.25
+        self.assertFalse(bucket.take())
+        self.clock.now += 0.25
+        self.assertTrue(bucket.take())
+
+    def test_never_holds_more_than_the_burst(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.clock.now += 60
+        self.assertEqual([bucket.take() for _ in range(3)], [True, True, False])
+
+
+class HostLimitsTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("hostlimit.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hosts = {"/a": "github.com", "/b": "github.com", "/c": "gitlab.com", "/local": ""}
+
+    def test_concurrent_synchronizations_per_host(self):
+        limits = HostLimits(self.hosts, connections=1)
+        self.assertTrue(limits.try_start("/a"))
+        self.assertFalse(limits.try_start("/b"))
+        self.assertTrue(limits.try_start("/c"))
+
+        limits.done("/a")
+        self.assertTrue(limits.try_start("/b"))
+
+    def test_starts_per_second_and_host(self):
+        limits = HostLimits(self.hosts, rate=1)
+        self.assertTrue(limits.try_start("/a"))
+        self.assertFalse(limits.try_start("/b"))
+        self.assertTrue(limits.try_start("/c"))
+
+        self.clock.now += 1
+        self.assertTrue(limits.try_start("/b"))
+
+    def test_refused_start_takes_no_token(self):
+        limits = HostLimits(self.hosts, connections=1, rate=1)
+        self.assertTrue(limits.try_start("/a"))
+        self.clock.now += 1
+        self.assertFalse(limits.try_start("/b"))  # No connection left, the token stays
+
+        limits.done("/a")
+        self.assertTrue(limits.try_start("/b"))
+
+    def test_local_and_unknown_repositories_are_never_limited(self):
+        limits = HostLimits(self.hosts, connections=1, rate=1)
+        self.assertTrue(all(limits.try_start("/local") for _ in range(5)))
+        self.assertTrue(all(limits.try_start("/unknown") for _ in range(5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
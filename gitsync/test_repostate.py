@@ -0,0 +1,182 @@
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+
+from repostate import (
+    MERGE_BASE_CACHE_SIZE,
+    RepoState,
+    cached_ahead_behind,
+    git_dir,
+    is_unchanged,
+    load_state,
+    read_ref,
+    read_remote_url,
+    remember_ahead_behind,
+    save_state,
+    take_snapshot,
+    tree_fingerprint,
+)
+
+
+def git(path, *args):
+    return subprocess.run(["git", *args], cwd=path, capture_output=True, text=True, check=True).stdout.strip()
+
+
+def age(path, seconds=60):
+    """Move the mtime of a tree back so its fingerprint is outside of the racy window"""
+    when = time.time() - seconds
+    for directory, names, files in os.walk(path):
+        for name in names + files:
+            os.utime(os.path.join(directory, name), (when, when), follow_symlinks=False)
+    os.utime(path, (when, when))
+
+
+class FingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tree.cleanup)
+        self.path = self.tree.name
+        self.gdir = os.path.join(self.path, ".git")
+
+        os.makedirs(os.path.join(self.path, "src"))
+        os.makedirs(self.gdir)
+        self.write("src/main.py", "print('hello')\n")
+        age(self.path)
+
+    def write(self, name, text):
+        with open(os.path.join(self.path, name), "w") as file:
+            file.write(text)
+
+    def test_fingerprint_is_stable(self):
+        fingerprint = tree_fingerprint(self.path, self.gdir)
+        self.assertTrue(fingerprint)
+        self.assertEqual(tree_fingerprint(self.path, self.gdir), fingerprint)
+
+    def test_recent_changes_are_not_trusted(self):
+        self.write("src/main.py", "print('bye')\n")
+        self.assertEqual(tree_fingerprint(self.path, self.gdir), "")
+
+    def test_editing_a_file_changes_the_fingerprint(self):
+        fingerprint = tree_fingerprint(self.path, self.gdir)
+        self.write("src/main.py", "print('bye')\n")
+        age(self.path, 30)
+        self.assertNotEqual(tree_fingerprint(self.path, self.gdir), fingerprint)
+
+    def test_adding_a_file_changes_the_fingerprint(self):
+        fingerprint = tree_fingerprint(self.path, self.gdir)
+        self.write("src/other.py", "")
+        age(self.path, 30)
+        self.assertNotEqual(tree_fingerprint(self.path, self.gdir), fingerprint)
+
+    def test_the_git_directory_is_not_walked(self):
+        fingerprint = tree_fingerprint(self.path, self.gdir)
+        with open(os.path.join(self.gdir, "ORIG_HEAD"), "w") as file:
+            file.write("0" * 40)
+        age(self.gdir, 30)
+        self.assertEqual(tree_fingerprint(self.path, self.gdir), fingerprint)
+
+    def test_ignored_directories_are_not_walked(self):
+        os.makedirs(os.path.join(self.path, "node_modules", "pkg"))
+        age(self.path)
+        fingerprint = tree_fingerprint(self.path, self.gdir, ["node_modules"])
+
+        self.write("node_modules/pkg/index.js", "")
+        age(os.path.join(self.path, "node_modules"), 30)
+        self.assertEqual(tree_fingerprint(self.path, self.gdir, ["node_modules"]), fingerprint)
+        self.assertNotEqual(tree_fingerprint(self.path, self.gdir), tree_fingerprint(self.path, self.gdir, ["node_modules"]))
+
+    def test_editing_the_exclude_file_changes_the_fingerprint(self):
+        os.makedirs(os.path.join(self.gdir, "info"))
+        fingerprint = tree_fingerprint(self.path, self.gdir)
+        with open(os.path.join(self.gdir, "info", "exclude"), "w") as file:
+            file.write("node_modules/\n")
+        self.assertNotEqual(tree_fingerprint(self.path, self.gdir), fingerprint)
+
+
+class RepoStateTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tree.cleanup)
+        self.path = self.tree.name
+
+        git(self.path, "init", "-q", "-b", "main")
+        git(self.path, "config", "user.name", "test")
+        git(self.path, "config", "user.email", "test@example.com")
+        git(self.path, "remote", "add", "origin", "https://example.com/repo.git")
+        with open(os.path.join(self.path, ".gitignore"), "w") as file:
+            file.write("build/\n")
+        os.makedirs(os.path.join(self.path, "build"))
+        git(self.path, "add", ".gitignore")
+        git(self.path, "commit", "-q", "-m", "first")
+        self.gdir = git_dir(self.path)
+        age(self.path)
+
+    def test_refs_are_read_without_git(self):
+        head = git(self.path, "rev-parse", "HEAD")
+        self.assertEqual(read_ref(self.gdir, "HEAD"), head)
+        self.assertEqual(read_ref(self.gdir, "refs/heads/missing"), "")
+
+        git(self.path, "pack-refs", "--all")
+        self.assertEqual(read_ref(self.gdir, "HEAD"), head)
+
+    def test_remote_url_is_read_without_git(self):
+        self.assertEqual(read_remote_url(self.gdir, "origin"), "https://example.com/repo.git")
+        self.assertEqual(read_remote_url(self.gdir, "upstream"), "")
+
+    def test_worktree_git_file_is_followed(self):
+        worktree = os.path.join(self.path, "build", "wt")
+        git(self.path, "worktree", "add", "-q", worktree)
+        self.assertEqual(read_ref(git_dir(worktree), "HEAD"), read_ref(self.gdir, "HEAD"))
+        self.assertEqual(read_remote_url(git_dir(worktree), "origin"), "https://example.com/repo.git")
+
+    def test_snapshot_lists_ignored_directories(self):
+        state = take_snapshot(self.path, self.gdir, "refs/remotes/origin/main")
+        self.assertEqual(state.ignored, ["build"])
+        self.assertEqual(state.head, git(self.path, "rev-parse", "HEAD"))
+        self.assertTrue(state.fingerprint)
+
+    def test_saved_snapshot_survives_changes_in_ignored_directories(self):
+        save_state(self.gdir, take_snapshot(self.path, self.gdir, "refs/remotes/origin/main"))
+        with open(os.path.join(self.path, "build", "out.o"), "w") as file:
+            file.write("")
+        age(os.path.join(self.path, "build"), 30)
+        self.assertTrue(is_unchanged(self.path, self.gdir, load_state(self.gdir)))
+
+    def test_editing_the_tree_invalidates_the_snapshot(self):
+        save_state(self.gdir, take_snapshot(self.path, self.gdir, "refs/remotes/origin/main"))
+        with open(os.path.join(self.path, "notes.txt"), "w") as file:
+            file.write("")
+        age(self.path, 30)
+        self.assertFalse(is_unchanged(self.path, self.gdir, load_state(self.gdir)))
+
+    def test_moving_head_invalidates_the_snapshot(self):
+        save_state(self.gdir, take_snapshot(self.path, self.gdir, "refs/remotes/origin/main"))
+        git(self.path, "commit", "-q", "--allow-empty", "-m", "second")
+        self.assertFalse(is_unchanged(self.path, self.gdir, load_state(self.gdir)))
+
+    def test_missing_or_broken_state_loads_empty(self):
+        self.assertEqual(load_state(self.gdir), RepoState())
+        with open(os.path.join(self.gdir, "gitsync-state.json"), "w") as file:
+            file.write("{")
+        self.assertEqual(load_state(self.gdir), RepoState())
+        self.assertFalse(is_unchanged(self.path, self.gdir, RepoState()))
+
+
+class MergeBaseCacheTest(unittest.TestCase):
+    def test_same_commits_need_no_cache(self):
+        self.assertEqual(cached_ahead_behind(RepoState(), "a", "a"), ("a", 0, 0))
+
+    def test_only_the_most_recent_pairs_are_kept(self):
+        state = RepoState()
+        for i in range(MERGE_BASE_CACHE_SIZE + 1):
+            remember_ahead_behind(state, f"local{i}", "remote", "base", i, 1)
+
+        self.assertIsNone(cached_ahead_behind(state, "local0", "remote"))
+        self.assertEqual(cached_ahead_behind(state, "local1", "remote"), ("base", 1, 1))
+        self.assertEqual(len(state.merge_bases), MERGE_BASE_CACHE_SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import tempfile
+import unittest
+
+from syncqueue import SyncQueue
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+
+    def test_resume_with_other_repositories_drops_the_old_jobs(self):
+        queue = SyncQueue(self.state_dir.name)
+        queue.start(["/a", "/b", "/c"])
+        self.assertEqual(queue.take(block=False), "/a")
+        queue.close()  # Interrupted, /a running and /b, /c pending
+
+        queue = SyncQueue(self.state_dir.name)
+        self.assertEqual(queue.start(["/x", "/y"]), ["/x", "/y"])
+        taken = []
+        while (path := queue.take(block=False)) is not None:
+            taken.append(path)
+        queue.close()
+
+        self.assertEqual(taken, ["/x", "/y"])
+
+    def test_resume_with_the_same_repositories_keeps_the_unfinished_jobs(self):
+        queue = SyncQueue(self.state_dir.name)
+        queue.start(["/a", "/b", "/c"])
+        self.assertEqual(queue.take(block=False), "/a")
+        queue.close()
+
+        queue = SyncQueue(self.state_dir.name)
+        self.assertEqual(queue.start(["/a", "/b", "/c"]), ["/a", "/b", "/c"])
+        queue.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,266 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from repostate import git_dir, read_ref, load_state, is_unchanged, ignored_directories
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+)
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# A repository is synced once it has been quiet for the debounce delay, but
+# never later than this many debounce delays after its first unsynced event
+MAX_DEBOUNCE_FACTOR = 10
+
+
+class Inotify:
+    """Recursive inotify watches over several working trees, through ctypes
+
+    Every directory of a working tree except `.git` and the ignored
+    directories gets a watch, directories created later are added as their
+    creation events arrive.
+
+    Raises:
+        OSError: If inotify is not available on this system.
+    """
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+
+        self._watches = {}  # watch descriptor -> (repository, directory)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def add_tree(self, repo: str) -> None:
+        """Watch every directory of a working tree
+
+        Args:
+            repo: Path to the working tree.
+
+        Raises:
+            OSError: If the kernel refuses more watches (see fs.inotify.max_user_watches).
+        """
+        self._add(repo, repo, ignored_directories(repo))
+
+    def _add(self, repo: str, top: str, ignored: set[str]) -> None:
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    continue  # Deleted or unreadable before it could be watched
+                raise OSError(code, f"{os.strerror(code)}: {directory}")
+            self._watches[wd] = (repo, directory)
+
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False) and entry.name != ".git" and entry.path not in ignored:
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+    def read(self, timeout: float) -> set[str]:
+        """Wait for events and return the repositories they belong to
+
+        Args:
+            timeout: Seconds to wait for the first event.
+
+        Returns:
+            set: Paths of the repositories that changed, every watched repository if the kernel queue overflowed.
+        """
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not readable:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(repo for repo, _ in self._watches.values())
+                    continue
+
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+
+                if wd not in self._watches:
+                    continue
+                repo, directory = self._watches[wd]
+                changed.add(repo)
+
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and name != b".git":
+                    self._add(repo, os.path.join(directory, os.fsdecode(name)), set())
+
+
+def needs_sync(path: str) -> bool:
+    """Cheaply check if a repository changed outside of its working tree
+
+    HEAD is read from the ref files and the remote branch is asked for with
+    `git ls-remote`, neither walks the working tree.
+
+    Args:
+        path: Path to the working tree.
+
+    Returns:
+        bool: True if HEAD moved, the remote branch moved, or the repository was never synced.
+    """
+    gdir = git_dir(path)
+    state = load_state(gdir)
+    if not state.remote_ref or read_ref(gdir, "HEAD") != state.head:
+        return True
+
+    # "refs/remotes/origin/main" -> remote "origin", branch "refs/heads/main"
+    remote, _, branch = state.remote_ref.removeprefix("refs/remotes/").partition("/")
+    output = subprocess.run(
+        ["git", "ls-remote", remote, f"refs/heads/{branch}"],
+        cwd=path,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, GIT_TERMINAL_PROMPT="0"),
+    ).stdout
+
+    return output.partition("\t")[0] != read_ref(gdir, state.remote_ref)
+
+
+def watch(
+    repo_paths: list[str], sync, jobs: int = 4, debounce: float = 2.0, probe_interval: float = 60.0, log=print
+) -> None:
+    """Synchronize repositories whenever their working tree or remote branch changes
+
+    All repositories are synced once at startup. After that a repository is
+    only synced when inotify reports a change in its working tree (once the
+    burst of writes has been quiet for `debounce` seconds), or when the
+    periodic `needs_sync` probe sees that HEAD or the remote branch moved.
+    Without inotify, or when the kernel refuses more watches, the working
+    tree fingerprint of `repostate` is compared at every probe instead.
+    Runs until interrupted.
+
+    Args:
+        repo_paths: Paths to the working trees.
+        sync: Function called with a repository path to synchronize it.
+        jobs: Maximum number of repositories synchronized at once.
+        debounce: Seconds without events before a changed repository is synced.
+        probe_interval: Seconds between two probes of every repository.
+        log: Function used to print the progress messages.
+    """
+    repo_paths = [os.path.abspath(path) for path in repo_paths]
+    polled = set(repo_paths)
+
+    try:
+        inotify = Inotify()
+    except OSError as e:
+        log(f"Cannot use inotify ({e}), polling every {probe_interval:.0f}s instead")
+        inotify = None
+
+    if inotify:
+        for path in repo_paths:
+            try:
+                inotify.add_tree(path)
+                polled.discard(path)
+            except OSError as e:
+                log(f"Cannot watch {path} ({e}), polling it every {probe_interval:.0f}s instead")
+
+    now = time.monotonic()
+    dirty = {path: [now, now] for path in repo_paths}  # path -> [first event, last event]
+    running = {}  # path -> Future
+    next_probe = now + probe_interval
+    max_delay = debounce * MAX_DEBOUNCE_FACTOR
+
+    def probe_and_sync(path: str) -> None:
+        gdir = git_dir(path)
+        if needs_sync(path) or (path in polled and not is_unchanged(path, gdir, load_state(gdir))):
+            sync(path)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        try:
+            while True:
+                now = time.monotonic()
+                # A repository that changed while it is syncing waits for the end of that sync,
+                # its past deadline would turn the wait into a busy loop
+                deadlines = [next_probe] + [
+                    min(last + debounce, first + max_delay)
+                    for path, (first, last) in dirty.items()
+                    if path not in running
+                ]
+                # Wake up at least every second to collect finished syncs
+                timeout = min(min(deadlines) - now, 1.0)
+
+                if inotify:
+                    changed = inotify.read(timeout)
+                else:
+                    time.sleep(max(timeout, 0))
+                    changed = set()
+
+                now = time.monotonic()
+                for path in changed:
+                    dirty.setdefault(path, [now, now])[1] = now
+
+                for path in [path for path, future in running.items() if future.done()]:
+                    error = running.pop(path).exception()
+                    if error:
+                        log(f"Synchronization of {path} failed: {error}")
+
+                for path, (first, last) in list(dirty.items()):
+                    if path not in running and (now - last >= debounce or now - first >= max_delay):
+                        del dirty[path]
+                        running[path] = pool.submit(sync, path)
+
+                if now >= next_probe:
+                    next_probe = now + probe_interval
+                    for path in repo_paths:
+                        if path not in running and path not in dirty:
+                            running[path] = pool.submit(probe_and_sync, path)
+
+        except KeyboardInterrupt:
+            log("Stopping, waiting for the running synchronizations to finish")
+            for future in running.values():
+                future.cancel()
+
+        finally:
+            if inotify:
+                inotify.close()